@@ -1,84 +1,95 @@
 import os
-from datetime import date
-from trino.dbapi import connect
-from hdfs_client import WebHDFSClient 
-RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-TRINO_HOST = os.getenv("TRINO_HOST",'trino')
-TRINO_PORT = int(os.getenv("TRINO_PORT", 8080))
-TRINO_USER = os.getenv("TRINO_USER", "admin")
-TRINO_CATALOG = os.getenv("TRINO_CATALOG", "hive")
-TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
-
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
-
-def main(guard=None):
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
-    conn = connect(
-        host=TRINO_HOST,
-        port=TRINO_PORT,
-        user=TRINO_USER,
-        catalog=TRINO_CATALOG,
-        schema=TRINO_SCHEMA
-    )    
-    cur = conn.cursor()
-
-    # ---  FIX: CREATE SCHEMAS FIRST (Lignes de ton ami) ---
-    print("Checking schemas...")
-    cur.execute("CREATE SCHEMA IF NOT EXISTS hive.default")
-    cur.execute("CREATE SCHEMA IF NOT EXISTS hive.processed")
+from trino_utils import stage_session, iter_arrow_batches
+import arrow_engine
+from engines import resolve_engine
+from run_context import RunContext
+import hive_tables
+import compaction
+import procurement_rules
+from data_quality import DEFAULT_MAX_QTY
+
+# Requête de l'étape 1 (réutilisée telle quelle par fused_pipeline.py) ; {raw_orders} = partition du jour
+AGG_SELECT = """
+    SELECT sku, sum(quantity) as total_quantity 
+    FROM {raw_orders} 
+    GROUP BY sku
+"""
+
+
+# Contrôle MxOQ côté Trino : seules les lignes en infraction (SKU inconnu ou quantité > MxOQ,
+# même limite que DataQualityGuard.product_limits) reviennent au client
+MAGNITUDE_SELECT = """
+    SELECT ao.sku, ao.total_quantity
+    FROM {aggregated} ao
+    LEFT JOIN {rules} r ON ao.sku = r.sku
+    WHERE r.sku IS NULL
+       OR ao.total_quantity > IF(COALESCE(r.mxoq, 0) > 0, r.mxoq, {default_max_qty})
+"""
+
+
+def agg_select(ctx) -> str:
+    return AGG_SELECT.format(raw_orders=hive_tables.RAW_ORDERS.partition(ctx.run_date))
+
+
+def check_order_magnitude(cur, guard, ctx, aggregated):
+    """check_order_magnitude_batch on the violating rows only of `aggregated` (table or subquery)."""
+    query = MAGNITUDE_SELECT.format(aggregated=aggregated, rules=procurement_rules.partition(),
+                                    default_max_qty=DEFAULT_MAX_QTY)
+    for batch in iter_arrow_batches(cur, query):
+        guard.check_order_magnitude_batch(f"AGG-{ctx.run_date}", batch["sku"], batch["total_quantity"])
+
+
+def register_raw_orders(cur, ctx, hdfs):
+    """Partition run_date de hive.raw_orders.orders sur les fichiers AVRO générés par generate_daily_files.py"""
+    # Partition compactée : enregistrée sur son dossier de parts (_v{n}) et non sur {date}
+    location = compaction.data_location(hdfs, compaction.RAW_ORDERS, ctx.run_date)
+    hive_tables.register_partition(cur, hive_tables.RAW_ORDERS, ctx.run_date, location)
 
 
+def main_arrow(ctx, hdfs, guard=None):
+    """Same aggregation as the Trino INSERT, computed in-process from the local RAW Avro files."""
+    local_raw_dir = os.path.join(ctx.data_root, "raw/orders", ctx.run_date)
+    hdfs_target_dir = hive_tables.AGGREGATED_ORDERS.location(ctx.run_date)
+
+    print(f"Étape 1 (arrow) : Agrégation des fichiers Avro de {local_raw_dir}")
+    orders = arrow_engine.read_avro_dir(local_raw_dir, arrow_engine.ORDERS_SCHEMA)
+    aggregated = arrow_engine.aggregate_orders(orders)
+    local_path = arrow_engine.write_output(aggregated, ctx.data_root, hdfs_target_dir, "aggregated_orders.parquet", hdfs)
+    print(f"  {orders.num_rows} lignes -> {aggregated.num_rows} SKUs ({local_path})")
+
+    if guard:
+        guard.check_order_magnitude_batch(f"AGG-{ctx.run_date}", aggregated["sku"], aggregated["total_quantity"])
+    return aggregated
+
+
+def main_trino(ctx, trino, cur, hdfs, guard=None, prepared=False):
+    """Aggregation as a Trino INSERT (RAW Avro partition -> aggregated_orders Parquet partition)."""
     # On définit le chemin EXACT où ton autre fichier a écrit les données
     # C'est ici que tu fais le lien avec generate_daily_files.py
-    hdfs_raw_path = f"/raw/orders/{RUN_DATE}/"
-    hdfs_target_dir = f"/processed/aggregated_orders/{RUN_DATE}"
-    table_agg = f"hive.processed.aggregated_orders_{RUN_DATE.replace('-', '_')}"
-
-    # 1. On crée une table de passage pour lire l'AVRO que tu viens de générer
-    # On l'appelle 'temp_raw_orders'
-    cur.execute("DROP TABLE IF EXISTS hive.default.temp_raw_orders")
-    
-    setup_raw_query = f"""
-    CREATE TABLE  hive.default.temp_raw_orders (
-        market_id VARCHAR,
-        sku VARCHAR,
-        quantity BIGINT,
-        timestamp VARCHAR
-    )
-    WITH (
-        format = 'AVRO',
-        external_location = '{hdfs_raw_path}'
-    )
-    """
-    cur.execute(setup_raw_query)
-
-    print(f"Cleaning up target directory: {hdfs_target_dir}")
-    hdfs.delete(hdfs_target_dir, recursive=True)
-
-    # 2. Maintenant on fait l'agrégation vers le PARQUET
-    cur.execute(f"DROP TABLE IF EXISTS {table_agg}")
-    
-    query_agg = f"""
-    CREATE TABLE {table_agg}
-    WITH (
-        format = 'PARQUET', 
-        external_location = '/processed/aggregated_orders/{RUN_DATE}/'
-    )
-    AS 
-    SELECT sku, sum(quantity) as total_quantity 
-    FROM hive.default.temp_raw_orders 
-    GROUP BY sku
-    """
-    print(f"Étape 1 : Agrégation des fichiers Avro de {hdfs_raw_path} vers {table_agg}")
-    cur.execute(query_agg)
+    hdfs_raw_path = hive_tables.RAW_ORDERS.location(ctx.run_date)
+    table_agg = hive_tables.AGGREGATED_ORDERS
+
+    # 1. On enregistre la partition du jour sur l'AVRO que tu viens de générer
+    register_raw_orders(cur, ctx, hdfs)
+
+    # 2. Maintenant on réécrit la partition du jour en PARQUET
+    print(f"Étape 1 : Agrégation des fichiers Avro de {hdfs_raw_path} vers {table_agg.name}")
+    hive_tables.overwrite_partition(cur, hdfs, table_agg, ctx.run_date, agg_select(ctx))
 
-    # 3. VÉRIFICATION DATA QUALITY
+    # 3. VÉRIFICATION DATA QUALITY : seules les lignes en violation sortent de Trino
+    # (prepared : règles d'achat déjà enregistrées par le DAG de l'orchestrateur)
     if guard:
-        cur.execute(f"SELECT sku, total_quantity FROM {table_agg}")
-        aggregated_results = cur.fetchall()
-        for sku, qty in aggregated_results:
-            guard.check_order_magnitude(order_id=f"AGG-{RUN_DATE}", sku=sku, quantity=qty)
+        if not prepared:
+            procurement_rules.publish(hdfs, ctx.data_root, cur)
+        check_order_magnitude(cur, guard, ctx, table_agg.partition(ctx.run_date))
+
+
+def main(guard=None, engine=None, session=None, ctx=None, prepared=False):
+    ctx = ctx or RunContext.from_env()
+    hdfs = ctx.hdfs()
+    if resolve_engine(engine) == "arrow":
+        return main_arrow(ctx, hdfs, guard)
 
-    cur.close()
-    conn.close()
\ No newline at end of file
+    # Session Trino du run (ou privée si l'étape est lancée seule) : schémas créés une seule fois
+    with stage_session(session) as trino, trino.cursor("aggregation") as cur:
+        return main_trino(ctx, trino, cur, hdfs, guard, prepared)
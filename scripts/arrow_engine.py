@@ -0,0 +1,167 @@
+import os
+import glob
+
+import fastavro
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from tracing import span
+
+# In-process PyArrow/NumPy implementation of the three batch stages.
+# It reads the local RAW copies written by generate_daily_files.py and the
+# compiled procurement rules (procurement_rules.py), and produces the same Parquet layout as the Trino INSERTs.
+
+ORDERS_SCHEMA = pa.schema([
+    ("market_id", pa.string()),
+    ("sku", pa.string()),
+    ("quantity", pa.int64()),
+    ("timestamp", pa.string()),
+])
+
+STOCK_SCHEMA = pa.schema([
+    ("run_date", pa.string()),
+    ("sku", pa.string()),
+    ("quantity_available", pa.int64()),
+    ("quantity_reserved", pa.int64()),
+    ("safety_quantity", pa.int64()),
+    ("location", pa.string()),
+])
+
+# Input of procurement_rules.compile_rules (products master data columns used by the stages)
+PRODUCTS_SCHEMA = pa.schema([
+    ("sku", pa.string()),
+    ("supplier_id", pa.string()),
+    ("moq", pa.int64()),
+    ("package", pa.string()),
+])
+
+
+# --------------------------------------------------
+# READERS
+# --------------------------------------------------
+def read_avro_file(path: str, schema: pa.Schema) -> pa.Table:
+    with open(path, "rb") as f:
+        records = list(fastavro.reader(f))
+    return pa.Table.from_pylist(records, schema=schema)
+
+
+def read_avro_dir(local_dir: str, schema: pa.Schema) -> pa.Table:
+    """Reads every .avro file of a directory (like a Trino external_location)."""
+    files = sorted(glob.glob(os.path.join(local_dir, "*.avro")))
+    if not files:
+        return schema.empty_table()
+    with span("arrow.read_avro", kind="arrow", files=len(files)) as s:
+        table = pa.concat_tables([read_avro_file(p, schema) for p in files])
+        s.set(rows=table.num_rows, bytes=sum(os.path.getsize(p) for p in files))
+        return table
+
+
+def read_output(data_root: str, hdfs_dir: str) -> pa.Table:
+    """Reads back a stage output written by write_output (local mirror of hdfs_dir)."""
+    return pq.read_table(os.path.join(data_root, hdfs_dir.strip("/")))
+
+
+def rows_to_batch(names, types, rows) -> pa.RecordBatch:
+    """
+    DB-API rows (tuples) -> RecordBatch. `types` holds one Arrow type or None (inferred) per
+    column and is updated in place: a column's type is fixed by its first non-null batch.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = []
+    for i, values in enumerate(columns):
+        arr = pa.array(values, type=types[i])
+        if types[i] is None and arr.type != pa.null():
+            if pa.types.is_decimal(arr.type):
+                # NUMERIC / DECIMAL : max precision, later batches may hold longer values
+                arr = arr.cast(pa.decimal128(38, arr.type.scale))
+            types[i] = arr.type
+        arrays.append(arr)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def concat_batches(batches) -> pa.Table:
+    """One table from batches whose first ones may have all-NULL (untyped) columns."""
+    return pa.concat_tables([pa.Table.from_batches([b]) for b in batches], promote_options="permissive")
+
+
+def iter_rows(table, columns):
+    """Row tuples of `columns` (Table or RecordBatch), converted to Python one batch at a time."""
+    data = table.select(columns)
+    for batch in data.to_batches() if isinstance(data, pa.Table) else [data]:
+        yield from zip(*(col.to_pylist() for col in batch.columns))
+
+
+# --------------------------------------------------
+# STAGES (same semantics as the Trino SQL)
+# --------------------------------------------------
+def aggregate_orders(orders: pa.Table) -> pa.Table:
+    """SELECT sku, sum(quantity) AS total_quantity FROM hive.raw_orders.orders WHERE run_date = ... GROUP BY sku"""
+    agg = orders.group_by("sku").aggregate([("quantity", "sum")])
+    result = pa.table({
+        "sku": agg["sku"],
+        "total_quantity": agg["quantity_sum"].cast(pa.int64()),
+    })
+    return result.sort_by("sku")
+
+
+def net_demand(aggregated: pa.Table, stock: pa.Table, run_date: str) -> pa.Table:
+    """total_quantity + safety_quantity - (available - reserved), inner join on sku."""
+    joined = aggregated.join(
+        stock.select(["sku", "quantity_available", "quantity_reserved", "safety_quantity"]),
+        keys="sku",
+        join_type="inner",
+    )
+    free_stock = pc.subtract(joined["quantity_available"], joined["quantity_reserved"])
+    demand = pc.subtract(pc.add(joined["total_quantity"], joined["safety_quantity"]), free_stock)
+    result = pa.table({
+        "run_date": pa.array([run_date] * joined.num_rows, pa.string()),
+        "sku": joined["sku"],
+        "net_demand": demand.cast(pa.int64()),
+    })
+    return result.sort_by("sku")
+
+
+def supplier_orders(demand: pa.Table, rules: pa.Table, run_date: str) -> pa.Table:
+    """CEILING(GREATEST(net_demand, moq) / pack_size) * pack_size for net_demand > 0 (compiled rules)."""
+    positive = demand.filter(pc.fill_null(pc.greater(demand["net_demand"], 0), False))
+    joined = positive.select(["sku", "net_demand"]).join(
+        rules.select(["sku", "supplier_id", "moq", "pack_size"]),
+        keys="sku",
+        join_type="inner",
+    )
+
+    needed = joined["net_demand"].to_numpy().astype(np.int64)
+    moq = joined["moq"].to_numpy().astype(np.int64)
+    pack = joined["pack_size"].to_numpy().astype(np.int64)
+    quantity = np.ceil(np.maximum(needed, moq).astype(np.float64) / pack) * pack
+
+    result = pa.table({
+        "run_date": pa.array([run_date] * joined.num_rows, pa.string()),
+        "supplier_id": joined["supplier_id"],
+        "sku": joined["sku"],
+        "quantity": pa.array(quantity.astype(np.int32), pa.int32()),
+    })
+    return result.sort_by([("supplier_id", "ascending"), ("sku", "ascending")])
+
+
+# --------------------------------------------------
+# OUTPUT
+# --------------------------------------------------
+def write_output(table: pa.Table, data_root: str, hdfs_dir: str, filename: str, hdfs=None) -> str:
+    """
+    Writes the Parquet locally under DATA_ROOT + hdfs_dir and (optionally)
+    replaces the HDFS directory with it, like the Trino INSERT into the partition directory.
+    """
+    local_dir = os.path.join(data_root, hdfs_dir.strip("/"))
+    os.makedirs(local_dir, exist_ok=True)
+    local_path = os.path.join(local_dir, filename)
+    with span("arrow.write_parquet", kind="arrow", path=hdfs_dir, rows=table.num_rows) as s:
+        pq.write_table(table, local_path)
+        s.set(bytes=os.path.getsize(local_path))
+
+    if hdfs is not None:
+        hdfs.delete(hdfs_dir, recursive=True)
+        hdfs.mkdirs(hdfs_dir)
+        hdfs.put_file(local_path, f"{hdfs_dir}/{filename}", overwrite=True)
+    return local_path
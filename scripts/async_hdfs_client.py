@@ -0,0 +1,235 @@
+import os
+import asyncio
+import hashlib
+import aiohttp
+from urllib.parse import quote
+from hdfs_client import RETRY_STATUSES, HDFS_RETRIES, HDFS_BACKOFF, DIGEST_XATTR, webhdfs_url
+from storage import TransferResult, FileStatus, sha256_file, sha256_stream
+from tracing import span, current
+
+# asyncio WebHDFS client for high fan-out ingestion (thousands of small files in flight
+# from one process). Same operations as hdfs_client.WebHDFSClient.
+HDFS_ASYNC = os.getenv("HDFS_ASYNC", "0") == "1"
+HDFS_ASYNC_LIMIT = int(os.getenv("HDFS_ASYNC_LIMIT", "256"))             # connections in total
+HDFS_ASYNC_PER_HOST = int(os.getenv("HDFS_ASYNC_PER_HOST", "32"))        # per namenode / datanode
+HDFS_ASYNC_MAX_INFLIGHT = int(os.getenv("HDFS_ASYNC_MAX_INFLIGHT", "1024"))  # transfers started at once
+
+
+async def iter_in_thread(make_iterable):
+    """
+    Items of make_iterable() produced in a worker thread, one at a time (asyncio.to_thread):
+    the encoding of a stream (fastavro, JSON...) never runs on the event loop.
+    """
+    done = object()
+    iterator = await asyncio.to_thread(lambda: iter(make_iterable()))
+    while (item := await asyncio.to_thread(next, iterator, done)) is not done:
+        yield item
+
+
+class RetryableStatus(Exception):
+    """5xx answer: the operation is retried."""
+
+
+class AsyncWebHDFSClient:
+    """
+    Usage:
+        async with AsyncWebHDFSClient(HDFS_BASE_URL, user=HDFS_USER) as hdfs:
+            results = await hdfs.put_many([(local, remote), ...])
+    """
+
+    def __init__(self, base_url: str, user: str = "root", limit: int = HDFS_ASYNC_LIMIT,
+                 limit_per_host: int = HDFS_ASYNC_PER_HOST, retries: int = HDFS_RETRIES,
+                 backoff: float = HDFS_BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.user = user
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+
+    async def __aenter__(self):
+        # limit_per_host caps the concurrent connections to the namenode AND to each datanode
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _url(self, hdfs_path: str, op: str, extra: str = "") -> str:
+        return webhdfs_url(self.base_url, self.user, hdfs_path, op, extra)
+
+    async def _call(self, fn):
+        for attempt in range(self.retries + 1):
+            try:
+                return await fn()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatus):
+                if attempt == self.retries:
+                    raise
+                current().add(retries=1)
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def _check(resp, method, url, ok=(200,)):
+        if resp.status in RETRY_STATUSES:
+            raise RetryableStatus(f"{resp.status} for {method} {url}")
+        if resp.status not in ok:
+            resp.raise_for_status()
+
+    async def _simple(self, method, url, ok=(200,), json_body=False):
+        """One request; returns (status, json or None)."""
+        async def _do():
+            async with self.session.request(method, url) as resp:
+                self._check(resp, method, url, ok=ok)
+                return resp.status, (await resp.json(content_type=None) if json_body and resp.status == 200 else None)
+        return await self._call(_do)
+
+    # --- operations ---
+    async def mkdirs(self, hdfs_dir: str) -> None:
+        with span("hdfs.mkdirs", kind="hdfs", path=hdfs_dir):
+            await self._simple("PUT", self._url(hdfs_dir, "MKDIRS"))
+
+    async def exists(self, hdfs_path: str) -> bool:
+        status, _ = await self._simple("GET", self._url(hdfs_path, "GETFILESTATUS"), ok=(200, 404))
+        return status == 200
+
+    async def list_status(self, hdfs_dir: str) -> list:
+        """LISTSTATUS: list of FileStatus (same type as WebHDFSClient.list_status); [] if missing."""
+        status, body = await self._simple("GET", self._url(hdfs_dir, "LISTSTATUS"), ok=(200, 404), json_body=True)
+        if status != 200:
+            return []
+        return [FileStatus.from_json(hdfs_dir, st) for st in body["FileStatuses"]["FileStatus"]]
+
+    async def digest(self, hdfs_path: str):
+        """sha256 recorded by the last complete upload (DIGEST_XATTR), None if missing."""
+        status, body = await self._simple("GET", self._url(hdfs_path, "GETXATTRS", "encoding=text"), ok=(200, 404),
+                                          json_body=True)
+        if status != 200:
+            return None
+        xattrs = {x["name"]: (x.get("value") or "").strip('"') for x in body.get("XAttrs", [])}
+        return xattrs.get(DIGEST_XATTR)
+
+    async def set_xattr(self, hdfs_path: str, name: str, value: str, flag: str = "CREATE") -> None:
+        text = '"' + value + '"'
+        await self._simple("PUT", self._url(hdfs_path, "SETXATTR",
+                                            f"xattr.name={quote(name)}&xattr.value={quote(text)}&flag={flag}"))
+
+    async def delete(self, hdfs_path: str, recursive: bool = False) -> bool:
+        extra = f"recursive={'true' if recursive else 'false'}"
+        status, _ = await self._simple("DELETE", self._url(hdfs_path, "DELETE", extra), ok=(200, 404))
+        return status == 200
+
+    async def put_bytes(self, data, hdfs_path: str, overwrite: bool = False) -> None:
+        """CREATE (307 from the namenode) then PUT of the body to the datanode. data: bytes or a callable returning it."""
+        url = self._url(hdfs_path, "CREATE", f"overwrite={'true' if overwrite else 'false'}")
+
+        async def _do():
+            async with self.session.put(url, allow_redirects=False) as r1:
+                self._check(r1, "PUT", url, ok=(307, 201))
+                redirect = r1.headers.get("Location")
+            if not redirect:
+                return
+            body = data() if callable(data) else data
+            async with self.session.put(redirect, data=body) as r2:
+                self._check(r2, "PUT", redirect, ok=(200, 201))
+        await self._call(_do)
+
+    async def put_file(self, local_path: str, hdfs_path: str, overwrite: bool = False) -> None:
+        # The file is re-opened at every attempt (aiohttp reads it in an executor)
+        with span("hdfs.put_file", kind="hdfs", path=hdfs_path, bytes=os.path.getsize(local_path)):
+            await self.put_bytes(lambda: open(local_path, "rb"), hdfs_path, overwrite=overwrite)
+
+    async def put_stream(self, chunks, hdfs_path: str, overwrite: bool = False) -> str:
+        """
+        chunks = callable returning an iterable of bytes (re-called on retry); sent chunked.
+        The chunks are produced in a worker thread so other uploads keep going meanwhile.
+        Returns the sha256 of the bytes sent.
+        """
+        with span("hdfs.put_stream", kind="hdfs", path=hdfs_path) as s:
+            sent = {}
+
+            async def _body():
+                s.set(bytes=0)  # counted again if the upload is retried
+                sent["sha256"] = hashlib.sha256()
+                async for chunk in iter_in_thread(chunks):
+                    sent["sha256"].update(chunk)
+                    s.add(bytes=len(chunk))
+                    yield chunk
+            await self.put_bytes(_body, hdfs_path, overwrite=overwrite)
+        return sent["sha256"].hexdigest()
+
+    async def get_file(self, hdfs_path: str, local_path: str) -> None:
+        url = self._url(hdfs_path, "OPEN")
+
+        with span("hdfs.get_file", kind="hdfs", path=hdfs_path) as s:
+            async def _do():
+                async with self.session.get(url) as resp:  # redirect to the datanode is followed
+                    self._check(resp, "GET", url)
+                    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+                    s.set(bytes=0)
+                    with open(local_path, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(1024 * 1024):
+                            f.write(chunk)
+                            s.add(bytes=len(chunk))
+            await self._call(_do)
+
+    # --- bulk ---
+    async def _bounded_gather(self, name, coros_args, fn):
+        semaphore = asyncio.Semaphore(HDFS_ASYNC_MAX_INFLIGHT)
+
+        async def _guarded(args):
+            async with semaphore:
+                return await fn(*args)
+        # gather() copies the context into each task: the transfers are children of this span
+        with span(name, kind="hdfs", files=len(coros_args)):
+            return await asyncio.gather(*(_guarded(a) for a in coros_args))
+
+    async def put_many(self, transfers, overwrite: bool = False, skip_existing: bool = False,
+                       skip_identical: bool = False) -> list:
+        """transfers = iterable of (local_path, hdfs_path); one TransferResult per file, input order."""
+        async def _one(local_path, hdfs_path):
+            try:
+                if skip_existing and await self.exists(hdfs_path):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                digest = await asyncio.to_thread(sha256_file, local_path) if skip_identical else None
+                if digest is not None and await self.digest(hdfs_path) == digest:
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                await self.put_file(local_path, hdfs_path, overwrite=overwrite)
+                if digest is not None:
+                    await self.set_xattr(hdfs_path, DIGEST_XATTR, digest)
+                return TransferResult(local_path, hdfs_path, "uploaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e) or type(e).__name__)
+        return await self._bounded_gather("hdfs.async_put_many", list(transfers), _one)
+
+    async def put_stream_many(self, streams, overwrite: bool = False, skip_existing: bool = False,
+                              skip_identical: bool = False) -> list:
+        """streams = iterable of (chunks, hdfs_path); one TransferResult per file, input order."""
+        async def _one(chunks, hdfs_path):
+            local_path = getattr(chunks, "local_path", None)
+            try:
+                if skip_existing and await self.exists(hdfs_path):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                # Hashed first only when there is a digest to compare with, otherwise while it is sent
+                remote = await self.digest(hdfs_path) if skip_identical else None
+                digest = await asyncio.to_thread(sha256_stream, chunks) if remote is not None else None
+                if digest is not None and digest == remote:
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                sent = await self.put_stream(chunks, hdfs_path, overwrite=overwrite)
+                if skip_identical:
+                    await self.set_xattr(hdfs_path, DIGEST_XATTR, digest or sent)
+                return TransferResult(local_path, hdfs_path, "uploaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e) or type(e).__name__)
+        return await self._bounded_gather("hdfs.async_put_stream_many", list(streams), _one)
+
+    async def get_many(self, transfers) -> list:
+        """transfers = iterable of (hdfs_path, local_path); one TransferResult per file, input order."""
+        async def _one(hdfs_path, local_path):
+            try:
+                await self.get_file(hdfs_path, local_path)
+                return TransferResult(local_path, hdfs_path, "downloaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e) or type(e).__name__)
+        return await self._bounded_gather("hdfs.async_get_many", list(transfers), _one)
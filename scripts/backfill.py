@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+import master_data
+import run_pipeline_hdfs
+from run_context import RunContext, date_range
+
+# Backfill : rejoue run_pipeline_hdfs sur une plage de dates, plusieurs dates en parallèle.
+#   python scripts/backfill.py --start 2026-01-01 --end 2026-01-31 --workers 4
+# Chaque date a son propre RunContext (chemins, partitions run_date des tables Trino),
+# son garde, son cache d'étapes, sa session Trino et sa trace JSON. Le master data est lu une
+# seule fois pour toute la plage. Le fichier pipeline.prom n'est pas réécrit par date.
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "2"))
+
+
+def run_one(run_date, cache_mode=None, metrics=False):
+    """Une date du backfill -> (run_date, succès, secondes, erreur)."""
+    start = time.perf_counter()
+    try:
+        ok = run_pipeline_hdfs.run(RunContext.from_env(run_date), cache_mode, metrics=metrics)
+        return run_date, ok, time.perf_counter() - start, None
+    except Exception as e:  # ex. Postgres indisponible à l'init du garde : les autres dates continuent
+        return run_date, False, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def backfill(dates, workers=None, cache_mode=None, metrics=False):
+    """
+    Lance les dates sur un pool de `workers` threads ; résultats dans l'ordre des dates.
+    metrics=True : chaque run réécrit pipeline.prom (à réserver à une seule date à la fois).
+    """
+    workers = max(1, min(workers or BACKFILL_WORKERS, len(dates)))
+    tracing.reset()
+    master_data.reset()
+    print(f"--- Backfill {dates[0]} -> {dates[-1]} : {len(dates)} date(s) on {workers} worker(s) ---")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+        return list(pool.map(lambda d: run_one(d, cache_mode, metrics), dates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill du pipeline sur une plage de dates")
+    parser.add_argument("--start", required=True, help="première date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="dernière date incluse (défaut : --start)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="dates exécutées en même temps")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", dest="cache_mode", action="store_const", const="resume")
+    group.add_argument("--no-cache", dest="cache_mode", action="store_const", const="off")
+    args = parser.parse_args()
+
+    results = backfill(date_range(args.start, args.end or args.start), args.workers, args.cache_mode)
+
+    print("\n--- Backfill summary ---")
+    for run_date, ok, seconds, error in results:
+        print(f"  {run_date}  {'OK    ' if ok else 'FAILED'}  {seconds:8.2f}s{'  ' + error if error else ''}")
+    failed = [r[0] for r in results if not r[1]]
+    print(f" {len(results) - len(failed)}/{len(results)} date(s) succeeded" +
+          (f", failed: {', '.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import date
+
+import arrow_engine
+
+# Benchmark "staged" vs "fused" (wall time + bytes written).
+#   --engine arrow : in-process, on the local RAW files of RUN_DATE (no cluster needed)
+#   --engine trino : runs the real stage modules against Trino/HDFS and measures the
+#                    bytes of the output directories with GETCONTENTSUMMARY
+
+RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+
+OUTPUT_DIRS = [
+    "/processed/aggregated_orders/{run_date}",
+    "/processed/net_demand/{run_date}",
+    "/output/supplier_orders/{run_date}",
+]
+
+
+def _dir_bytes(root):
+    total = 0
+    for dirpath, _, files in os.walk(root):
+        total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in files)
+    return total
+
+
+def run_arrow(mode, orders, stock, rules, run_date, materialize):
+    """One run of the in-process plan; returns bytes written under a scratch output root."""
+    out_root = tempfile.mkdtemp(prefix=f"bench_{mode}_")
+    try:
+        agg_dir, nd_dir, so_dir = (d.format(run_date=run_date) for d in OUTPUT_DIRS)
+        if mode == "staged":
+            arrow_engine.write_output(arrow_engine.aggregate_orders(orders), out_root, agg_dir, "aggregated_orders.parquet")
+            aggregated = arrow_engine.read_output(out_root, agg_dir)
+            arrow_engine.write_output(arrow_engine.net_demand(aggregated, stock, run_date), out_root, nd_dir, "net_demand.parquet")
+            demand = arrow_engine.read_output(out_root, nd_dir)
+            arrow_engine.write_output(arrow_engine.supplier_orders(demand, rules, run_date), out_root, so_dir, "supplier_orders.parquet")
+        else:
+            aggregated = arrow_engine.aggregate_orders(orders)
+            demand = arrow_engine.net_demand(aggregated, stock, run_date)
+            if materialize:
+                arrow_engine.write_output(aggregated, out_root, agg_dir, "aggregated_orders.parquet")
+                arrow_engine.write_output(demand, out_root, nd_dir, "net_demand.parquet")
+            arrow_engine.write_output(arrow_engine.supplier_orders(demand, rules, run_date), out_root, so_dir, "supplier_orders.parquet")
+        return _dir_bytes(out_root)
+    finally:
+        shutil.rmtree(out_root, ignore_errors=True)
+
+
+def run_trino(mode, materialize):
+    """One run of the real stages on the cluster; returns bytes under the three HDFS output dirs."""
+    import aggregate_orders
+    import net_demand
+    import supplier_orders
+    import fused_pipeline
+    from run_context import RunContext
+
+    ctx = RunContext.from_env(RUN_DATE)
+    hdfs = ctx.hdfs()
+    if mode == "staged":
+        aggregate_orders.main(engine="trino", ctx=ctx)
+        net_demand.main(engine="trino", ctx=ctx)
+        supplier_orders.main(engine="trino", ctx=ctx)
+    else:
+        # Intermediate outputs left by a previous staged run must not be counted
+        for hdfs_dir in OUTPUT_DIRS[:2]:
+            hdfs.delete(hdfs_dir.format(run_date=RUN_DATE), recursive=True)
+        fused_pipeline.main(engine="trino", materialize=materialize, ctx=ctx)
+
+    return sum(hdfs.content_summary(d.format(run_date=RUN_DATE))["length"] for d in OUTPUT_DIRS)
+
+
+def measure(label, fn, repeat):
+    timings, written = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        written = fn()
+        timings.append(time.perf_counter() - start)
+    result = {
+        "mode": label,
+        "runs": repeat,
+        "wall_seconds_median": round(statistics.median(timings), 4),
+        "wall_seconds_min": round(min(timings), 4),
+        "bytes_written": written,
+    }
+    print(f"  {label:<20} median {result['wall_seconds_median']:>8.4f}s  bytes written {written:>12,}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused vs staged procurement plan benchmark")
+    parser.add_argument("--engine", choices=["arrow", "trino"], default="arrow")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="arrow only: replicate the day's orders N times")
+    parser.add_argument("--products-csv", help="arrow only: products CSV instead of Postgres")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"--- Benchmark staged vs fused ({args.engine}, {RUN_DATE}) ---")
+    results = []
+    if args.engine == "arrow":
+        import pyarrow as pa
+        from engine_parity import load_products
+        import procurement_rules
+
+        orders = arrow_engine.read_avro_dir(os.path.join(DATA_ROOT, "raw/orders", RUN_DATE), arrow_engine.ORDERS_SCHEMA)
+        orders = pa.concat_tables([orders] * args.scale)
+        stock = arrow_engine.read_avro_dir(os.path.join(DATA_ROOT, "raw/stock", RUN_DATE), arrow_engine.STOCK_SCHEMA)
+        rules = procurement_rules.compile_rules(load_products(args.products_csv))
+        print(f"  {orders.num_rows} order lines, {stock.num_rows} stock rows, {rules.num_rows} products")
+        for mode, materialize in [("staged", False), ("fused", False), ("fused", True)]:
+            label = mode + ("+materialize" if materialize else "")
+            results.append(measure(label, lambda: run_arrow(mode, orders, stock, rules, RUN_DATE, materialize), args.repeat))
+    else:
+        for mode, materialize in [("staged", False), ("fused", False), ("fused", True)]:
+            label = mode + ("+materialize" if materialize else "")
+            results.append(measure(label, lambda: run_trino(mode, materialize), args.repeat))
+
+    report = {"engine": args.engine, "run_date": RUN_DATE, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from datetime import date
+
+import generate_daily_files
+
+# Per-market generation on 1..N processes (no Postgres / HDFS needed):
+#   - the files must be byte-identical whatever the number of workers
+#   - wall time per worker count shows how the pool scales
+
+
+def digest(results):
+    h = hashlib.sha256()
+    for market_id, payload, events in results:
+        h.update(market_id.encode())
+        h.update(payload or b"-")
+        h.update("\n".join(events).encode())
+    return h.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process-pool market generation: determinism + scaling")
+    parser.add_argument("--markets", type=int, default=10000)
+    parser.add_argument("--skus", type=int, default=500)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--run-date", default=os.getenv("RUN_DATE") or date.today().isoformat(),
+                        help="date the market files are seeded with")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    market_ids = [f"MKT-{i:05d}" for i in range(1, args.markets + 1)]
+    valid_skus = [f"SKU-{i:04d}" for i in range(1, args.skus + 1)]
+    print(f"--- {args.markets} markets, {args.skus} SKUs, {os.cpu_count()} CPU(s) ---")
+
+    results, reference = [], None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        start = time.perf_counter()
+        generated = list(generate_daily_files.generate_markets(market_ids, valid_skus, args.run_date, workers=workers))
+        elapsed = time.perf_counter() - start
+        sha = digest(generated)
+        reference = reference or sha
+        results.append({
+            "workers": workers,
+            "seconds": round(elapsed, 4),
+            "markets_per_sec": round(args.markets / elapsed, 1),
+            "files": sum(1 for _, payload, _ in generated if payload is not None),
+            "sha256": sha,
+        })
+        print(f"  workers={workers:<3} {elapsed:>8.3f}s  {args.markets / elapsed:>9.1f} markets/s  {sha[:16]}")
+
+    identical = all(r["sha256"] == reference for r in results)
+    print(" Output identical for every worker count" if identical else " [ERROR] Output differs between worker counts")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"markets": args.markets, "identical": identical, "results": results}, f, indent=2)
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+from hdfs_client import WebHDFSClient
+from async_hdfs_client import AsyncWebHDFSClient
+from webhdfs_standin import start_standin
+
+# Upload throughput of the HDFS clients against the local WebHDFS stand-in:
+#   serial     : WebHDFSClient.put_file in a loop (what the pipeline used to do)
+#   put_many   : WebHDFSClient.put_many (pooled sessions + thread pool)
+#   async      : AsyncWebHDFSClient.put_many (asyncio, per-host connection limits)
+# --latency emulates the network round trip of every namenode/datanode request.
+
+
+def make_files(src_dir, count, size):
+    payload = os.urandom(size)
+    paths = []
+    for i in range(count):
+        path = os.path.join(src_dir, f"orders_MKT-{i:05d}.avro")
+        with open(path, "wb") as f:
+            f.write(payload)
+        paths.append(path)
+    return paths
+
+
+def run_serial(base_url, transfers):
+    hdfs = WebHDFSClient(base_url)
+    for local_path, hdfs_path in transfers:
+        hdfs.put_file(local_path, hdfs_path, overwrite=True)
+
+
+def run_put_many(base_url, transfers, workers):
+    with WebHDFSClient(base_url, pool_size=workers) as hdfs:
+        results = hdfs.put_many(transfers, overwrite=True, max_workers=workers)
+    assert all(r.ok for r in results), [r.error for r in results if not r.ok][:3]
+
+
+def run_async(base_url, transfers, per_host):
+    async def _go():
+        async with AsyncWebHDFSClient(base_url, limit_per_host=per_host) as hdfs:
+            return await hdfs.put_many(transfers, overwrite=True)
+    results = asyncio.run(_go())
+    assert all(r.ok for r in results), [r.error for r in results if not r.ok][:3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebHDFS client throughput (sync vs pooled vs asyncio)")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size", type=int, default=4096, help="bytes per file")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every request")
+    parser.add_argument("--workers", type=int, default=16, help="put_many threads")
+    parser.add_argument("--per-host", type=int, default=64, help="async connections per host")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_hdfs_")
+    server, base_url = start_standin(os.path.join(work_dir, "hdfs"), latency=args.latency)
+    try:
+        src_dir = os.path.join(work_dir, "src")
+        os.makedirs(src_dir)
+        files = make_files(src_dir, args.files, args.size)
+        transfers = [(p, f"/raw/orders/bench/{os.path.basename(p)}") for p in files]
+        WebHDFSClient(base_url).mkdirs("/raw/orders/bench")
+
+        print(f"--- {args.files} files x {args.size} B, latency {args.latency * 1000:.1f} ms/request ---")
+        results = []
+        for label, fn in [
+            ("serial", lambda: run_serial(base_url, transfers)),
+            ("put_many", lambda: run_put_many(base_url, transfers, args.workers)),
+            ("async", lambda: run_async(base_url, transfers, args.per_host)),
+        ]:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            results.append({
+                "client": label,
+                "seconds": round(elapsed, 4),
+                "files_per_sec": round(args.files / elapsed, 1),
+                "mb_per_sec": round(args.files * args.size / elapsed / 1e6, 3),
+            })
+            print(f"  {label:<10} {elapsed:>8.3f}s  {args.files / elapsed:>9.1f} files/s")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"files": args.files, "size": args.size, "latency": args.latency, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
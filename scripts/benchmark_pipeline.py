@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+# Per-stage benchmark of run_pipeline_hdfs.main on local stand-ins (no Docker needed):
+#   - HDFS     : webhdfs_standin.py (filesystem-backed WebHDFS server)
+#   - Postgres : SQLite file (PG_EMBEDDED) loaded with generate_scale_data master data
+#   - stages 1-3 run with PIPELINE_ENGINE=arrow (Trino has no local stand-in)
+#   - the day itself comes from generate_scale_data.generate_day (ORDER_LINES_PER_SF lines per
+#     scale factor, Zipf skew --skew), written to Avro inside the generation stage
+#
+#   python scripts/benchmark_pipeline.py --scale-factors 0.01,0.1 --output bench.json
+#   python scripts/benchmark_pipeline.py --scale-factors 0.01,0.1 --compare bench.json
+#
+# Each scale runs in its own process (the stage modules read their config at import),
+# and records per stage: wall time, rows/s, bytes written (local + HDFS) and peak RSS.
+
+STAGES = ["generation", "upload", "guard_checks", "aggregation", "net_demand", "supplier_orders", "report_save"]
+DEFAULT_THRESHOLD = 0.20  # +20% time or memory vs the baseline = regression
+# Below these absolute changes a stage is noise, whatever the percentage (ms-long stages)
+MIN_DELTA = {"seconds": 0.05, "peak_rss_mb": 10.0}
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux /proc, else the ru_maxrss high-water mark)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakRSS:
+    """Samples the RSS in a background thread while a stage runs."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def tree_bytes(*roots):
+    total = 0
+    for root in roots:
+        for dirpath, _, files in os.walk(root):
+            total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in files)
+    return total
+
+
+def load_master_data(db_path, scale_factor, seed):
+    """Embedded 'Postgres': the master tables of generate_scale_data in a SQLite file. Returns (markets, products)."""
+    from generate_scale_data import generate_master
+
+    suppliers, markets, products = generate_master(scale_factor, seed)
+    products.columns = [c.lower() for c in products.columns]
+    with sqlite3.connect(db_path) as conn:
+        suppliers.to_sql("suppliers", conn, index=False, if_exists="replace")
+        markets.to_sql("market", conn, index=False, if_exists="replace")
+        products.to_sql("products", conn, index=False, if_exists="replace")
+    return markets, products
+
+
+# =========================================================
+# ============ ONE SCALE (runs in a child process) =========
+# =========================================================
+def run_scale(scale_factor, run_date, seed, work_dir, skew=1.0):
+    from webhdfs_standin import start_standin
+
+    data_root = os.path.join(work_dir, "data")
+    hdfs_root = os.path.join(work_dir, "hdfs")
+    db_path = os.path.join(work_dir, "master.sqlite")
+    server, base_url = start_standin(hdfs_root)
+
+    # The stage modules read their configuration at import time: set it before any import
+    os.environ.update(RUN_DATE=run_date, DATA_ROOT=data_root, HDFS_BASE_URL=base_url,
+                      PG_EMBEDDED=db_path, PIPELINE_ENGINE="arrow", PIPELINE_MODE="staged")
+    markets, products = load_master_data(db_path, scale_factor, seed)
+    n_markets, n_products = len(markets), len(products)
+    import arrow_engine
+    import generate_scale_data
+    import aggregate_orders
+    import net_demand
+    import supplier_orders
+    import run_pipeline_hdfs
+    from data_quality import DataQualityGuard
+    from run_context import RunContext
+    from storage import raise_for_failures
+
+    ctx = RunContext.from_env(run_date)
+    hdfs = ctx.hdfs()
+    state = {}
+
+    def order_rows():
+        local_dir = os.path.join(data_root, "raw/orders", run_date)
+        return arrow_engine.read_avro_dir(local_dir, arrow_engine.ORDERS_SCHEMA).num_rows
+
+    def stage_generation():
+        # Fichiers Avro écrits en entier ici (stock compris) : l'upload ne fait que les envoyer
+        state["day"] = generate_scale_data.generate_day(run_date, markets, products, scale_factor, skew, seed, data_root)
+        return state["day"]["order_lines"]
+
+    def stage_upload():
+        run_pipeline_hdfs.setup_hdfs_structure(hdfs, ctx)
+        uploads = []
+        for kind in ("orders", "stock"):
+            local_dir = os.path.join(data_root, "raw", kind, run_date)
+            uploads += [(os.path.join(local_dir, name), f"/raw/{kind}/{run_date}/{name}")
+                        for name in sorted(os.listdir(local_dir))]
+        raise_for_failures(hdfs.put_many(uploads, overwrite=True), "upload")
+        return order_rows() + n_products
+
+    def stage_guard_checks():
+        state["guard"] = DataQualityGuard(run_date, run_pipeline_hdfs.DB_CONFIG,
+                                          exceptions_dir=os.path.join(data_root, "logs/exceptions"))
+        run_pipeline_hdfs.check_missing_markets(state["guard"], ctx, hdfs)
+        return n_markets + len(state["guard"].product_limits)
+
+    def stage_aggregation():
+        state["rows_in"] = order_rows()
+        state["aggregated"] = aggregate_orders.main(state["guard"], engine="arrow", ctx=ctx)
+        return state["rows_in"]
+
+    def stage_net_demand():
+        state["demand"] = net_demand.main(state["guard"], engine="arrow", ctx=ctx)
+        return state["aggregated"].num_rows + n_products
+
+    def stage_supplier_orders():
+        supplier_orders.main(state["guard"], engine="arrow", ctx=ctx)
+        return state["demand"].num_rows
+
+    def stage_report_save():
+        guard = state["guard"]
+        log_dir_local = os.path.join(data_root, "logs/exceptions")
+        guard.save_report(log_dir_local)
+        local_report_file = os.path.join(log_dir_local, f"date={run_date}/exceptions.csv")
+        if os.path.exists(local_report_file):
+            hdfs.put_file(local_report_file, f"/logs/exceptions/date={run_date}/exceptions.csv", overwrite=True)
+        return len(guard.sink)
+
+    stage_fns = {
+        "generation": stage_generation,
+        "upload": stage_upload,
+        "guard_checks": stage_guard_checks,
+        "aggregation": stage_aggregation,
+        "net_demand": stage_net_demand,
+        "supplier_orders": stage_supplier_orders,
+        "report_save": stage_report_save,
+    }
+
+    results = []
+    try:
+        for stage in STAGES:
+            bytes_before = tree_bytes(data_root, hdfs_root)
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                rows = stage_fns[stage]()
+                elapsed = time.perf_counter() - start
+            results.append({
+                "stage": stage,
+                "seconds": round(elapsed, 4),
+                "rows": rows,
+                "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+                "bytes_written": tree_bytes(data_root, hdfs_root) - bytes_before,
+                "peak_rss_mb": round(rss.peak / 1e6, 1),
+            })
+    finally:
+        server.shutdown()
+
+    return {
+        "scale_factor": scale_factor,
+        "run_date": run_date,
+        "skew": skew,
+        "markets": n_markets,
+        "products": n_products,
+        "order_lines": state["day"]["order_lines"],
+        "stages": results,
+        "total_seconds": round(sum(r["seconds"] for r in results), 4),
+    }
+
+
+# =========================================================
+# ======================= COMPARE ==========================
+# =========================================================
+def compare(current, baseline, threshold):
+    """Lists the (scale, stage) whose time or peak RSS grew more than `threshold` vs the baseline."""
+    base = {(s["scale_factor"], r["stage"]): r for s in baseline["scales"] for r in s["stages"]}
+    regressions = []
+    print(f"\n--- Compare vs baseline (threshold +{threshold:.0%}) ---")
+    for scale in current["scales"]:
+        for r in scale["stages"]:
+            ref = base.get((scale["scale_factor"], r["stage"]))
+            if ref is None:
+                continue
+            for metric in ("seconds", "peak_rss_mb"):
+                old, new = ref[metric], r[metric]
+                change = (new - old) / old if old else 0.0
+                flag = change > threshold and new - old > MIN_DELTA[metric]
+                if flag:
+                    regressions.append({"scale_factor": scale["scale_factor"], "stage": r["stage"],
+                                        "metric": metric, "baseline": old, "current": new,
+                                        "change": round(change, 4)})
+                print(f"  SF {scale['scale_factor']:<6} {r['stage']:<16} {metric:<12} "
+                      f"{old:>10} -> {new:>10} ({change:+.1%}){'  [REGRESSION]' if flag else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmark on local stand-ins")
+    parser.add_argument("--scale-factors", default="0.01", help="comma-separated scale factors (generate_scale_data)")
+    parser.add_argument("--run-date", default="2026-01-14")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of SKU popularity (generate_scale_data)")
+    parser.add_argument("--output", help="write the results as JSON to this file (usable as a baseline)")
+    parser.add_argument("--compare", help="baseline JSON: flag regressions, exit code 1 if any")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--single-scale", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_scale is not None:
+        report = run_scale(args.single_scale, args.run_date, args.seed, args.work_dir, args.skew)
+        with open(os.path.join(args.work_dir, "result.json"), "w") as f:
+            json.dump(report, f)
+        return 0
+
+    scales = []
+    for scale_factor in [float(s) for s in args.scale_factors.split(",")]:
+        with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+            print(f"\n--- Scale factor {scale_factor} ---")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--single-scale", str(scale_factor),
+                            "--run-date", args.run_date, "--seed", str(args.seed), "--skew", str(args.skew),
+                            "--work-dir", work_dir],
+                           check=True, stdout=subprocess.DEVNULL)
+            with open(os.path.join(work_dir, "result.json")) as f:
+                scale = json.load(f)
+        scales.append(scale)
+        print(f"  {scale['markets']} markets, {scale['products']} products, {scale['order_lines']:,} order lines")
+        for r in scale["stages"]:
+            print(f"  {r['stage']:<16} {r['seconds']:>8.3f}s  {r['rows']:>10,} rows  "
+                  f"{r['bytes_written']:>12,} B  peak {r['peak_rss_mb']:>7.1f} MB")
+
+    report = {"run_date": args.run_date, "seed": args.seed, "skew": args.skew, "cpu_count": os.cpu_count(),
+              "python": sys.version.split()[0], "scales": scales}
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        print(f" {len(regressions)} regression(s)" if regressions else " No regression")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+from itertools import islice
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import fastavro
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import hive_tables
+from avro_stream import ORDERS_AVRO_SCHEMA, iter_avro_chunks
+from engines import resolve_engine
+from storage import HDFS_MAX_WORKERS, raise_for_failures
+from run_context import RunContext, date_range
+from trino_utils import stage_session
+from tracing import span, propagate
+
+# Compaction des petits fichiers d'une partition HDFS : les N fichiers du jour (un Avro par
+# marché, un JSON par fournisseur) sont fusionnés en quelques fichiers d'environ un bloc HDFS,
+# écrits dans un dossier versionné de la partition, sur lequel la partition Hive est ensuite pointée :
+#   /raw/orders/{date}/_v1/part-00000.avro, part-00001.avro, ...  + /raw/orders/{date}/_compaction.json
+# Le manifest _compaction.json associe chaque fichier d'origine à sa plage de lignes
+# (part, first_row, rows). Les noms commençant par _ ou . sont ignorés par Hive / Trino : tant que
+# la partition pointe sur {date}, _v{n} n'est pas lu, et une fois pointée sur _v{n}, les fichiers
+# d'origine ne le sont plus. Trino ne voit donc jamais les deux à la fois.
+# Protocole (rejouable après un crash) :
+#   1. manifest "pending", parts streamées puis uploadées dans {date}/_v{n}/
+#   2. partition Hive déplacée sur {date}/_v{n} (unregister_partition + register_partition)
+#   3. manifest "committed", puis fichiers d'origine et anciennes versions supprimés
+# Un run qui réécrit toute la partition (génération, export JSON) appelle invalidate() juste avant.
+COMPACTION_TARGET_BYTES = int(os.getenv("COMPACTION_TARGET_BYTES", str(128 * 1024 * 1024)))  # dfs.blocksize
+COMPACTION_MIN_FILES = int(os.getenv("COMPACTION_MIN_FILES", "2"))
+# 1 = tâche "compaction" en fin de run (run_pipeline_hdfs) pour les jeux de données assez anciens
+PIPELINE_COMPACTION = os.getenv("PIPELINE_COMPACTION", "0") == "1"
+# Âge minimal (jours) des JSON fournisseurs avant compaction : ils restent livrables tels quels d'ici là
+COMPACTION_OUTPUT_AGE_DAYS = int(os.getenv("COMPACTION_OUTPUT_AGE_DAYS", "7"))
+COMPACTION_WORKERS = int(os.getenv("COMPACTION_WORKERS", "2"))
+
+MANIFEST = "_compaction.json"
+VERSION_PREFIX = "_v"  # dossiers de données d'une partition compactée : _v1, _v2, ...
+
+SUPPLIER_ORDERS_SCHEMA = pa.schema([
+    ("supplier_id", pa.string()),
+    ("run_date", pa.string()),
+    ("sku", pa.string()),
+    ("quantity", pa.int64()),
+])
+
+
+class CompactionSpec(namedtuple("CompactionSpec", ["name", "root", "suffix", "part_suffix", "min_age_days", "table"])):
+    """
+    root/{run_date} = partition folder, suffix = small files compacted, part_suffix = compacted files,
+    table = Hive table whose partition follows the compacted files (None: not read by Trino).
+    """
+    __slots__ = ()
+
+    def location(self, run_date: str) -> str:
+        return f"{self.root}/{run_date}"
+
+    def is_source(self, name: str) -> bool:
+        return name.endswith(self.suffix) and not name.startswith(("_", ".", "part-"))
+
+    def is_due(self, run_date: str) -> bool:
+        return (date.today() - date.fromisoformat(run_date)).days >= self.min_age_days
+
+
+RAW_ORDERS = CompactionSpec("raw_orders", "/raw/orders", ".avro", ".avro", 0, hive_tables.RAW_ORDERS)
+SUPPLIER_JSON = CompactionSpec("supplier_json", "/output/supplier_orders", ".json", ".parquet",
+                               COMPACTION_OUTPUT_AGE_DAYS, None)
+SPECS = {spec.name: spec for spec in (RAW_ORDERS, SUPPLIER_JSON)}
+
+
+# --------------------------------------------------
+# LECTURE / ÉCRITURE DES FORMATS
+# --------------------------------------------------
+def _json_table(local_path):
+    """One supplier JSON as rows of the compacted schema."""
+    with open(local_path) as f:
+        order = json.load(f)
+    items = order["items"]
+    return pa.table({
+        "supplier_id": [order["supplier_id"]] * len(items),
+        "run_date": [order["run_date"]] * len(items),
+        "sku": [item["sku"] for item in items],
+        "quantity": [item["quantity"] for item in items],
+    }, schema=SUPPLIER_ORDERS_SCHEMA)
+
+
+def _write_part(spec, source_paths, local_path):
+    """
+    Streams the sources into one part (Avro records re-encoded chunk by chunk, one Parquet row
+    group per JSON): memory does not grow with the part. Returns the row count of each source.
+    """
+    counts = []
+    if spec.part_suffix == ".avro":
+        def records():
+            for path in source_paths:
+                counts.append(0)
+                with open(path, "rb") as f:
+                    for record in fastavro.reader(f):
+                        counts[-1] += 1
+                        yield record
+
+        with open(local_path, "wb") as out:
+            for chunk in iter_avro_chunks(ORDERS_AVRO_SCHEMA, records()):
+                out.write(chunk)
+    else:
+        with pq.ParquetWriter(local_path, SUPPLIER_ORDERS_SCHEMA) as writer:
+            for path in source_paths:
+                table = _json_table(path)
+                writer.write_table(table)
+                counts.append(table.num_rows)
+    return counts
+
+
+def _read_rows(spec, local_part, first_row, rows):
+    """Rows [first_row, first_row + rows) of a part."""
+    if spec.part_suffix == ".avro":
+        with open(local_part, "rb") as f:
+            return list(islice(fastavro.reader(f), first_row, first_row + rows))
+    return pq.read_table(local_part).slice(first_row, rows).to_pylist()
+
+
+def plan_bins(statuses, target_bytes=None):
+    """Sources (FileStatus, by name) -> groups of ~target_bytes each (a bigger file is alone in its group)."""
+    target_bytes = target_bytes or COMPACTION_TARGET_BYTES
+    bins, current, size = [], [], 0
+    for st in sorted(statuses, key=lambda s: s.name):
+        if current and size + st.length > target_bytes:
+            bins.append(current)
+            current, size = [], 0
+        current.append(st)
+        size += st.length
+    if current:
+        bins.append(current)
+    return bins
+
+
+# --------------------------------------------------
+# MANIFEST / PARTITION HIVE
+# --------------------------------------------------
+def read_manifest(hdfs, spec, run_date):
+    content = hdfs.read_bytes(f"{spec.location(run_date)}/{MANIFEST}")
+    return json.loads(content) if content else None
+
+
+def _write_manifest(hdfs, spec, run_date, manifest):
+    data = json.dumps(manifest, indent=2).encode()
+    hdfs.put_stream(lambda: iter([data]), f"{spec.location(run_date)}/{MANIFEST}", overwrite=True)
+
+
+def _delete_all(hdfs, paths, recursive=False):
+    with ThreadPoolExecutor(max_workers=HDFS_MAX_WORKERS) as pool:
+        list(pool.map(propagate(lambda path: hdfs.delete(path, recursive=recursive)), paths))
+
+
+def _version_dirs(hdfs, spec, run_date):
+    return [st for st in hdfs.list_status(spec.location(run_date))
+            if st.is_dir and st.name.startswith(VERSION_PREFIX) and st.name[len(VERSION_PREFIX):].isdigit()]
+
+
+def data_location(hdfs, spec, run_date) -> str:
+    """Folder holding the data of a partition: {date}/_v{n} once compacted, else {date}."""
+    manifest = read_manifest(hdfs, spec, run_date)
+    if manifest is not None and manifest["status"] == "committed":
+        return f"{spec.location(run_date)}/{manifest['data_dir']}"
+    return spec.location(run_date)
+
+
+def source_names(hdfs, spec, run_date) -> list:
+    """Names of the small files of a partition, whether it is compacted (manifest) or not (listing)."""
+    manifest = read_manifest(hdfs, spec, run_date)
+    names = {s["file"] for s in manifest["sources"]} if manifest and manifest["status"] == "committed" else set()
+    names.update(st.name for st in hdfs.list_status(spec.location(run_date)) if st.is_file and spec.is_source(st.name))
+    return sorted(names)
+
+
+@contextmanager
+def _table_session(spec, session):
+    """Trino session that moves spec's Hive partition (None: no table, or arrow engine without Trino)."""
+    if spec.table is None or resolve_engine() != "trino":
+        yield None
+        return
+    with stage_session(session) as trino:
+        yield trino
+
+
+def _point_partition(spec, run_date, location, session):
+    with _table_session(spec, session) as trino:
+        if trino is None:
+            return
+        with trino.cursor("compaction") as cur:
+            hive_tables.relocate_partition(cur, spec.table, run_date, location)
+        trino.invalidate(spec.table.name)
+
+
+def _rollback(hdfs, spec, run_date, manifest, session=None):
+    """
+    Back to the small files: Hive partition pointed at {date} again, data folders and manifest
+    removed. Only the small files still in {date} remain (none after a committed compaction).
+    """
+    location = spec.location(run_date)
+    _point_partition(spec, run_date, location, session)
+    _delete_all(hdfs, [st.path for st in _version_dirs(hdfs, spec, run_date)], recursive=True)
+    hdfs.delete(f"{location}/{MANIFEST}")
+
+
+def invalidate(hdfs, spec, run_date, session=None) -> bool:
+    """
+    Only safe right before the caller rewrites EVERY small file of the partition (generation,
+    JSON export): a committed compaction already deleted them, so the partition is empty until
+    they are written again. Parts, manifest and Hive location are reset. False when not compacted.
+    """
+    manifest = read_manifest(hdfs, spec, run_date)
+    if manifest is None:
+        return False
+    print(f" Compaction of {spec.location(run_date)} invalidated ({len(manifest.get('parts', []))} part(s) removed)")
+    _rollback(hdfs, spec, run_date, manifest, session)
+    return True
+
+
+def _cleanup(hdfs, spec, run_date, manifest):
+    """After the commit: small files and other data versions deleted (Trino reads data_dir only)."""
+    location = spec.location(run_date)
+    _delete_all(hdfs, [f"{location}/{s['file']}" for s in manifest["sources"]])
+    _delete_all(hdfs, [st.path for st in _version_dirs(hdfs, spec, run_date) if st.name != manifest["data_dir"]],
+                recursive=True)
+
+
+# --------------------------------------------------
+# COMPACTION D'UNE PARTITION
+# --------------------------------------------------
+def compact_partition(hdfs, spec, run_date, target_bytes=None, min_files=None, session=None):
+    """
+    Compacts spec's partition of run_date; returns the committed manifest, or None when there
+    is nothing to do (fewer than min_files small files). session: Trino session of the run.
+    """
+    target_bytes = target_bytes or COMPACTION_TARGET_BYTES
+    min_files = min_files or COMPACTION_MIN_FILES
+    location = spec.location(run_date)
+
+    manifest = read_manifest(hdfs, spec, run_date)
+    if manifest is not None and manifest["status"] == "committed":
+        # Crash après le commit : la partition lit déjà data_dir, il ne reste que le ménage
+        _cleanup(hdfs, spec, run_date, manifest)
+        return manifest
+    if manifest is not None:
+        print(f" Rolling back unfinished compaction of {location}")
+        _rollback(hdfs, spec, run_date, manifest, session)
+
+    sources = [st for st in hdfs.list_status(location) if st.is_file and spec.is_source(st.name)]
+    if len(sources) < min_files:
+        return None
+
+    versions = [int(st.name[len(VERSION_PREFIX):]) for st in _version_dirs(hdfs, spec, run_date)]
+    data_dir = f"{VERSION_PREFIX}{max(versions, default=0) + 1}"
+    manifest = {
+        "dataset": spec.name,
+        "run_date": run_date,
+        "location": location,
+        "data_dir": data_dir,
+        "status": "pending",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "target_bytes": target_bytes,
+        "parts": [],
+        "sources": [],
+    }
+    _write_manifest(hdfs, spec, run_date, manifest)  # un crash à partir d'ici est annulé par _rollback
+
+    with span("compaction.partition", kind="compaction", path=location, files=len(sources)) as s, \
+            tempfile.TemporaryDirectory(prefix="compaction-") as tmp:
+        hdfs.mkdirs(f"{location}/{data_dir}")
+        for index, group in enumerate(plan_bins(sources, target_bytes)):
+            # Une part à la fois sur le disque local : ses sources, la part, puis upload
+            local_sources = [os.path.join(tmp, st.name) for st in group]
+            results = hdfs.get_many([(st.path, path, st.length) for st, path in zip(group, local_sources)])
+            raise_for_failures(results, "download")
+            part = f"part-{index:05d}{spec.part_suffix}"
+            local_part = os.path.join(tmp, part)
+            first_row = 0
+            for st, rows in zip(group, _write_part(spec, local_sources, local_part)):
+                manifest["sources"].append({"file": st.name, "bytes": st.length, "part": part,
+                                            "first_row": first_row, "rows": rows})
+                first_row += rows
+            manifest["parts"].append({"file": part, "rows": first_row, "bytes": os.path.getsize(local_part)})
+            hdfs.put_file(local_part, f"{location}/{data_dir}/{part}", overwrite=True)
+            for path in local_sources + [local_part]:
+                os.remove(path)
+
+        _point_partition(spec, run_date, f"{location}/{data_dir}", session)
+        manifest.update(status="committed", committed_at=datetime.now().isoformat(timespec="seconds"))
+        _write_manifest(hdfs, spec, run_date, manifest)
+        _cleanup(hdfs, spec, run_date, manifest)
+        s.set(parts=len(manifest["parts"]), bytes=sum(st.length for st in sources))
+
+    print(f" Compacted {location}: {len(sources)} file(s) -> {len(manifest['parts'])} part(s) in {data_dir}")
+    return manifest
+
+
+def read_source(hdfs, spec, run_date, filename):
+    """Rows of an original file of a compacted partition (its row range in its part)."""
+    manifest = read_manifest(hdfs, spec, run_date)
+    source = next((s for s in (manifest or {}).get("sources", []) if s["file"] == filename), None)
+    if source is None:
+        raise FileNotFoundError(f"{filename} is not in the compaction manifest of {spec.location(run_date)}")
+    with tempfile.TemporaryDirectory(prefix="compaction-") as tmp:
+        local_part = os.path.join(tmp, source["part"])
+        hdfs.get_file(f"{spec.location(run_date)}/{manifest['data_dir']}/{source['part']}", local_part)
+        return _read_rows(spec, local_part, source["first_row"], source["rows"])
+
+
+def compact_run(hdfs, run_date, specs=None, session=None):
+    """Every dataset of one date old enough to be compacted (end-of-run task of run_pipeline_hdfs)."""
+    for spec in specs or SPECS.values():
+        if spec.is_due(run_date):
+            compact_partition(hdfs, spec, run_date, session=session)
+
+
+# --------------------------------------------------
+# PARTITIONS HISTORIQUES (CLI / tâche de fond du scheduler)
+# --------------------------------------------------
+def partition_dates(hdfs, spec):
+    """Dates (folder names) of the partitions of a dataset."""
+    dates = []
+    for st in hdfs.list_status(spec.root):
+        try:
+            dates.append(date.fromisoformat(st.name).isoformat())
+        except ValueError:
+            continue
+    return sorted(dates)
+
+
+def compact_history(hdfs_factory, dates=None, specs=None, workers=None, before=None):
+    """
+    Compacts every partition of the given dates (default: all existing partitions, before `before`
+    if given) that is due, `workers` partitions at a time, one Trino session shared by all (trino
+    engine). Returns [(dataset, run_date, parts or None, error)].
+    """
+    specs = list(specs or SPECS.values())
+    with stage_session() if resolve_engine() == "trino" else nullcontext() as session:
+        return _compact_jobs(hdfs_factory, dates, specs, workers, before, session)
+
+
+def _compact_jobs(hdfs_factory, dates, specs, workers, before, session):
+    jobs = []
+    for spec in specs:
+        with hdfs_factory() as hdfs:
+            candidates = dates if dates is not None else partition_dates(hdfs, spec)
+        jobs += [(spec, d) for d in candidates if spec.is_due(d) and (before is None or d < before)]
+
+    def _one(job):
+        spec, run_date = job
+        try:
+            with hdfs_factory() as hdfs:
+                manifest = compact_partition(hdfs, spec, run_date, session=session)
+            return spec.name, run_date, len(manifest["parts"]) if manifest else None, None
+        except Exception as e:  # une partition en échec n'arrête pas les autres
+            return spec.name, run_date, None, f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or COMPACTION_WORKERS), thread_name_prefix="compaction") as pool:
+        return list(pool.map(propagate(_one), jobs))
+
+
+def start_background(hdfs_factory, before):
+    """Compacts the partitions of the dates before `before` in a daemon thread (orchestrator_scheduler.py)."""
+    def _run():
+        results = compact_history(hdfs_factory, before=before)
+        done = [r for r in results if r[2]]
+        failed = [r for r in results if r[3]]
+        print(f" Background compaction: {len(done)} partition(s) compacted, {len(failed)} failed")
+        for name, run_date, _, error in failed:
+            print(f"   {name} {run_date}: {error}")
+
+    thread = threading.Thread(target=_run, name="compaction", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compaction des petits fichiers des partitions HDFS")
+    parser.add_argument("--start", help="première date (YYYY-MM-DD, défaut : toutes les partitions)")
+    parser.add_argument("--end", help="dernière date incluse (défaut : --start)")
+    parser.add_argument("--dataset", choices=sorted(SPECS), action="append", help="jeu de données (répétable)")
+    parser.add_argument("--workers", type=int, default=COMPACTION_WORKERS, help="partitions compactées en même temps")
+    args = parser.parse_args()
+
+    ctx = RunContext.from_env()
+    dates = date_range(args.start, args.end or args.start) if args.start else None
+    specs = [SPECS[name] for name in args.dataset] if args.dataset else None
+    results = compact_history(ctx.hdfs, dates, specs, args.workers)
+
+    print("\n--- Compaction summary ---")
+    for name, run_date, parts, error in results:
+        state = f"FAILED  {error}" if error else (f"{parts} part(s)" if parts else "nothing to do")
+        print(f"  {name:<14} {run_date}  {state}")
+    return 1 if any(r[3] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from tracing import span, propagate
+
+# Exécution d'un run sous forme de graphe de tâches : une tâche démarre dès que ses
+# dépendances ont réussi, les tâches indépendantes tournent en parallèle (threads).
+# Chaque tâche déclare les ressources externes qu'elle utilise ; le nombre de tâches
+# en cours par ressource est plafonné pour tout le process (runs concurrents inclus,
+# cf. backfill.py / orchestrator_scheduler.py).
+DAG_WORKERS = int(os.getenv("DAG_WORKERS", "4"))
+RESOURCE_LIMITS = {
+    "trino": int(os.getenv("DAG_LIMIT_TRINO", "2")),
+    "hdfs": int(os.getenv("DAG_LIMIT_HDFS", "4")),
+    "postgres": int(os.getenv("DAG_LIMIT_POSTGRES", "2")),
+}
+
+_semaphores = {name: threading.BoundedSemaphore(max(1, limit)) for name, limit in RESOURCE_LIMITS.items()}
+
+
+class Task(namedtuple("Task", ["name", "fn", "deps", "resources"])):
+    __slots__ = ()
+
+    def __new__(cls, name, fn, deps=(), resources=()):
+        return super().__new__(cls, name, fn, tuple(deps), tuple(resources))
+
+
+class DagError(RuntimeError):
+    """A task failed: the tasks depending on it were skipped."""
+
+    def __init__(self, failed, skipped):
+        self.failed = failed    # {task: exception}
+        self.skipped = skipped  # [task]
+        name, error = next(iter(failed.items()))
+        super().__init__(f"Task '{name}' failed: {error}"
+                         + (f" (skipped: {', '.join(skipped)})" if skipped else ""))
+
+
+def check(tasks):
+    """Unknown dependencies / duplicate names / cycles -> ValueError."""
+    names = [t.name for t in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate task names in {names}")
+    for t in tasks:
+        unknown = [d for d in t.deps if d not in names]
+        if unknown:
+            raise ValueError(f"Task '{t.name}' depends on unknown task(s) {unknown}")
+    done, remaining = set(), list(tasks)
+    while remaining:
+        ready = [t for t in remaining if set(t.deps) <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle between {[t.name for t in remaining]}")
+        done.update(t.name for t in ready)
+        remaining = [t for t in remaining if t.name not in done]
+
+
+@contextmanager
+def resources(names):
+    """Takes one slot of each resource (always in the same order: no deadlock between tasks)."""
+    held = []
+    try:
+        for name in sorted(set(names)):
+            sem = _semaphores.get(name)
+            if sem is not None:
+                sem.acquire()
+                held.append(sem)
+        yield
+    finally:
+        for sem in reversed(held):
+            sem.release()
+
+
+def _run_task(task):
+    with span("dag.task", kind="dag", task=task.name, resources=",".join(task.resources)) as s:
+        start = time.time()
+        with resources(task.resources):
+            s.set(wait_seconds=round(time.time() - start, 6))
+            return task.fn()
+
+
+def run_dag(tasks, workers=None, name="dag"):
+    """
+    Runs the tasks as soon as their dependencies succeeded (declaration order among the ready ones).
+    Returns {task: result}. If a task fails its dependents are skipped, the tasks already running
+    finish, then DagError is raised.
+    """
+    check(tasks)
+    pending = {t.name: t for t in tasks}
+    results, failed, skipped, running = {}, {}, [], {}
+
+    with ThreadPoolExecutor(max_workers=workers or DAG_WORKERS, thread_name_prefix=name) as pool:
+        while pending or running:
+            for t in list(pending.values()):
+                if any(d in failed or d in skipped for d in t.deps):
+                    skipped.append(t.name)
+                    del pending[t.name]
+            for t in [t for t in pending.values() if all(d in results for d in t.deps)]:
+                del pending[t.name]
+                running[pool.submit(propagate(_run_task), t)] = t
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                t = running.pop(future)
+                try:
+                    results[t.name] = future.result()
+                except Exception as e:
+                    failed[t.name] = e
+
+    if failed:
+        raise DagError(failed, skipped)
+    return results
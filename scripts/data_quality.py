@@ -1,81 +1,164 @@
 import json
-import csv
 from datetime import datetime
 import os
-import psycopg2
-from logger import log as logger
-import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import procurement_rules
+from exception_sink import ExceptionSink
+from tracing import traced, current
+from logger import log as logger, flush as flush_logs
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_MAX_QTY = 999999
+LOG_SAMPLE_SIZE = 5  # violations detailed in the log line of a batch check
+# Issues kept per DAG task for the stage cache manifest (beyond that the stage is not replayable)
+GUARD_CAPTURE_MAX = int(os.getenv("GUARD_CAPTURE_MAX", "10000"))
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+
+# Issues logged in the current context (one DAG task / thread), see DataQualityGuard.capture
+_capture = contextvars.ContextVar("guard_capture", default=None)
+
+
+class CapturedIssues(list):
+    """Issues of one task as dicts; truncated=True once more than `limit` were logged."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+
+def _column(values, dtype=None):
+    """Accepts a list / NumPy array / Arrow (Chunked)Array and returns an Arrow array."""
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if not isinstance(values, pa.Array):
+        values = pa.array(values, type=dtype)
+    if dtype is not None and values.type != dtype:
+        values = values.cast(dtype)
+    return values
+
+
+def _ints(values):
+    """Arrow/NumPy/list -> (int64 NumPy array with 0 for NULL, valid mask)."""
+    arr = _column(values, pa.int64())
+    valid = pc.is_valid(arr).to_numpy(zero_copy_only=False)
+    return pc.fill_null(arr, 0).to_numpy(zero_copy_only=False), valid
+
+
+class ProductLimits:
+    """MxOQ and pack size per SKU, stored as SKU-indexed arrays (one row per product)."""
+
+    def __init__(self, skus=(), max_qty=(), pack_size=()):
+        self.skus = pa.array(list(skus), pa.string())
+        self.max = np.asarray(max_qty, dtype=np.int64)
+        self.pack_size = np.asarray(pack_size, dtype=np.int64)
+        self._position = {sku: i for i, sku in enumerate(self.skus.to_pylist())}
+
+    def __len__(self):
+        return len(self.skus)
+
+    def get(self, sku):
+        """Scalar lookup kept for the row-by-row checks: {'max', 'pack_size'} or None."""
+        i = self._position.get(sku)
+        if i is None:
+            return None
+        return {'max': int(self.max[i]), 'pack_size': int(self.pack_size[i])}
+
+    def positions(self, skus):
+        """Vectorised lookup: (index array, known mask). Unknown SKUs get index 0 and known=False."""
+        idx = pc.index_in(_column(skus, pa.string()), value_set=self.skus)
+        known = pc.is_valid(idx).to_numpy(zero_copy_only=False)
+        return pc.fill_null(idx, 0).to_numpy(zero_copy_only=False).astype(np.int64), known
+
 
 class DataQualityGuard:
-    def __init__(self, batch_date, db_config):
+    def __init__(self, batch_date, db_config, exceptions_dir=None):
         self.batch_date = batch_date  # Format: "YYYY-MM-DD"
-        self.errors = []
+        # Anomalies flushed to date={batch_date}/parquet/ by batches, counters in memory
+        self.sink = ExceptionSink(batch_date, exceptions_dir or os.path.join(DATA_ROOT, "logs/exceptions"))
         self.product_limits = self.load_product_limits(db_config)
 
     # --------------------------------------------------
     # MASTER DATA LOADING
     # --------------------------------------------------
-    def _parse_pack_size(self, pkg_str):
-        """Helper to convert 'Box of 6' -> 6, 'Pallet' -> 100"""
-        if not pkg_str:
-            return 1
-        
-        s = str(pkg_str).lower()
-        
-        # Extract number if present (e.g., "box of 6")
-        numbers = re.findall(r'\d+', s)
-        if numbers:
-            return int(numbers[0])
-            
-        if "pallet" in s:
-            return 100 # Standard pallet assumption
-            
-        return 1 # Default for "Single Unit" or unknown
-    
     def load_product_limits(self, db_config):
-        """Fetch MxOQ from Postgres."""
-        logger.info("Connecting to Postgres to fetch Product Rules...")
+        """MxOQ and pack size from the compiled procurement rules (same dimension as the stages)."""
+        logger.info("Loading Product Rules from the compiled procurement rules...")
 
         try:
-            conn = psycopg2.connect(**db_config)
-            cur = conn.cursor()
-
-            cur.execute("SELECT sku, mxoq, package FROM products;")
-            results = cur.fetchall()
-
-            cur.close()
-            conn.close()
-
-            rules = {}
-            for row in results:
-                sku = row[0]
-                mxoq = row[1]
-                package_str = row[2]
-                
-                rules[sku] = {
-                    'max': mxoq if mxoq else 999999,
-                    'pack_size': self._parse_pack_size(package_str) 
-                }
+            compiled = procurement_rules.table(db_config)
+            mxoq = pc.fill_null(compiled["mxoq"], 0).to_numpy()
+
+            rules = ProductLimits(
+                skus=compiled["sku"].to_pylist(),
+                max_qty=np.where(mxoq > 0, mxoq, DEFAULT_MAX_QTY),
+                pack_size=compiled["pack_size"].to_numpy(),
+            )
 
             logger.info("Loaded rules for %d products.", len(rules))
             return rules
 
         except Exception:
             logger.error("Database error while loading product limits", exc_info=True)
-            return {}
+            return ProductLimits()
 
     # --------------------------------------------------
     # EXCEPTION REGISTRY (BUSINESS LOG)
     # --------------------------------------------------
     def log_issue(self, rule_name, entity_id, details, severity="HIGH"):
-        self.errors.append({
-            "timestamp": datetime.now().isoformat(),
-            "batch_date": self.batch_date,
-            "rule_broken": rule_name,
-            "entity_id": entity_id,
-            "details": details,
-            "severity": severity
-        })
+        self._record(rule_name, severity, datetime.now().isoformat(), [entity_id], [details])
+
+    def log_issues(self, rule_name, entity_ids, details, severity="HIGH"):
+        """Bulk variant of log_issue: one timestamp for the whole batch of violations."""
+        self._record(rule_name, severity, datetime.now().isoformat(), list(entity_ids), list(details))
+
+    def replay(self, issues):
+        """Issues of a skipped stage (stage cache manifest) back into the report."""
+        self.sink.add_rows(issues)
+
+    def _record(self, rule_name, severity, timestamp, entity_ids, details):
+        # The sink is locked: tasks running in parallel can share the guard
+        self.sink.add(rule_name, severity, timestamp, entity_ids, details)
+        captured = _capture.get()
+        if captured is None or captured.truncated:
+            return
+        if len(captured) + len(entity_ids) > captured.limit:
+            captured.truncated = True
+            captured.clear()
+            return
+        captured.extend(
+            {
+                "timestamp": timestamp,
+                "batch_date": self.batch_date,
+                "rule_broken": rule_name,
+                "entity_id": entity_id,
+                "details": detail,
+                "severity": severity
+            }
+            for entity_id, detail in zip(entity_ids, details)
+        )
+
+    @contextmanager
+    def capture(self, limit=None):
+        """
+        with guard.capture() as issues: ... -> the issues logged by this thread / task only
+        (at most GUARD_CAPTURE_MAX, then issues.truncated is True and the list is emptied).
+        """
+        issues = CapturedIssues(limit or GUARD_CAPTURE_MAX)
+        token = _capture.set(issues)
+        try:
+            yield issues
+        finally:
+            _capture.reset(token)
+
+    def _warn_batch(self, rule_name, message, count, samples):
+        """One log line per batch check instead of one per violation (rate-limited per rule, see logger.py)."""
+        if count:
+            logger.warning("%s | %d violation(s), e.g. %s", message, count, "; ".join(samples[:LOG_SAMPLE_SIZE]),
+                           extra={"rule": rule_name})
 
     # --------------------------------------------------
     # DATA QUALITY CHECKS
@@ -99,7 +182,7 @@ class DataQualityGuard:
             )
             logger.warning(
                 "Invalid Package Size | Order %s | SKU %s | Qty %s is not multiple of %s", 
-                order_id, sku, quantity, pack_size
+                order_id, sku, quantity, pack_size, extra={"rule": "INVALID_PACK_SIZE"}
             )
             return False
             
@@ -110,7 +193,7 @@ class DataQualityGuard:
 
         if rules is None:
             self.log_issue("UNKNOWN_PRODUCT", sku, "SKU not found in Master Data.")
-            logger.warning("Unknown SKU detected: %s", sku)
+            logger.warning("Unknown SKU detected: %s", sku, extra={"rule": "UNKNOWN_PRODUCT"})
             return False
 
         max_allowed = rules['max']
@@ -123,7 +206,7 @@ class DataQualityGuard:
             )
             logger.warning(
                 "Abnormal demand spike | Order %s | SKU %s | Qty %s > %s",
-                order_id, sku, quantity, max_allowed
+                order_id, sku, quantity, max_allowed, extra={"rule": "ABNORMAL_DEMAND_SPIKE"}
             )
             return False
 
@@ -138,41 +221,116 @@ class DataQualityGuard:
             )
             logger.warning(
                 "Impossible stock state | SKU %s | Reserved %s > Available %s",
-                sku, reserved, available
+                sku, reserved, available, extra={"rule": "IMPOSSIBLE_STOCK"}
             )
             return False
 
         return True
 
+    # --------------------------------------------------
+    # BATCH (COLUMNAR) CHECKS - same rules, one call per table
+    # --------------------------------------------------
+    @traced("guard.package_compliance", kind="guard")
+    def check_package_compliance_batch(self, order_ids, skus, quantities):
+        """
+        Vectorised check_package_compliance. order_ids is one id for the whole
+        batch or one per row. Returns the boolean mask of compliant rows.
+        """
+        idx, known = self.product_limits.positions(skus)
+        qty, qty_valid = _ints(quantities)
+        current().set(rows=len(qty))
+        pack = np.where(known, self.product_limits.pack_size[idx], 1)
+        pack = np.where(pack == 0, 1, pack)
+
+        bad = known & qty_valid & (qty % pack != 0)
+        rows = np.flatnonzero(bad)
+        if len(rows):
+            sku_list = _column(skus, pa.string()).take(pa.array(rows)).to_pylist()
+            ids = [order_ids] * len(rows) if isinstance(order_ids, str) else \
+                _column(order_ids, pa.string()).take(pa.array(rows)).to_pylist()
+            details = [
+                f"Qty {q} is not a multiple of Pack Size {p} (Source: {s})"
+                for q, p, s in zip(qty[rows].tolist(), pack[rows].tolist(), sku_list)
+            ]
+            self.log_issues("INVALID_PACK_SIZE", ids, details, severity="MEDIUM")
+            self._warn_batch("INVALID_PACK_SIZE", "Invalid Package Size", len(rows),
+                             [f"{i} {s} qty {q} / {p}" for i, s, q, p in
+                              zip(ids, sku_list, qty[rows].tolist(), pack[rows].tolist())])
+        return known & ~bad
+
+    @traced("guard.order_magnitude", kind="guard")
+    def check_order_magnitude_batch(self, order_ids, skus, quantities):
+        """Vectorised check_order_magnitude (UNKNOWN_PRODUCT + ABNORMAL_DEMAND_SPIKE)."""
+        idx, known = self.product_limits.positions(skus)
+        qty, qty_valid = _ints(quantities)
+        current().set(rows=len(qty))
+        sku_col = _column(skus, pa.string())
+
+        unknown_rows = np.flatnonzero(~known)
+        if len(unknown_rows):
+            unknown_skus = sku_col.take(pa.array(unknown_rows)).to_pylist()
+            self.log_issues("UNKNOWN_PRODUCT", unknown_skus,
+                            ["SKU not found in Master Data."] * len(unknown_rows))
+            self._warn_batch("UNKNOWN_PRODUCT", "Unknown SKU detected", len(unknown_rows), [str(s) for s in unknown_skus])
+
+        max_allowed = np.where(known, self.product_limits.max[idx], 0)
+        spike = known & qty_valid & (qty > max_allowed)
+        rows = np.flatnonzero(spike)
+        if len(rows):
+            ids = [order_ids] * len(rows) if isinstance(order_ids, str) else \
+                _column(order_ids, pa.string()).take(pa.array(rows)).to_pylist()
+            sku_list = sku_col.take(pa.array(rows)).to_pylist()
+            details = [f"Qty {q} > Max {m}" for q, m in zip(qty[rows].tolist(), max_allowed[rows].tolist())]
+            self.log_issues("ABNORMAL_DEMAND_SPIKE", ids, details)
+            self._warn_batch("ABNORMAL_DEMAND_SPIKE", "Abnormal demand spike", len(rows),
+                             [f"{i} {s} {d}" for i, s, d in zip(ids, sku_list, details)])
+        return known & ~spike
+
+    @traced("guard.stock_logic", kind="guard")
+    def check_stock_logic_batch(self, skus, available, reserved):
+        """Vectorised check_stock_logic (IMPOSSIBLE_STOCK)."""
+        avail, avail_valid = _ints(available)
+        res, res_valid = _ints(reserved)
+        current().set(rows=len(avail))
+        bad = avail_valid & res_valid & (res > avail)
+        rows = np.flatnonzero(bad)
+        if len(rows):
+            sku_list = _column(skus, pa.string()).take(pa.array(rows)).to_pylist()
+            details = [f"Reserved {r} > Available {a}" for r, a in zip(res[rows].tolist(), avail[rows].tolist())]
+            self.log_issues("IMPOSSIBLE_STOCK", sku_list, details)
+            self._warn_batch("IMPOSSIBLE_STOCK", "Impossible stock state", len(rows),
+                             [f"{s} {d}" for s, d in zip(sku_list, details)])
+        return ~bad
+
     # --------------------------------------------------
     # REPORT EXPORT (BUSINESS AUDIT)
     # --------------------------------------------------
+    def summary(self):
+        """Run summary from the in-memory counters: [(rule, severity, count)]."""
+        return self.sink.summary()
+
     def save_report(self, base_output_dir="data/hdfs/logs/exceptions/"):
         """
-        Saves the report into a date-partitioned folder.
+        Flushes the buffered issues to Parquet and exports them as a CSV into a date-partitioned folder.
         Example:
         data/hdfs/logs/exceptions/date=2026-01-13/exceptions.csv
+        Returns the CSV path (None when there is nothing to save).
         """
 
-        if not self.errors:
+        flush_logs()  # "N more ... suppressed" lines of the run before its summary
+        if not len(self.sink):
             logger.info("No data-quality exceptions to save.")
-            return
+            return None
 
-        # 1. Hive-style partition directory
-        partition_dir = os.path.join(base_output_dir, f"date={self.batch_date}")
-        os.makedirs(partition_dir, exist_ok=True)
+        for rule, severity, count in self.summary():
+            logger.warning("Exceptions | %s [%s] : %d", rule, severity, count)
 
-        # 2. File path
-        full_path = os.path.join(partition_dir, "exceptions.csv")
-
-        # 3. Write CSV
+        full_path = os.path.join(base_output_dir, f"date={self.batch_date}", "exceptions.csv")
         try:
-            with open(full_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=self.errors[0].keys())
-                writer.writeheader()
-                writer.writerows(self.errors)
-
-            logger.warning("Exceptions report saved: %s", full_path)
+            self.sink.export_csv(full_path)
+            logger.warning("Exceptions report saved: %s (%d issues)", full_path, len(self.sink))
+            return full_path
 
         except Exception:
             logger.error("Failed to write exceptions report", exc_info=True)
+            return None
@@ -0,0 +1,227 @@
+import os
+import sys
+import math
+import argparse
+from collections import defaultdict
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import arrow_engine
+import hive_tables
+import procurement_rules
+
+# Parity check between the arrow engine and the Trino SQL semantics.
+#   1. A row-by-row Python transcription of the three stage queries (reference)
+#      is run next to arrow_engine on edge-case fixtures and on the day's RAW data.
+#   2. Optionally, the Parquet written by Trino for the same day is compared too.
+# Exit code 1 if any comparison differs.
+
+RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+
+
+# --------------------------------------------------
+# SQL REFERENCE (one Python statement per SQL clause)
+# --------------------------------------------------
+def sql_pack_size(package):
+    # pack_size of the compiled rules: first PACKAGE_RULES label contained, NULL / other -> 1
+    if package is None:
+        return 1
+    for pattern, size in procurement_rules.PACKAGE_RULES:
+        if pattern in package:
+            return size
+    return 1
+
+
+def sql_aggregate(orders):
+    # SELECT sku, sum(quantity) AS total_quantity ... GROUP BY sku  (SUM ignores NULL)
+    totals = {}
+    for row in orders:
+        qty = row["quantity"]
+        current = totals.get(row["sku"])
+        if qty is None:
+            totals.setdefault(row["sku"], None)
+        else:
+            totals[row["sku"]] = qty if current is None else current + qty
+    return [{"sku": sku, "total_quantity": total} for sku, total in totals.items()]
+
+
+def sql_net_demand(aggregated, stock, run_date):
+    # JOIN ON ao.sku = s.sku  (NULL keys never match, arithmetic with NULL is NULL)
+    stock_by_sku = defaultdict(list)
+    for s in stock:
+        if s["sku"] is not None:
+            stock_by_sku[s["sku"]].append(s)
+    rows = []
+    for ao in aggregated:
+        for s in stock_by_sku.get(ao["sku"], []):
+            values = (ao["total_quantity"], s["safety_quantity"], s["quantity_available"], s["quantity_reserved"])
+            demand = None if None in values else values[0] + values[1] - (values[2] - values[3])
+            rows.append({"run_date": run_date, "sku": ao["sku"], "net_demand": demand})
+    return rows
+
+
+def sql_supplier_orders(demand, products, run_date):
+    # CAST(CEILING(CAST(GREATEST(nd, r.moq) AS DOUBLE) / r.pack_size) * r.pack_size AS INTEGER),
+    # r = products compiled by procurement_rules (moq = COALESCE(moq, 1))
+    products_by_sku = defaultdict(list)
+    for p in products:
+        if p["sku"] is not None:
+            products_by_sku[p["sku"]].append(p)
+    rows = []
+    for nd in demand:
+        if nd["net_demand"] is None or not nd["net_demand"] > 0:
+            continue
+        for p in products_by_sku.get(nd["sku"], []):
+            pack = sql_pack_size(p["package"])
+            needed = max(nd["net_demand"], p["moq"] if p["moq"] is not None else 1)
+            quantity = int(math.ceil(float(needed) / pack) * pack)
+            rows.append({"run_date": run_date, "supplier_id": p["supplier_id"], "sku": nd["sku"], "quantity": quantity})
+    return rows
+
+
+# --------------------------------------------------
+# COMPARISON
+# --------------------------------------------------
+def _normalized(rows, keys):
+    return sorted((tuple(r[k] for k in keys) for r in rows), key=repr)
+
+
+def compare(label, expected_rows, actual, keys):
+    expected = _normalized(expected_rows, keys)
+    got = _normalized(actual.to_pylist() if isinstance(actual, pa.Table) else actual, keys)
+    if expected == got:
+        print(f"  [OK]   {label}: {len(got)} rows identical")
+        return True
+    missing = set(expected) - set(got)
+    extra = set(got) - set(expected)
+    print(f"  [DIFF] {label}: expected {len(expected)} rows, got {len(got)}")
+    for row in sorted(missing, key=repr)[:10]:
+        print(f"         - {row}")
+    for row in sorted(extra, key=repr)[:10]:
+        print(f"         + {row}")
+    return False
+
+
+def check_engines(label, orders, stock, products, run_date):
+    """Runs both implementations on the same inputs and compares the three outputs."""
+    print(f"\n--- {label} ---")
+    agg = arrow_engine.aggregate_orders(orders)
+    nd = arrow_engine.net_demand(agg, stock, run_date)
+    so = arrow_engine.supplier_orders(nd, procurement_rules.compile_rules(products), run_date)
+
+    ref_agg = sql_aggregate(orders.to_pylist())
+    ref_nd = sql_net_demand(ref_agg, stock.to_pylist(), run_date)
+    ref_so = sql_supplier_orders(ref_nd, products.to_pylist(), run_date)
+
+    return all([
+        compare("aggregated_orders", ref_agg, agg, ["sku", "total_quantity"]),
+        compare("net_demand", ref_nd, nd, ["run_date", "sku", "net_demand"]),
+        compare("supplier_orders", ref_so, so, ["run_date", "supplier_id", "sku", "quantity"]),
+    ])
+
+
+def fixture_tables(run_date):
+    """Edge cases of the SQL: NULLs, GREATEST vs MOQ, every package branch, missing joins."""
+    orders = pa.Table.from_pylist([
+        {"market_id": "MKT-1", "sku": "SKU-A", "quantity": 7, "timestamp": None},
+        {"market_id": "MKT-2", "sku": "SKU-A", "quantity": 5, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-B", "quantity": 40, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-C", "quantity": 1, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-D", "quantity": 250, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-E", "quantity": 13, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-F", "quantity": 9, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-G", "quantity": None, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-H", "quantity": 3, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-99999-GHOST", "quantity": 50, "timestamp": None},
+        {"market_id": "MKT-1", "sku": None, "quantity": 2, "timestamp": None},
+        {"market_id": "MKT-1", "sku": "SKU-Z", "quantity": 0, "timestamp": None},
+    ], schema=arrow_engine.ORDERS_SCHEMA)
+
+    def stock(sku, available, reserved, safety):
+        return {"run_date": run_date, "sku": sku, "quantity_available": available,
+                "quantity_reserved": reserved, "safety_quantity": safety, "location": "WH1"}
+
+    stock_rows = pa.Table.from_pylist([
+        stock("SKU-A", 10, 2, 5),     # 12 + 5 - 8 = 9 -> MOQ 10 -> Box of 6 -> 12
+        stock("SKU-B", 0, 0, 3),      # 43 -> Box of 12 -> 48
+        stock("SKU-C", 100, 0, 10),   # negative -> filtered
+        stock("SKU-D", 5, 5, 0),      # 250 -> Pallet -> 300
+        stock("SKU-E", 0, 0, 0),      # 13, MOQ NULL -> Box of 24 -> 24
+        stock("SKU-F", 0, 3, 1),      # reserved > available: 13 -> NULL package -> 13
+        stock("SKU-G", 0, 0, 5),      # NULL total -> NULL net demand
+        stock("SKU-H", 0, 0, None),   # NULL safety -> NULL net demand
+        stock("SKU-Z", 0, 0, 0),      # net demand 0 -> filtered
+        stock("SKU-X", 0, 0, 99),     # never ordered
+    ], schema=arrow_engine.STOCK_SCHEMA)
+
+    products = pa.Table.from_pylist([
+        {"sku": "SKU-A", "supplier_id": "SUP-1", "moq": 10, "package": "Box of 6"},
+        {"sku": "SKU-B", "supplier_id": "SUP-1", "moq": 10, "package": "Box of 12"},
+        {"sku": "SKU-C", "supplier_id": "SUP-2", "moq": 50, "package": "Single Unit"},
+        {"sku": "SKU-D", "supplier_id": "SUP-2", "moq": 100, "package": "Pallet"},
+        {"sku": "SKU-E", "supplier_id": "SUP-3", "moq": None, "package": "Box of 24"},
+        {"sku": "SKU-F", "supplier_id": "SUP-3", "moq": 1, "package": None},
+        {"sku": "SKU-G", "supplier_id": "SUP-3", "moq": 1, "package": "Box of 6"},
+        {"sku": "SKU-Z", "supplier_id": "SUP-4", "moq": 1, "package": "Box of 6"},
+    ], schema=arrow_engine.PRODUCTS_SCHEMA)
+    return orders, stock_rows, products
+
+
+def load_products(products_csv=None):
+    """Products (sku, supplier_id, moq, package) from a CSV or the master data cache."""
+    if products_csv:
+        import pandas as pd
+        df = pd.read_csv(products_csv, on_bad_lines="skip")
+        df.columns = [c.lower() for c in df.columns]
+        return pa.Table.from_pandas(df[arrow_engine.PRODUCTS_SCHEMA.names], schema=arrow_engine.PRODUCTS_SCHEMA,
+                                    preserve_index=False)
+    import master_data
+    return master_data.table("products").select(arrow_engine.PRODUCTS_SCHEMA.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arrow engine vs Trino SQL parity check")
+    parser.add_argument("--run-date", default=RUN_DATE)
+    parser.add_argument("--data-root", default=DATA_ROOT)
+    parser.add_argument("--products-csv", help="Products CSV instead of Postgres (sku, supplier_id, moq, package)")
+    parser.add_argument("--trino-output-root", help="Local mirror of the Trino outputs (same layout as HDFS)")
+    parser.add_argument("--fixtures-only", action="store_true")
+    args = parser.parse_args()
+
+    ok = check_engines("SQL edge-case fixtures", *fixture_tables(args.run_date), args.run_date)
+
+    if not args.fixtures_only:
+        orders = arrow_engine.read_avro_dir(
+            os.path.join(args.data_root, "raw/orders", args.run_date), arrow_engine.ORDERS_SCHEMA)
+        stock = arrow_engine.read_avro_dir(
+            os.path.join(args.data_root, "raw/stock", args.run_date), arrow_engine.STOCK_SCHEMA)
+        products = load_products(args.products_csv)
+        ok = check_engines(f"RAW data of {args.run_date}", orders, stock, products, args.run_date) and ok
+
+        if args.trino_output_root:
+            print(f"\n--- Trino Parquet outputs ({args.trino_output_root}) ---")
+            agg = arrow_engine.aggregate_orders(orders)
+            nd = arrow_engine.net_demand(agg, stock, args.run_date)
+            so = arrow_engine.supplier_orders(nd, procurement_rules.compile_rules(products), args.run_date)
+            # Fichiers d'une partition run_date : colonnes de données seulement (run_date = la partition)
+            for name, hive_table, table in [
+                ("aggregated_orders", hive_tables.AGGREGATED_ORDERS, agg),
+                ("net_demand", hive_tables.NET_DEMAND, nd),
+                ("supplier_orders", hive_tables.SUPPLIER_ORDERS, so),
+            ]:
+                keys = [c for c, _ in hive_table.columns]
+                trino_dir = os.path.join(args.trino_output_root, hive_table.location(args.run_date).strip("/"))
+                trino_files = [os.path.join(trino_dir, f) for f in sorted(os.listdir(trino_dir))
+                               if not f.startswith(".") and not f.endswith(".json")]
+                trino_table = pa.concat_tables([pq.read_table(f) for f in trino_files])
+                ok = compare(name, trino_table.to_pylist(), table, keys) and ok
+
+    print("\nPARITY OK" if ok else "\nPARITY FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
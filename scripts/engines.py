@@ -0,0 +1,15 @@
+import os
+
+# Execution engine for the three batch stages (aggregate / net demand / supplier orders).
+#   trino : INSERT statements into the run_date partitions on the Trino/Hive cluster (default)
+#   arrow : in-process PyArrow/NumPy engine (arrow_engine.py), no Trino round trips
+ENGINES = ("trino", "arrow")
+PIPELINE_ENGINE = os.getenv("PIPELINE_ENGINE", "trino")
+
+
+def resolve_engine(engine=None) -> str:
+    """Returns the engine to use for this run (argument > PIPELINE_ENGINE env)."""
+    name = (engine or PIPELINE_ENGINE).strip().lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown pipeline engine '{name}' (expected one of {ENGINES})")
+    return name
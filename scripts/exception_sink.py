@@ -0,0 +1,120 @@
+import os
+import csv
+import glob
+import shutil
+import threading
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Registre des anomalies du DataQualityGuard, borné en mémoire.
+# Les anomalies sont bufferisées en colonnes (une liste par colonne) et écrites en fichiers
+# Parquet au fil de l'eau dès que le buffer atteint GUARD_FLUSH_ROWS lignes :
+#   {exceptions_dir}/date={run_date}/parquet/part-00000.parquet, part-00001.parquet, ...
+# (même arborescence dans HDFS, lue par la table hive.default.exceptions). Un run qui meurt
+# garde les parts déjà écrites ; seuls les compteurs par règle / sévérité restent en mémoire.
+# Le CSV historique (date={run_date}/exceptions.csv) est un export relu depuis les parts.
+GUARD_FLUSH_ROWS = int(os.getenv("GUARD_FLUSH_ROWS", "50000"))
+
+EXCEPTIONS_SCHEMA = pa.schema([
+    ("timestamp", pa.string()),
+    ("batch_date", pa.string()),
+    ("rule_broken", pa.string()),
+    ("entity_id", pa.string()),
+    ("details", pa.string()),
+    ("severity", pa.string()),
+])
+COLUMNS = EXCEPTIONS_SCHEMA.names
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class ExceptionSink:
+    """
+    sink.add(rule, severity, timestamp, entity_ids, details) -> buffered, flushed by batches of flush_rows.
+    len(sink) = issues logged, sink.counts = Counter[(rule, severity)].
+    """
+
+    def __init__(self, batch_date, exceptions_dir, flush_rows=None):
+        self.batch_date = batch_date
+        self.parquet_dir = os.path.join(exceptions_dir, f"date={batch_date}", "parquet")
+        self.flush_rows = flush_rows or GUARD_FLUSH_ROWS
+        self.counts = Counter()
+        self.total = 0
+        self._buffer = {c: [] for c in COLUMNS}
+        self._buffered = 0
+        self._parts = 0
+        self._lock = threading.Lock()
+        # Un nouveau run de la date remplace ses anomalies (comme le CSV réécrit)
+        shutil.rmtree(self.parquet_dir, ignore_errors=True)
+
+    def __len__(self):
+        return self.total
+
+    def add(self, rule, severity, timestamp, entity_ids, details):
+        """One batch of violations of the same rule (entity_ids / details: same length)."""
+        entity_ids = [_text(e) for e in entity_ids]
+        details = [_text(d) for d in details]
+        n = len(entity_ids)
+        if not n:
+            return
+        with self._lock:
+            b = self._buffer
+            b["timestamp"] += [timestamp] * n
+            b["batch_date"] += [self.batch_date] * n
+            b["rule_broken"] += [rule] * n
+            b["entity_id"] += entity_ids
+            b["details"] += details
+            b["severity"] += [severity] * n
+            self._buffered += n
+            self.total += n
+            self.counts[(rule, severity)] += n
+            if self._buffered >= self.flush_rows:
+                self._flush()
+
+    def add_rows(self, rows):
+        """Issues as dicts (replayed from the stage cache manifests)."""
+        for row in rows:
+            self.add(row["rule_broken"], row["severity"], row["timestamp"], [row["entity_id"]], [row["details"]])
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        batch = pa.table(self._buffer, schema=EXCEPTIONS_SCHEMA)
+        os.makedirs(self.parquet_dir, exist_ok=True)
+        path = os.path.join(self.parquet_dir, f"part-{self._parts:05d}.parquet")
+        pq.write_table(batch, path + ".tmp")
+        os.replace(path + ".tmp", path)  # une part est complète ou absente
+        self._parts += 1
+        self._buffer = {c: [] for c in COLUMNS}
+        self._buffered = 0
+
+    def part_files(self):
+        """Parquet parts written so far (call flush() first to include the buffer)."""
+        return sorted(glob.glob(os.path.join(self.parquet_dir, "part-*.parquet")))
+
+    def iter_batches(self):
+        self.flush()
+        for path in self.part_files():
+            yield from pq.ParquetFile(path).iter_batches()
+
+    def export_csv(self, path):
+        """Streams every part into a CSV (header + rows), batch by batch."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for batch in self.iter_batches():
+                writer.writerows(zip(*(batch.column(c).to_pylist() for c in COLUMNS)))
+        return path
+
+    def summary(self):
+        """[(rule, severity, count)] by decreasing count."""
+        return [(rule, severity, n) for (rule, severity), n in self.counts.most_common()]
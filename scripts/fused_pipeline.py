@@ -0,0 +1,129 @@
+import os
+from trino_utils import stage_session
+import arrow_engine
+from engines import resolve_engine
+from run_context import RunContext
+import aggregate_orders
+import net_demand
+import supplier_orders
+import hive_tables
+import procurement_rules
+
+# Mode "fused" : agrégation + jointure stock + arrondi MOQ/colisage en UN seul plan
+# de requête, seule la partition supplier_orders est écrite. Les partitions intermédiaires
+# (aggregated_orders / net_demand) ne sont réécrites que si MATERIALIZE_INTERMEDIATE=1
+# (audit), sinon il n'y a ni INSERT ni suppression HDFS pour elles.
+
+PIPELINE_MODES = ("staged", "fused")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
+MATERIALIZE_INTERMEDIATE = os.getenv("MATERIALIZE_INTERMEDIATE", "0") == "1"
+
+
+def resolve_mode(mode=None) -> str:
+    name = (mode or PIPELINE_MODE).strip().lower()
+    if name not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{name}' (expected one of {PIPELINE_MODES})")
+    return name
+
+
+def fused_select(ctx) -> str:
+    """The three stage queries chained as CTEs (same SQL text as the staged mode)."""
+    return f"""
+    WITH ao AS ({aggregate_orders.agg_select(ctx)}),
+    nd AS ({net_demand.net_demand_select(ctx, "ao")})
+    {supplier_orders.supplier_orders_select(ctx, "nd")}
+    """
+
+
+def materialize_intermediates(ctx, cur, hdfs):
+    """Audit copies of aggregated_orders / net_demand, same partitions and paths as the staged mode."""
+    for table, select in [
+        (hive_tables.AGGREGATED_ORDERS, aggregate_orders.agg_select(ctx)),
+        (hive_tables.NET_DEMAND,
+         net_demand.net_demand_select(ctx, hive_tables.AGGREGATED_ORDERS.partition(ctx.run_date))),
+    ]:
+        print(f" Audit : matérialisation de {table.name} [run_date={ctx.run_date}]")
+        hive_tables.overwrite_partition(cur, hdfs, table, ctx.run_date, select)
+
+
+def main_arrow(ctx, hdfs, guard=None, materialize=False):
+    """Fused in-process plan: RAW Avro + stock + procurement rules -> supplier_orders only."""
+    run_date, data_root = ctx.run_date, ctx.data_root
+    print(f"Étapes 1-3 (arrow, fused) pour {run_date}")
+    orders = arrow_engine.read_avro_dir(os.path.join(data_root, "raw/orders", run_date), arrow_engine.ORDERS_SCHEMA)
+    stock = arrow_engine.read_avro_dir(os.path.join(data_root, "raw/stock", run_date), arrow_engine.STOCK_SCHEMA)
+    rules = procurement_rules.table()
+
+    aggregated = arrow_engine.aggregate_orders(orders)
+    demand = arrow_engine.net_demand(aggregated, stock, run_date)
+    orders_out = arrow_engine.supplier_orders(demand, rules, run_date)
+
+    if materialize:
+        arrow_engine.write_output(aggregated, data_root, hive_tables.AGGREGATED_ORDERS.location(run_date),
+                                  "aggregated_orders.parquet", hdfs)
+        arrow_engine.write_output(demand, data_root, hive_tables.NET_DEMAND.location(run_date),
+                                  "net_demand.parquet", hdfs)
+    hdfs_target_dir = f"/output/supplier_orders/{run_date}"
+    # Partition parquet/ remplacée par write_output, JSON synchronisés par export_supplier_json
+    arrow_engine.write_output(orders_out, data_root, hive_tables.SUPPLIER_ORDERS.location(run_date),
+                              "supplier_orders.parquet", hdfs)
+
+    supplier_orders.export_supplier_json(ctx, hdfs, arrow_engine.iter_rows(orders_out, supplier_orders.ORDER_COLUMNS))
+    print(f" Success! {orders_out.num_rows} order lines generated in HDFS: {hdfs_target_dir}")
+
+    if guard:
+        guard.check_order_magnitude_batch(f"AGG-{run_date}", aggregated["sku"], aggregated["total_quantity"])
+        print("Vérification de la cohérence des stocks...")
+        guard.check_stock_logic_batch(stock["sku"], stock["quantity_available"], stock["quantity_reserved"])
+        supplier_orders.check_package_compliance(
+            guard, run_date, orders_out["supplier_id"], orders_out["sku"], orders_out["quantity"])
+    return orders_out
+
+
+def main_trino(ctx, trino, cur, hdfs, guard=None, materialize=False, prepared=False):
+    """Stages 1-3 as one Trino INSERT (RAW partitions -> supplier_orders partition), optional audit partitions."""
+    # Partitions du jour sur les fichiers RAW (Avro) + dimension des règles d'achat
+    # (prepared : stock + règles déjà enregistrés par le DAG de l'orchestrateur)
+    aggregate_orders.register_raw_orders(cur, ctx, hdfs)
+    if not prepared:
+        net_demand.register_stock(cur, ctx)
+        procurement_rules.publish(hdfs, ctx.data_root, cur)
+
+    if materialize:
+        materialize_intermediates(ctx, cur, hdfs)
+
+    hdfs_target_dir = f"/output/supplier_orders/{ctx.run_date}"
+    table_dest = hive_tables.SUPPLIER_ORDERS
+
+    trino.invalidate(table_dest.name)
+
+    print(f"Étapes 1-3 (fused) : RAW -> {table_dest.name} en une seule requête")
+    hive_tables.overwrite_partition(cur, hdfs, table_dest, ctx.run_date, fused_select(ctx))
+
+    # Une seule lecture (par batches) partagée par l'export JSON et le contrôle des colis
+    lines = supplier_orders.export_trino_orders(ctx, trino, hdfs, "fused", guard)
+    print(f" Success! {lines} order lines generated in HDFS: {hdfs_target_dir}")
+
+    if guard:
+        # Contrôles sur les données sources (ou la copie d'audit si matérialisée) ; le contrôle
+        # MxOQ filtre dans Trino, seules les lignes en infraction sont lues par le client
+        aggregated = hive_tables.AGGREGATED_ORDERS.partition(ctx.run_date) if materialize \
+            else f"({aggregate_orders.agg_select(ctx)})"
+        aggregate_orders.check_order_magnitude(cur, guard, ctx, aggregated)
+        net_demand.check_stock_anomalies(cur, guard, ctx)
+
+
+def main(guard=None, engine=None, materialize=None, session=None, ctx=None, prepared=False):
+    ctx = ctx or RunContext.from_env()
+    hdfs = ctx.hdfs()
+    materialize = MATERIALIZE_INTERMEDIATE if materialize is None else materialize
+    if resolve_engine(engine) == "arrow":
+        return main_arrow(ctx, hdfs, guard, materialize)
+
+    # Session Trino du run (ou privée si l'étape est lancée seule) : schémas créés une seule fois
+    with stage_session(session) as trino, trino.cursor("fused") as cur:
+        return main_trino(ctx, trino, cur, hdfs, guard, materialize, prepared)
+
+
+if __name__ == "__main__":
+    main()
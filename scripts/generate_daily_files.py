@@ -1,148 +1,221 @@
 import os
 import random
-import pandas as pd
-from datetime import date
-from hdfs_client import WebHDFSClient
-from pg_client import read_sql_df
+import asyncio
+from storage import raise_for_failures
+from async_hdfs_client import AsyncWebHDFSClient, HDFS_ASYNC
+from concurrent.futures import ProcessPoolExecutor
+from avro_stream import AvroStream, AvroBytes, ORDERS_AVRO_SCHEMA, STOCK_AVRO_SCHEMA, encode_avro, sync_marker_for
+import master_data
 import json
-import pandavro as pdx  # pip install pandavro
-from trino.dbapi import connect
-from trino_utils import ensure_schema
-
-DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
-RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
+from trino_utils import stage_session
+from engines import resolve_engine
+from run_context import RunContext
+import compaction
 
 MAX_SKUS_PER_MARKET = int(os.getenv("MAX_SKUS_PER_MARKET", "40"))
 LOCATIONS = os.getenv("LOCATIONS", "WH1,WH2,WH3").split(",")
+# Local copy of the RAW files under DATA_ROOT (needed by PIPELINE_ENGINE=arrow); 0 = HDFS only
+WRITE_LOCAL_COPY = os.getenv("WRITE_LOCAL_COPY", "1") == "1"
+# Processus pour la génération des fichiers marchés (1 = dans le processus courant)
+GEN_WORKERS = int(os.getenv("GEN_WORKERS", str(os.cpu_count() or 1)))
 
 # PROBABILITIES (The Chaos Factors)
 PROB_MISSING_FILE = 0.10  # 10% chance a market forgets to send file
 PROB_GHOST_SKU = 0.05     # 5% chance they sell an unknown product
 
 
-def main():
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
-
-    # Create schemas for orders and stock
-    ensure_schema("raw_orders")
-    ensure_schema("raw_stock")
-
-    # --- master data depuis Postgres ---
-    df_markets = read_sql_df("SELECT market_id FROM market;")
-    df_products = read_sql_df("SELECT sku, supplier_id, moq, package FROM products;")
+def build_streams(ctx, session=None):
+    """
+    Fichiers RAW de ctx.run_date (stock + orders par marché) sous forme de flux Avro.
+    Générateur de (AvroStream, hdfs_path) : le stock d'abord, puis chaque marché dès qu'il est
+    généré, pour que put_stream_many commence les uploads sans attendre le dernier marché.
+    Les octets du stock sont encodés pendant l'upload.
+    """
+    # Create schemas for orders and stock (Trino only, the arrow engine reads the files directly)
+    if resolve_engine() == "trino":
+        with stage_session(session) as trino:
+            trino.bootstrap()  # raw_orders / raw_stock inclus, une seule fois par run
+
+    # --- master data (snapshot local partagé, voir master_data.py) ---
+    df_markets = master_data.df("market", ["market_id"])
+    df_products = master_data.df("products", ["sku", "supplier_id", "moq", "package"])
     
     market_ids = df_markets["market_id"].dropna().unique().tolist()
     valid_skus = df_products["sku"].dropna().unique().tolist()
 
+    run_date = ctx.run_date
+    hdfs_orders_dir = f"/raw/orders/{run_date}"
+
+    local_dir_orders = os.path.join(ctx.data_root, "raw/orders", run_date)
+    local_dir_stock = os.path.join(ctx.data_root, "raw/stock", run_date)
+
+    # =========================================================
+    # ===================== RAW STOCK =========================
+    # =========================================================
+    # ---- LOCAL (optionnel) + HDFS ; envoyé pendant la génération des marchés ----
+    local_stock = os.path.join(local_dir_stock, "stock.avro") if WRITE_LOCAL_COPY else None
+    hdfs_stock_path = f"/raw/stock/{run_date}/stock.avro"
+    yield (AvroStream(STOCK_AVRO_SCHEMA, lambda: iter_stock_rows(valid_skus, run_date), local_stock,
+                      sync_marker=sync_marker_for(f"stock-{run_date}")), hdfs_stock_path)
+
     # =========================================================
     # =============== RAW ORDERS (PER MARKET) =================
     # =========================================================
+    print(f" Processing {len(market_ids)} markets on {GEN_WORKERS} worker(s)...")
+    # Results come back in market order, whatever the number of workers
+    for market_id, payload, events in generate_markets(market_ids, valid_skus, run_date):
+        for event in events:
+            print(event)
+        if payload is None:
+            continue
 
-    # We use the date as seed so every run for the SAME DATE produces SAME errors
-    random.seed(f"chaos-{RUN_DATE}")
+        filename = f"orders_{market_id}.avro"
+        local_path = os.path.join(local_dir_orders, filename) if WRITE_LOCAL_COPY else None
+        yield AvroBytes(payload, local_path), f"{hdfs_orders_dir}/{filename}"
 
-    hdfs_orders_dir = f"/raw/orders/{RUN_DATE}"
-    hdfs.mkdirs(hdfs_orders_dir)
 
-    local_dir_orders = os.path.join(DATA_ROOT, "raw/orders", RUN_DATE)
-    local_dir_stock = os.path.join(DATA_ROOT, "raw/stock", RUN_DATE)
-    os.makedirs(local_dir_orders, exist_ok=True)
-    os.makedirs(local_dir_stock, exist_ok=True)
+def market_seed(run_date, market_id):
+    # One seed per (date, market): every run for the SAME DATE produces SAME errors,
+    # independently of the order in which the markets are processed
+    return f"chaos-{run_date}-{market_id}"
 
-    print(f" Processing {len(market_ids)} markets...")
 
-    for market_id in market_ids:
+_WORKER_SKUS = None
 
-        # --- CHAOS 1: MISSING FILE ---
-        # Roll the dice: Does this market send the file today?
-        if random.random() < PROB_MISSING_FILE:
-            print(f" [Simulated Error] Market {market_id} did NOT send a file.")
-            continue  # Skip to next market
 
-        orders_rows = []
+def _init_worker(valid_skus):
+    global _WORKER_SKUS
+    _WORKER_SKUS = valid_skus
 
-        sold_skus = random.sample(valid_skus, k=min(MAX_SKUS_PER_MARKET, len(valid_skus)))
 
+def generate_market(task):
+    """
+    Worker : (run_date, market_id) -> (market_id, fichier Avro en bytes ou None, messages).
+    Les messages sont affichés par le parent, dans l'ordre des marchés.
+    """
+    run_date, market_id = task
+    seed = market_seed(run_date, market_id)
+    rng = random.Random(seed)
+    events = []
 
-        for sku in sold_skus:
-            qty = random.randint(1, 12)
-            orders_rows.append({
-                "market_id": market_id,
-                "sku": sku,
-                "quantity": qty,
-                "timestamp": f"{RUN_DATE}T10:00:00"
-            })
+    # --- CHAOS 1: MISSING FILE ---
+    # Roll the dice: Does this market send the file today?
+    if rng.random() < PROB_MISSING_FILE:
+        events.append(f" [Simulated Error] Market {market_id} did NOT send a file.")
+        return market_id, None, events
 
-        # --- CHAOS 2: GHOST SKU (Unknown Product) ---
-        if random.random() < PROB_GHOST_SKU:
-            print(f"[Simulated Error] Market {market_id} sold a Ghost SKU.")
-            orders_rows.append({
-                "market_id": market_id,
-                "sku": "SKU-99999-GHOST",  # Not in Postgres
-                "quantity": 50,
-                "timestamp": f"{RUN_DATE}T12:00:00"
-            })
+    orders_rows = []
+    sold_skus = rng.sample(_WORKER_SKUS, k=min(MAX_SKUS_PER_MARKET, len(_WORKER_SKUS)))
+    for sku in sold_skus:
+        orders_rows.append({
+            "market_id": market_id,
+            "sku": sku,
+            "quantity": rng.randint(1, 12),
+            "timestamp": f"{run_date}T10:00:00"
+        })
 
-        # Define Paths
-        filename = f"orders_{market_id}.avro"
-        local_path = os.path.join(local_dir_orders, filename)
-        hdfs_path = f"{hdfs_orders_dir}/{filename}"
-
-        # ---  GENERATE VALID AVRO ---
-        if orders_rows:
-            df_market = pd.DataFrame(orders_rows)
-            pdx.to_avro(local_path, df_market)
-                
-            # --- UPLOAD TO HDFS ---
-            if hdfs.exists(hdfs_path):
-                print(f" Skipping existing: {filename}")
-            else:
-                hdfs.put_file(local_path, hdfs_path, overwrite=False)
-                print(f" Uploaded {filename} [OK]")
-        else:
-            print(f" Market {market_id} had 0 orders.")
-            
+    # --- CHAOS 2: GHOST SKU (Unknown Product) ---
+    if rng.random() < PROB_GHOST_SKU:
+        events.append(f"[Simulated Error] Market {market_id} sold a Ghost SKU.")
+        orders_rows.append({
+            "market_id": market_id,
+            "sku": "SKU-99999-GHOST",  # Not in Postgres
+            "quantity": 50,
+            "timestamp": f"{run_date}T12:00:00"
+        })
 
+    if not orders_rows:
+        events.append(f" Market {market_id} had 0 orders.")
+        return market_id, None, events
 
-    # =========================================================
-    # ===================== RAW STOCK =========================
-    # =========================================================
-    random.seed("stock-" + RUN_DATE)
+    # ---  GENERATE VALID AVRO (sync marker dérivé du seed -> fichier identique octet par octet) ---
+    return market_id, encode_avro(ORDERS_AVRO_SCHEMA, orders_rows, sync_marker_for(seed)), events
+
+
+def generate_markets(market_ids, valid_skus, run_date, workers=None):
+    """
+    Génère les fichiers de tous les marchés sur un pool de processus. Générateur : chaque résultat
+    est rendu dès que lui et ceux qui le précèdent sont prêts, dans l'ordre de market_ids.
+    """
+    workers = workers or GEN_WORKERS
+    tasks = [(run_date, market_id) for market_id in market_ids]
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(valid_skus)
+        yield from map(generate_market, tasks)
+        return
+
+    chunksize = max(1, len(tasks) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(valid_skus,)) as pool:
+        yield from pool.map(generate_market, tasks, chunksize=chunksize)
 
-    stock_rows = []
+
+def iter_stock_rows(valid_skus, run_date):
+    """Lignes de stock une par une (même séquence que random.seed("stock-" + run_date))."""
+    rng = random.Random("stock-" + run_date)
     for sku in valid_skus:
-        available = random.randint(0, 200)
-        reserved = random.randint(0, min(50, available))
-        safety = random.randint(5, 40)
-        stock_rows.append({
-            "run_date": RUN_DATE,
+        available = rng.randint(0, 200)
+        reserved = rng.randint(0, min(50, available))
+        safety = rng.randint(5, 40)
+        yield {
+            "run_date": run_date,
             "sku": sku,
             "quantity_available": available,
             "quantity_reserved": reserved,
             "safety_quantity": safety,
-            "location": random.choice(LOCATIONS)
-        })
-
-    df_stock = pd.DataFrame(stock_rows)
-
-    # ---- LOCAL ----
-    local_stock = os.path.join(local_dir_stock, "stock.avro")
-    pdx.to_avro(local_stock, df_stock)
-
-    # ---- HDFS ----
-    hdfs_stock_dir = f"/raw/stock/{RUN_DATE}"
-    hdfs.mkdirs(hdfs_stock_dir)
-
-    hdfs_stock_path = f"{hdfs_stock_dir}/stock.avro"
+            "location": rng.choice(LOCATIONS)
+        }
+
+
+def collect(uploads, streams):
+    """Passes the streams through as they are generated, keeping them in `uploads` for report_uploads."""
+    for upload in streams:
+        uploads.append(upload)
+        yield upload
+
+
+def report_uploads(uploads, results):
+    for (stream, _), r in zip(uploads, results):
+        if r.status == "skipped":
+            print(f" Skipping identical: {r.hdfs_path}")
+            # Déjà dans HDFS : le flux n'a pas été consommé, on écrit quand même la copie locale
+            if stream.local_path:
+                stream.write_local()
+        elif r.ok:
+            print(f" Uploaded {r.hdfs_path} [OK]")
+    raise_for_failures(results, "upload")
+
+
+def main(session=None, ctx=None):
+    ctx = ctx or RunContext.from_env()
+    if HDFS_ASYNC and ctx.storage == "webhdfs":
+        return asyncio.run(main_async(session, ctx))
+
+    hdfs = ctx.hdfs()
+
+    # Partition déjà compactée (compaction.py) : les parts sont retirées et la partition Hive
+    # repointée sur {date} avant de renvoyer tous les fichiers marchés
+    compaction.invalidate(hdfs, compaction.RAW_ORDERS, ctx.run_date, session)
+    hdfs.mkdirs(f"/raw/orders/{ctx.run_date}")
+    hdfs.mkdirs(f"/raw/stock/{ctx.run_date}")
+    # Upload en parallèle, au fil de la génération ; un fichier déjà dans HDFS avec le même sha256
+    # n'est pas renvoyé (un fichier tronqué ou périmé est remplacé)
+    uploads = []
+    results = hdfs.put_stream_many(collect(uploads, build_streams(ctx, session)), overwrite=True, skip_identical=True)
+    report_uploads(uploads, results)
+
+
+async def main_async(session=None, ctx=None):
+    """Même chose que main() avec le client asyncio (milliers de fichiers en vol)."""
+    ctx = ctx or RunContext.from_env()
+    # Tous les flux d'abord : la génération (pool de processus) bloquerait la boucle asyncio
+    uploads = list(build_streams(ctx, session))
+    with ctx.hdfs() as hdfs:
+        compaction.invalidate(hdfs, compaction.RAW_ORDERS, ctx.run_date, session)
+
+    async with AsyncWebHDFSClient(ctx.hdfs_base_url, user=ctx.hdfs_user) as hdfs:
+        await asyncio.gather(hdfs.mkdirs(f"/raw/orders/{ctx.run_date}"), hdfs.mkdirs(f"/raw/stock/{ctx.run_date}"))
+        report_uploads(uploads, await hdfs.put_stream_many(uploads, overwrite=True, skip_identical=True))
 
-    if hdfs.exists(hdfs_stock_path):
-        print(f" Stock file already exists: {hdfs_stock_path}")
-    else:
-        hdfs.put_file(local_stock, hdfs_stock_path, overwrite=False)
-        print(f"[OK] HDFS stock -> {hdfs_stock_path}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from avro_stream import ORDERS_AVRO_SCHEMA, STOCK_AVRO_SCHEMA, iter_avro_chunks, sync_marker_for
+from generate_daily_files import PROB_MISSING_FILE, PROB_GHOST_SKU, LOCATIONS
+
+# Scale-factor driven synthetic data (TPC style) for load tests and cluster sizing.
+# Same layouts as generate_master_data.py (CSV for Postgres) and generate_daily_files.py
+# (one Avro per market under raw/orders/{date}, raw/stock/{date}/stock.avro).
+#
+#   SF = 1  ->  1,000 suppliers, 1,000 markets, 100,000 SKUs, ~1,000,000 order lines / day
+#
+#   python scripts/generate_scale_data.py --scale-factor 1 --days 3 --upload
+#
+# Every table is drawn with NumPy in bulk from a seeded Generator: same seed + same SF
+# = same files. SKU popularity is Zipfian (--skew) and markets come in size tiers.
+
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
+
+SUPPLIERS_PER_SF = 1_000
+MARKETS_PER_SF = 1_000
+PRODUCTS_PER_SF = 100_000
+ORDER_LINES_PER_SF = 1_000_000
+
+# (market type, share of the markets, relative daily volume)
+MARKET_TIERS = [
+    ("Superstore", 0.15, 4.0),
+    ("Click & Collect", 0.35, 1.0),
+    ("Express", 0.50, 0.35),
+]
+
+CATEGORIES = ['Dairy', 'Bakery', 'Canned Goods', 'Beverages', 'Cleaning', 'Produce', 'Meat']
+PACKAGE_TYPES = ['Box of 6', 'Box of 12', 'Box of 24', 'Single Unit', 'Pallet']
+COUNTRIES = ['France', 'Morocco', 'Spain', 'Germany', 'Italy', 'Portugal', 'Belgium', 'Netherlands']
+WORDS = ['Smile', 'Power', 'Fresh', 'Golden', 'Prime', 'Natural', 'Classic', 'Royal', 'Green', 'Pure',
+         'Sun', 'Ocean', 'Mountain', 'Urban', 'Happy', 'Daily', 'Crisp', 'Bright', 'Silver', 'Wild']
+
+
+def scaled(per_sf, scale_factor):
+    return max(1, int(round(per_sf * scale_factor)))
+
+
+def make_ids(prefix, count, min_width):
+    """SUP-001 / MKT-001 / SKU-0001 ... (zero padding widened when the count needs it)."""
+    width = max(min_width, len(str(count)))
+    return np.char.add(f"{prefix}-", np.char.zfill(np.arange(1, count + 1).astype(str), width))
+
+
+def zipf_weights(count, skew, rng):
+    """Zipfian popularity over `count` items, ranks shuffled so popularity is not tied to the id."""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+# =========================================================
+# ================ MASTER DATA (CSV) ======================
+# =========================================================
+def generate_master(scale_factor, seed):
+    rng = np.random.default_rng([seed, 0])
+    n_suppliers = scaled(SUPPLIERS_PER_SF, scale_factor)
+    n_markets = scaled(MARKETS_PER_SF, scale_factor)
+    n_products = scaled(PRODUCTS_PER_SF, scale_factor)
+
+    supplier_ids = make_ids("SUP", n_suppliers, 3)
+    suppliers = pd.DataFrame({
+        "supplier_id": supplier_ids,
+        "name": np.char.add(np.char.add(rng.choice(WORDS, n_suppliers), " Supply "), supplier_ids),
+        "country": rng.choice(COUNTRIES, n_suppliers),
+        "contact_email": np.char.add(np.char.lower(supplier_ids), "@suppliers.example.com"),
+        "location": np.char.add("City ", rng.integers(1, 500, n_suppliers).astype(str)),
+    })
+
+    market_ids = make_ids("MKT", n_markets, 3)
+    tier_names = np.array([t[0] for t in MARKET_TIERS])
+    tier = rng.choice(len(MARKET_TIERS), n_markets, p=[t[1] for t in MARKET_TIERS])
+    markets = pd.DataFrame({
+        "market_id": market_ids,
+        "location": np.char.add(rng.integers(1, 9999, n_markets).astype(str), " Market Street"),
+        "type": tier_names[tier],
+    })
+
+    skus = make_ids("SKU", n_products, 4)
+    moq = rng.choice([10, 50, 100], n_products)
+    products = pd.DataFrame({
+        "sku": skus,
+        "name": np.char.add(np.char.add("Product ", rng.choice(WORDS, n_products)),
+                            np.char.add(" ", rng.integers(1, 101, n_products).astype(str))),
+        "category": rng.choice(CATEGORIES, n_products),
+        "unit_price": np.round(rng.uniform(2.50, 150.00, n_products), 2),
+        # Suppliers are skewed too: a few big suppliers carry most of the catalogue
+        "supplier_id": supplier_ids[rng.choice(n_suppliers, n_products, p=zipf_weights(n_suppliers, 0.8, rng))],
+        "MOQ": moq,
+        "MxOQ": moq * rng.integers(5, 21, n_products),
+        "package": rng.choice(PACKAGE_TYPES, n_products),
+        "leadtime": rng.integers(1, 15, n_products),
+    })
+    return suppliers, markets, products
+
+
+def write_master(suppliers, markets, products, csv_dir):
+    os.makedirs(csv_dir, exist_ok=True)
+    suppliers.to_csv(f"{csv_dir}/suppliers.csv", index=False)
+    markets.to_csv(f"{csv_dir}/market.csv", index=False)
+    products.to_csv(f"{csv_dir}/products.csv", index=False)
+    print(f"✔ {len(suppliers)} suppliers, {len(markets)} markets, {len(products)} products -> {csv_dir}")
+
+
+# =========================================================
+# ================= DAILY RAW (AVRO) ======================
+# =========================================================
+def write_avro(path, schema, records, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for chunk in iter_avro_chunks(schema, records, sync_marker=sync_marker_for(seed)):
+            f.write(chunk)
+    return os.path.getsize(path)
+
+
+def generate_day(run_date, markets, products, scale_factor, skew, seed, data_root):
+    """Orders (one Avro per market) + stock for one date. Returns the stats of the day."""
+    rng = np.random.default_rng([seed, int(run_date.replace("-", ""))])
+    market_ids = markets["market_id"].to_numpy()
+    skus = products["sku"].to_numpy()
+    n_markets, n_products = len(market_ids), len(skus)
+    total_lines = scaled(ORDER_LINES_PER_SF, scale_factor)
+
+    # --- volume per market : tier weight x lognormal noise, lines split by multinomial ---
+    volume = dict((name, weight) for name, _, weight in MARKET_TIERS)
+    weights = markets["type"].map(volume).fillna(1.0).to_numpy() * rng.lognormal(0.0, 0.3, n_markets)
+    lines_per_market = rng.multinomial(total_lines, weights / weights.sum())
+
+    # --- chaos, drawn per market like generate_daily_files ---
+    missing = rng.random(n_markets) < PROB_MISSING_FILE
+    ghost = rng.random(n_markets) < PROB_GHOST_SKU
+    lines_per_market[missing] = 0
+
+    # --- order lines : Zipfian SKU popularity, same quantity range as the daily generator ---
+    popularity = zipf_weights(n_products, skew, rng)
+    n_lines = int(lines_per_market.sum())
+    sku_idx = rng.choice(n_products, n_lines, p=popularity)
+    quantity = rng.integers(1, 13, n_lines)
+
+    orders_dir = os.path.join(data_root, "raw/orders", run_date)
+    bytes_written, files = 0, 0
+    timestamp, ghost_timestamp = f"{run_date}T10:00:00", f"{run_date}T12:00:00"
+    bounds = np.concatenate([[0], np.cumsum(lines_per_market)])
+    sku_col, qty_col = skus[sku_idx].tolist(), quantity.tolist()
+    for m, market_id in enumerate(market_ids):
+        if missing[m]:
+            continue
+        start, end = bounds[m], bounds[m + 1]
+        records = [{"market_id": market_id, "sku": sku, "quantity": qty, "timestamp": timestamp}
+                   for sku, qty in zip(sku_col[start:end], qty_col[start:end])]
+        if ghost[m]:
+            records.append({"market_id": market_id, "sku": "SKU-99999-GHOST", "quantity": 50,
+                            "timestamp": ghost_timestamp})
+        if records:
+            bytes_written += write_avro(os.path.join(orders_dir, f"orders_{market_id}.avro"),
+                                        ORDERS_AVRO_SCHEMA, records, f"scale-{seed}-{run_date}-{market_id}")
+            files += 1
+
+    # --- stock : one row per SKU, sized on the expected demand so hot SKUs are not always short ---
+    expected = popularity * n_lines * 6.5
+    available = rng.integers(0, 201, n_products) + np.round(expected * rng.uniform(0.0, 1.5, n_products)).astype(np.int64)
+    reserved = np.floor(rng.random(n_products) * (np.minimum(50, available) + 1)).astype(np.int64)
+    safety = rng.integers(5, 41, n_products)
+    location = rng.choice(LOCATIONS, n_products)
+    stock_records = ({"run_date": run_date, "sku": s, "quantity_available": a, "quantity_reserved": r,
+                      "safety_quantity": q, "location": loc}
+                     for s, a, r, q, loc in zip(skus.tolist(), available.tolist(), reserved.tolist(),
+                                                safety.tolist(), location.tolist()))
+    bytes_written += write_avro(os.path.join(data_root, "raw/stock", run_date, "stock.avro"),
+                                STOCK_AVRO_SCHEMA, stock_records, f"scale-stock-{seed}-{run_date}")
+
+    return {
+        "run_date": run_date,
+        "order_lines": n_lines + int(ghost[~missing].sum()),
+        "order_files": files,
+        "missing_markets": int(missing.sum()),
+        "ghost_markets": int(ghost[~missing].sum()),
+        "stock_rows": n_products,
+        "bytes": bytes_written,
+        # Share of the lines on the 1% most popular SKUs (how skewed the day is)
+        "top1pct_sku_share": round(float(np.sort(popularity)[::-1][:max(1, n_products // 100)].sum()), 4),
+    }
+
+
+def upload_day(run_date, data_root):
+    """Uploads the RAW files of one date to the storage backend (same paths as generate_daily_files)."""
+    from run_context import RunContext
+    from storage import raise_for_failures
+
+    uploads = []
+    with RunContext.from_env(run_date).hdfs() as hdfs:
+        for kind in ("orders", "stock"):
+            local_dir = os.path.join(data_root, "raw", kind, run_date)
+            hdfs.mkdirs(f"/raw/{kind}/{run_date}")
+            uploads += [(os.path.join(local_dir, name), f"/raw/{kind}/{run_date}/{name}")
+                        for name in sorted(os.listdir(local_dir))]
+        raise_for_failures(hdfs.put_many(uploads, overwrite=True), "upload")
+    print(f" Uploaded {len(uploads)} files for {run_date} to HDFS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale-factor synthetic dataset (master CSV + daily Avro)")
+    parser.add_argument("--scale-factor", type=float, default=1.0)
+    parser.add_argument("--run-date", default=RUN_DATE, help="first date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of SKU popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-root", default=DATA_ROOT)
+    parser.add_argument("--csv-dir", help="master data CSV dir (default: DATA_ROOT/postgres_load)")
+    parser.add_argument("--upload", action="store_true", help="also upload the RAW files to HDFS")
+    parser.add_argument("--output", help="write the generation stats as JSON to this file")
+    args = parser.parse_args()
+
+    csv_dir = args.csv_dir or os.path.join(args.data_root, "postgres_load")
+    print(f"--- Scale factor {args.scale_factor} (seed {args.seed}, skew {args.skew}) ---")
+
+    start = time.perf_counter()
+    suppliers, markets, products = generate_master(args.scale_factor, args.seed)
+    write_master(suppliers, markets, products, csv_dir)
+
+    days = []
+    first = date.fromisoformat(args.run_date)
+    for offset in range(args.days):
+        run_date = (first + timedelta(days=offset)).isoformat()
+        day_start = time.perf_counter()
+        stats = generate_day(run_date, markets, products, args.scale_factor, args.skew, args.seed, args.data_root)
+        stats["seconds"] = round(time.perf_counter() - day_start, 3)
+        print(f"✔ {run_date}: {stats['order_lines']:,} order lines in {stats['order_files']} files, "
+              f"{stats['bytes'] / 1e6:.1f} MB, {stats['seconds']}s")
+        if args.upload:
+            upload_day(run_date, args.data_root)
+        days.append(stats)
+
+    report = {
+        "scale_factor": args.scale_factor,
+        "seed": args.seed,
+        "skew": args.skew,
+        "suppliers": len(suppliers),
+        "markets": len(markets),
+        "products": len(products),
+        "days": days,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"\n Generation Complete ({report['seconds']}s). Load the CSVs with setup_db.sh (CSV_DIR={csv_dir}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,157 @@
 import os
+import time
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from tracing import span, propagate, counted, current
+from storage import Storage, FileStatus, sha256_file, sha256_stream, hashing
+
+# Connection pool / retry settings (one keep-alive pool per host: namenode + each datanode)
+HDFS_POOL_SIZE = int(os.getenv("HDFS_POOL_SIZE", "16"))
+HDFS_RETRIES = int(os.getenv("HDFS_RETRIES", "3"))
+HDFS_BACKOFF = float(os.getenv("HDFS_BACKOFF", "0.5"))  # seconds, doubled at each retry
+# Listing by pages of the namenode's dfs.ls.limit (LISTSTATUS_BATCH) instead of one LISTSTATUS
+HDFS_LIST_BATCH = os.getenv("HDFS_LIST_BATCH", "0") == "1"
+# Files of at least HDFS_RANGE_THRESHOLD bytes are downloaded as OPEN offset/length ranges in parallel
+HDFS_RANGE_SIZE = int(os.getenv("HDFS_RANGE_SIZE", str(32 * 1024 * 1024)))
+HDFS_RANGE_THRESHOLD = int(os.getenv("HDFS_RANGE_THRESHOLD", str(64 * 1024 * 1024)))
+HDFS_RANGE_WORKERS = int(os.getenv("HDFS_RANGE_WORKERS", "4"))
+# Files of at least HDFS_CHUNKED_THRESHOLD bytes are uploaded as CREATE + one APPEND per chunk (resumable)
+HDFS_CHUNK_SIZE = int(os.getenv("HDFS_CHUNK_SIZE", str(64 * 1024 * 1024)))
+HDFS_CHUNKED_THRESHOLD = int(os.getenv("HDFS_CHUNKED_THRESHOLD", str(256 * 1024 * 1024)))
+
+# Extended attributes of the uploaded files (dropped by HDFS when another writer replaces the file)
+DIGEST_XATTR = "user.sha256"          # sha256 of the content, set once an upload is complete
+PENDING_XATTR = "user.upload.sha256"  # sha256 of the content being appended (chunked upload in progress)
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class RetryableHTTPError(requests.HTTPError):
+    """5xx answer from the namenode/datanode: the operation is retried."""
+
+
+def _length_sha256(chunks) -> tuple:
+    h, length = hashlib.sha256(), 0
+    for chunk in chunks:
+        h.update(chunk)
+        length += len(chunk)
+    return length, h.hexdigest()
+
+
+def webhdfs_url(base_url: str, user: str, hdfs_path: str, op: str, extra: str = "") -> str:
+    """URL of a WebHDFS operation (shared by the sync and asyncio clients)."""
+    safe_path = "/".join(quote(p) for p in hdfs_path.strip("/").split("/"))
+    url = f"{base_url}/webhdfs/v1/{safe_path}?op={op}&user.name={quote(user)}"
+    if extra:
+        url += "&" + extra
+    return url
+
 
 #WebHDFS REST API
-class WebHDFSClient:
-    def __init__(self, base_url: str, user: str = "root"):
+class WebHDFSClient(Storage):
+    kind = "hdfs"
+
+    def __init__(self, base_url: str, user: str = "root", pool_size: int = HDFS_POOL_SIZE,
+                 retries: int = HDFS_RETRIES, backoff: float = HDFS_BACKOFF):
         self.base_url = base_url.rstrip("/")
         self.user = user
+        self.retries = retries
+        self.backoff = backoff
+        # One Session = keep-alive connections reused for every call (namenode AND the
+        # datanodes we are redirected to). Retries are done by _call so that an upload
+        # re-opens its file instead of re-sending a half-consumed stream.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
     #Internal URL builder
     def _url(self, hdfs_path: str, op: str, extra: str = "") -> str:
-        safe_path = "/".join(quote(p) for p in hdfs_path.strip("/").split("/"))
-        url = f"{self.base_url}/webhdfs/v1/{safe_path}?op={op}&user.name={quote(self.user)}"
-        if extra:
-            url += "&" + extra
-        return url
+        return webhdfs_url(self.base_url, self.user, hdfs_path, op, extra)
+
+    #Internal retry loop (connection errors, timeouts and 5xx), exponential backoff
+    def _call(self, fn):
+        for attempt in range(self.retries + 1):
+            try:
+                return fn()
+            except (requests.ConnectionError, requests.Timeout, RetryableHTTPError):
+                if attempt == self.retries:
+                    raise
+                current().add(retries=1)
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        r = self.session.request(method, url, **kwargs)
+        if r.status_code in RETRY_STATUSES:
+            r.close()
+            raise RetryableHTTPError(f"{r.status_code} for {method} {url}", response=r)
+        return r
+
     #hdfs dfs -mkdir -p /raw/orders/2026-01-14
     def mkdirs(self, hdfs_dir: str) -> None:
-        r = requests.put(self._url(hdfs_dir, "MKDIRS"), timeout=60)
-        r.raise_for_status()
- 
+        with span("hdfs.mkdirs", kind="hdfs", path=hdfs_dir):
+            r = self._call(lambda: self._request("PUT", self._url(hdfs_dir, "MKDIRS"), timeout=60))
+            r.raise_for_status()
+
     #Check if a file or folder exists:hdfs dfs -test -e /raw/orders
     def exists(self, hdfs_path: str) -> bool:
-        r = requests.get(self._url(hdfs_path, "GETFILESTATUS"), timeout=60)
-        if r.status_code == 404:
-            return False
-        r.raise_for_status()
-        return True
+        with span("hdfs.exists", kind="hdfs", path=hdfs_path):
+            r = self._call(lambda: self._request("GET", self._url(hdfs_path, "GETFILESTATUS"), timeout=60))
+            if r.status_code == 404:
+                return False
+            r.raise_for_status()
+            return True
+    #Status of one file / folder : hdfs dfs -stat -> FileStatus or None
+    def status(self, hdfs_path: str):
+        with span("hdfs.status", kind="hdfs", path=hdfs_path):
+            r = self._call(lambda: self._request("GET", self._url(hdfs_path, "GETFILESTATUS"), timeout=60))
+            if r.status_code == 404:
+                return None
+            r.raise_for_status()
+            return FileStatus.from_json(hdfs_path, r.json()["FileStatus"])
+
+    #List a folder : hdfs dfs -ls /raw/orders/2026-01-14 -> [FileStatus] in one call ([] if missing)
+    def list_status(self, hdfs_dir: str, batch: bool = HDFS_LIST_BATCH) -> list:
+        if batch:
+            return list(self.iter_status(hdfs_dir))
+        with span("hdfs.list_status", kind="hdfs", path=hdfs_dir) as s:
+            r = self._call(lambda: self._request("GET", self._url(hdfs_dir, "LISTSTATUS"), timeout=60))
+            if r.status_code == 404:
+                return []
+            r.raise_for_status()
+            statuses = [FileStatus.from_json(hdfs_dir, st) for st in r.json()["FileStatuses"]["FileStatus"]]
+            s.set(rows=len(statuses))
+            return statuses
+
+    #Large folders : LISTSTATUS_BATCH pages (startAfter = last name of the previous page)
+    def iter_status(self, hdfs_dir: str):
+        """Yields the FileStatus of a folder page by page; falls back to LISTSTATUS if the server lacks the op."""
+        start_after = None
+        while True:
+            extra = f"startAfter={quote(start_after)}" if start_after else ""
+            with span("hdfs.list_status_batch", kind="hdfs", path=hdfs_dir) as s:
+                r = self._call(lambda: self._request("GET", self._url(hdfs_dir, "LISTSTATUS_BATCH", extra), timeout=60))
+                if r.status_code == 404:
+                    return
+                if r.status_code == 400 and start_after is None:  # HttpFS / ancien namenode
+                    r.close()
+                    yield from self.list_status(hdfs_dir, batch=False)
+                    return
+                r.raise_for_status()
+                listing = r.json()["DirectoryListing"]
+                page = listing["partialListing"]["FileStatuses"]["FileStatus"]
+                s.set(rows=len(page))
+            yield from (FileStatus.from_json(hdfs_dir, st) for st in page)
+            if not page or not listing.get("remainingEntries"):
+                return
+            start_after = page[-1]["pathSuffix"]
+
     #Upload a file to HDFS :
     #In distributed systems → fewer calls = safer & faster.
     # ❌ 2. Extra network call
@@ -36,34 +162,261 @@ class WebHDFSClient:
         # Instead of just:
         # 1 HTTP call to CREATE
 
-    def put_file(self, local_path: str, hdfs_path: str, overwrite: bool = False) -> None: #Let HDFS handle it.
+    def put_file(self, local_path: str, hdfs_path: str, overwrite: bool = False,
+                 skip_identical: bool = False) -> bool: #Let HDFS handle it.
+        """
+        skip_identical: the local sha256 is compared with the digest xattr of the HDFS file and an
+        identical file is not sent again. Returns False when skipped.
+        """
         extra = f"overwrite={'true' if overwrite else 'false'}"
         # File exists & overwrite=true	File is replaced ✅
         # File exists & overwrite=false	HDFS rejects ❌
+        digest = sha256_file(local_path) if skip_identical else None
+        if digest is not None and self.digest(hdfs_path) == digest:
+            return False
+
+        def _body(redirect):
+            #hdfs dfs -put local.txt /raw/data/local.txt
+            with open(local_path, "rb") as f:
+                return self._request("PUT", redirect, data=f, timeout=300)
+
+        size = os.path.getsize(local_path)
+        if size >= HDFS_CHUNKED_THRESHOLD:
+            self.put_file_chunked(local_path, hdfs_path, overwrite=overwrite, digest=digest)
+            return True
+        with span("hdfs.put_file", kind="hdfs", path=hdfs_path, bytes=size):
+            self._call_create(hdfs_path, extra, _body, lambda: (size, digest or sha256_file(local_path)))
+            if digest is not None:
+                self.set_xattr(hdfs_path, DIGEST_XATTR, digest)
+        return True
+
+    #Large files : CREATE (empty) then one APPEND per chunk. A failed chunk is resent from the length
+    #HDFS has committed, and a later call with the same content resumes the partial file.
+    def put_file_chunked(self, local_path: str, hdfs_path: str, overwrite: bool = False, digest: str = None,
+                         chunk_size: int = HDFS_CHUNK_SIZE) -> None:
+        size = os.path.getsize(local_path)
+        digest = digest or sha256_file(local_path)
+        with span("hdfs.put_file_chunked", kind="hdfs", path=hdfs_path, bytes=0) as s:
+            st = self.status(hdfs_path)
+            if st is not None and st.length <= size and self.get_xattrs(hdfs_path).get(PENDING_XATTR) == digest:
+                print(f" Resuming upload of {hdfs_path} at {st.length}/{size} bytes")
+                s.set(resumed=st.length)
+            else:
+                extra = f"overwrite={'true' if overwrite else 'false'}"
+                self._call_create(hdfs_path, extra, lambda redirect: self._request("PUT", redirect, data=b"", timeout=60),
+                                  lambda: (0, hashlib.sha256().hexdigest()))
+                self.set_xattr(hdfs_path, PENDING_XATTR, digest)
+
+            with open(local_path, "rb") as f:
+                def _next_chunk():
+                    # Committed length read again at every attempt: a failed APPEND may have written part of its chunk
+                    offset = self.status(hdfs_path).length
+                    if offset >= size:
+                        return offset
+                    f.seek(offset)
+                    data = f.read(min(chunk_size, size - offset))
+                    r1 = self._request("POST", self._url(hdfs_path, "APPEND"), allow_redirects=False, timeout=60)
+                    if r1.status_code != 307:
+                        r1.raise_for_status()
+                    r2 = self._request("POST", r1.headers["Location"], data=data, timeout=300)
+                    r2.raise_for_status()
+                    s.add(bytes=len(data))
+                    return offset + len(data)
+
+                while self._call(_next_chunk) < size:
+                    pass
 
-        r1 = requests.put(self._url(hdfs_path, "CREATE", extra=extra), allow_redirects=False, timeout=60)
+            self.remove_xattr(hdfs_path, PENDING_XATTR)
+            self.set_xattr(hdfs_path, DIGEST_XATTR, digest)
+
+    #Upload from a generator of bytes : no local file, the body is sent chunked as it is produced
+    def put_stream(self, chunks, hdfs_path: str, overwrite: bool = False, skip_identical: bool = False) -> bool:
+        """
+        chunks = callable returning an iterable of bytes (called again if the upload is retried).
+        skip_identical: as in put_file, compared with the digest xattr. The stream is hashed first only
+        when the HDFS file has a digest to compare with; otherwise it is hashed while it is sent.
+        Returns False when skipped.
+        """
+        extra = f"overwrite={'true' if overwrite else 'false'}"
+        digest = None
+        if skip_identical:
+            remote = self.digest(hdfs_path)
+            digest = sha256_stream(chunks) if remote is not None else None
+            if digest is not None and digest == remote:
+                return False
+        with span("hdfs.put_stream", kind="hdfs", path=hdfs_path) as s:
+            sent = {}
+
+            def _body(redirect):
+                s.set(bytes=0)  # counted again if the upload is retried
+                sent["sha256"] = hashlib.sha256()
+                return self._request("PUT", redirect, data=counted(hashing(chunks(), sent["sha256"]), s), timeout=300)
+            self._call_create(hdfs_path, extra, _body, lambda: _length_sha256(chunks()))
+            if skip_identical:
+                self.set_xattr(hdfs_path, DIGEST_XATTR, digest or sent["sha256"].hexdigest())
+        return True
+
+    #Extended attributes : hdfs dfs -getfattr -d / -setfattr
+    def get_xattrs(self, hdfs_path: str):
+        """{name: text value} of a file, None if it does not exist."""
+        r = self._call(lambda: self._request("GET", self._url(hdfs_path, "GETXATTRS", "encoding=text"), timeout=60))
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return {x["name"]: (x.get("value") or "").strip('"') for x in r.json().get("XAttrs", [])}
+
+    def set_xattr(self, hdfs_path: str, name: str, value: str, flag: str = "CREATE") -> None:
+        text = '"' + value + '"'  # text encoding of the value
+        extra = f"xattr.name={quote(name)}&xattr.value={quote(text)}&flag={flag}"
+        r = self._call(lambda: self._request("PUT", self._url(hdfs_path, "SETXATTR", extra), timeout=60))
+        r.raise_for_status()
+
+    def remove_xattr(self, hdfs_path: str, name: str) -> None:
+        r = self._call(lambda: self._request("PUT", self._url(hdfs_path, "REMOVEXATTR", f"xattr.name={quote(name)}"),
+                                             timeout=60))
+        r.raise_for_status()
+
+    def digest(self, hdfs_path: str):
+        """sha256 recorded by the last complete upload of the file (None: missing, partial or written elsewhere)."""
+        with span("hdfs.digest", kind="hdfs", path=hdfs_path):
+            xattrs = self.get_xattrs(hdfs_path)
+            return xattrs.get(DIGEST_XATTR) if xattrs else None
+
+    #CREATE on the namenode (307) then send_body(datanode_url) for the content
+    def _create(self, hdfs_path: str, extra: str, send_body) -> None:
+        r1 = self._request("PUT", self._url(hdfs_path, "CREATE", extra=extra), allow_redirects=False, timeout=60)
+        if r1.status_code == 403 and "FileAlreadyExists" in r1.text:
+            raise FileExistsError(hdfs_path)
         if r1.status_code not in (307, 201):
             r1.raise_for_status()
         redirect = r1.headers.get("Location")
         if not redirect:
             return
-        #hdfs dfs -put local.txt /raw/data/local.txt
-        with open(local_path, "rb") as f:
-            r2 = requests.put(redirect, data=f, timeout=300)
+        r2 = send_body(redirect)
         r2.raise_for_status()
-    #Download a file from HDFS : hdfs dfs -get /raw/data/file.txt ./file.txt -> That command also prints nothing, but the file appears locally.
-    def get_file(self, hdfs_path: str, local_path: str) -> None:
-        r = requests.get(self._url(hdfs_path, "OPEN"), allow_redirects=True, stream=True, timeout=60)
+
+    #CREATE with retries. overwrite=false is not idempotent : a failed attempt may have written the
+    #file already, the retry then gets FileAlreadyExists. Accepted only when the HDFS file has the
+    #length and sha256 of what is being written, content() -> (length, sha256).
+    def _call_create(self, hdfs_path: str, extra: str, send_body, content) -> None:
+        attempts = []
+
+        def _attempt():
+            attempts.append(1)
+            try:
+                self._create(hdfs_path, extra, send_body)
+            except FileExistsError:
+                if len(attempts) == 1 or not self._has_content(hdfs_path, *content()):
+                    raise
+                print(f" {hdfs_path} already written by the failed attempt")
+        self._call(_attempt)
+
+    #Length from the namenode first, then the content read back and hashed
+    def _has_content(self, hdfs_path: str, length: int, sha256: str) -> bool:
+        st = self.status(hdfs_path)
+        if st is None or st.length != length:
+            return False
+        r = self._call(lambda: self._request("GET", self._url(hdfs_path, "OPEN"), allow_redirects=True, stream=True,
+                                             timeout=60))
         r.raise_for_status()
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        with open(local_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+        with r:
+            return _length_sha256(r.iter_content(chunk_size=1024 * 1024)) == (length, sha256)
+
+    #Download a file from HDFS : hdfs dfs -get /raw/data/file.txt ./file.txt -> That command also prints nothing, but the file appears locally.
+    def get_file(self, hdfs_path: str, local_path: str, length: int = None) -> None:
+        """length = size of the file when known (listing): large files are then fetched by ranges."""
+        if length is not None and length >= HDFS_RANGE_THRESHOLD:
+            return self.get_file_ranges(hdfs_path, local_path, length)
+
+        with span("hdfs.get_file", kind="hdfs", path=hdfs_path) as s:
+            def _download():
+                r = self._request("GET", self._url(hdfs_path, "OPEN"), allow_redirects=True, stream=True, timeout=60)
+                r.raise_for_status()
+                os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+                s.set(bytes=0)
+                with r, open(local_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                            s.add(bytes=len(chunk))
+
+            self._call(_download)
+
+    #Parallel download : OPEN offset/length ranges written in place into a pre-sized .part file
+    def get_file_ranges(self, hdfs_path: str, local_path: str, length: int = None, range_size: int = HDFS_RANGE_SIZE,
+                        max_workers: int = HDFS_RANGE_WORKERS) -> None:
+        if length is None:
+            st = self.status(hdfs_path)
+            if st is None:
+                raise FileNotFoundError(hdfs_path)
+            length = st.length
+        ranges = [(offset, min(range_size, length - offset)) for offset in range(0, length, range_size)]
+        tmp_path = local_path + ".part"
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.truncate(length)
+
+        def _range(part):
+            offset, size = part
+
+            def _download():  # a retried range rewrites only its own bytes
+                extra = f"offset={offset}&length={size}"
+                r = self._request("GET", self._url(hdfs_path, "OPEN", extra), allow_redirects=True, stream=True,
+                                  timeout=60)
+                r.raise_for_status()
+                written = 0
+                with r, open(tmp_path, "r+b") as f:
+                    f.seek(offset)
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                        written += len(chunk)
+                if written != size:
+                    raise requests.ConnectionError(f"short read on {hdfs_path} [{offset}:{offset + size}]: {written} bytes")
+                return written
+
+            return self._call(_download)
+
+        with span("hdfs.get_file_ranges", kind="hdfs", path=hdfs_path, bytes=length, ranges=len(ranges)):
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    list(pool.map(propagate(_range), ranges))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, local_path)
+
+    #Small file content in memory (manifests...) : None if missing
+    def read_bytes(self, hdfs_path: str):
+        with span("hdfs.read_bytes", kind="hdfs", path=hdfs_path) as s:
+            r = self._call(lambda: self._request("GET", self._url(hdfs_path, "OPEN"), allow_redirects=True, timeout=60))
+            if r.status_code == 404:
+                return None
+            r.raise_for_status()
+            s.set(bytes=len(r.content))
+            return r.content
+
+    #hdfs dfs -mv : atomic on the namenode (file or folder), False if the source is missing / the target exists
+    def rename(self, hdfs_src: str, hdfs_dst: str) -> bool:
+        with span("hdfs.rename", kind="hdfs", path=hdfs_src):
+            r = self._call(lambda: self._request("PUT", self._url(hdfs_src, "RENAME", f"destination={quote(hdfs_dst)}"),
+                                                 timeout=60))
+            r.raise_for_status()
+            return bool(r.json().get("boolean"))
+
+    #Space used by a file/folder : hdfs dfs -du -s /output/supplier_orders/2026-01-14
+    def content_summary(self, hdfs_path: str) -> dict:
+        with span("hdfs.content_summary", kind="hdfs", path=hdfs_path):
+            r = self._call(lambda: self._request("GET", self._url(hdfs_path, "GETCONTENTSUMMARY"), timeout=60))
+            if r.status_code == 404:
+                return {"length": 0, "fileCount": 0, "directoryCount": 0}
+            r.raise_for_status()
+            return r.json()["ContentSummary"]
 
     def delete(self, path, recursive=False):
-        
+
         extra = f"recursive={'true' if recursive else 'false'}"
         url = self._url(path, "DELETE", extra=extra)
-        resp = requests.delete(url)
-        return resp.status_code == 200
\ No newline at end of file
+        with span("hdfs.delete", kind="hdfs", path=path):
+            resp = self._call(lambda: self._request("DELETE", url, timeout=60))
+        return resp.status_code == 200
+
@@ -0,0 +1,152 @@
+from collections import namedtuple
+
+# Tables Hive permanentes, partitionnées par run_date : une table par jeu de données
+# (et non plus une table par jour), créées une seule fois (TrinoSession.bootstrap).
+# Chaque run enregistre / réécrit SA partition ; une requête sur une plage de dates
+# filtre sur run_date et Trino ne lit que les partitions concernées.
+#
+# Les partitions gardent l'arborescence HDFS du pipeline (/raw/orders/2026-01-14, ...) :
+# elles sont enregistrées à cet emplacement par system.register_partition
+# (hive.allow-register-partition-procedure=true dans config/trino/catalog/hive.properties),
+# un INSERT écrit ensuite dans le dossier de la partition.
+PARTITION_COLUMN = "run_date"
+
+
+class HiveTable(namedtuple("HiveTable", ["name", "columns", "format", "root", "partition_dir", "partition_column"],
+                           defaults=(PARTITION_COLUMN,))):
+    """
+    name = hive.<schema>.<table>, columns = [(colonne, type)] hors colonne de partition,
+    partition_dir = dossier HDFS d'une partition (relatif à root, {run_date} remplacé).
+    """
+    __slots__ = ()
+
+    @property
+    def catalog(self) -> str:
+        return self.name.split(".")[0]
+
+    @property
+    def schema(self) -> str:
+        return self.name.split(".")[1]
+
+    @property
+    def table(self) -> str:
+        return self.name.split(".")[2]
+
+    def location(self, value: str) -> str:
+        """HDFS directory of a partition (a run_date for most tables)."""
+        return f"{self.root}/{self.partition_dir.format(**{self.partition_column: value})}"
+
+    def partition(self, value: str) -> str:
+        """One partition as a subquery (data columns only), usable in FROM / JOIN."""
+        columns = ", ".join(c for c, _ in self.columns)
+        return f"(SELECT {columns} FROM {self.name} WHERE {self.partition_column} = '{value}')"
+
+    def create_sql(self) -> str:
+        columns = ",\n        ".join(f"{c} {t}" for c, t in self.columns + [(self.partition_column, "VARCHAR")])
+        return f"""
+    CREATE TABLE IF NOT EXISTS {self.name} (
+        {columns}
+    )
+    WITH (
+        format = '{self.format}',
+        partitioned_by = ARRAY['{self.partition_column}'],
+        external_location = '{self.root}'
+    )
+    """
+
+
+# Fichiers RAW (Avro) écrits par generate_daily_files.py ; une partition compactée (compaction.py)
+# est déplacée sur son dossier de parts (/raw/orders/{date}/_v{n}, voir compaction.data_location)
+RAW_ORDERS = HiveTable("hive.raw_orders.orders",
+                       [("market_id", "VARCHAR"), ("sku", "VARCHAR"), ("quantity", "BIGINT"), ("timestamp", "VARCHAR")],
+                       "AVRO", "/raw/orders", "{run_date}")
+# Le run_date des lignes de stock Avro est remplacé par la colonne de partition
+RAW_STOCK = HiveTable("hive.raw_stock.stock",
+                      [("sku", "VARCHAR"), ("quantity_available", "BIGINT"), ("quantity_reserved", "BIGINT"),
+                       ("safety_quantity", "BIGINT"), ("location", "VARCHAR")],
+                      "AVRO", "/raw/stock", "{run_date}")
+
+# Dimension des règles d'achat compilées (procurement_rules.py) : une partition par version
+# du master data produits, pas par date
+PROCUREMENT_RULES = HiveTable("hive.default.procurement_rules",
+                              [("sku", "VARCHAR"), ("supplier_id", "VARCHAR"), ("moq", "BIGINT"), ("mxoq", "BIGINT"),
+                               ("pack_size", "BIGINT"), ("leadtime", "BIGINT")],
+                              "PARQUET", "/dimensions/procurement_rules", "{rules_version}", "rules_version")
+
+# Sorties des étapes 1-3 (Parquet)
+AGGREGATED_ORDERS = HiveTable("hive.processed.aggregated_orders",
+                              [("sku", "VARCHAR"), ("total_quantity", "BIGINT")],
+                              "PARQUET", "/processed/aggregated_orders", "{run_date}")
+NET_DEMAND = HiveTable("hive.processed.net_demand",
+                       [("sku", "VARCHAR"), ("net_demand", "BIGINT")],
+                       "PARQUET", "/processed/net_demand", "{run_date}")
+# Sous-dossier parquet/ : les JSON fournisseurs du jour restent dans /output/supplier_orders/{date}
+# sans être lus par la table
+SUPPLIER_ORDERS = HiveTable("hive.output.supplier_orders",
+                            [("supplier_id", "VARCHAR"), ("sku", "VARCHAR"), ("quantity", "INTEGER")],
+                            "PARQUET", "/output/supplier_orders", "{run_date}/parquet")
+
+# Anomalies du DataQualityGuard (exception_sink.py) : parts Parquet écrites au fil du run,
+# à côté de l'export CSV date={run_date}/exceptions.csv
+EXCEPTIONS = HiveTable("hive.default.exceptions",
+                       [("timestamp", "VARCHAR"), ("batch_date", "VARCHAR"), ("rule_broken", "VARCHAR"),
+                        ("entity_id", "VARCHAR"), ("details", "VARCHAR"), ("severity", "VARCHAR")],
+                       "PARQUET", "/logs/exceptions", "date={run_date}/parquet")
+
+TABLES = (RAW_ORDERS, RAW_STOCK, PROCUREMENT_RULES, AGGREGATED_ORDERS, NET_DEMAND, SUPPLIER_ORDERS, EXCEPTIONS)
+
+
+def ensure_tables(cur, tables=TABLES):
+    """CREATE TABLE IF NOT EXISTS for every partitioned table (no DDL once they exist)."""
+    for table in tables:
+        cur.execute(table.create_sql())
+
+
+def _partition_exists(cur, table, value):
+    cur.execute(f'SELECT 1 FROM {table.catalog}.{table.schema}."{table.table}$partitions" '
+                f"WHERE {table.partition_column} = '{value}' LIMIT 1")
+    return bool(cur.fetchall())
+
+
+def _partition_call(cur, table, procedure, value, location=None):
+    location_arg = f",\n        location => '{location}'" if location else ""
+    cur.execute(f"""
+    CALL {table.catalog}.system.{procedure}(
+        schema_name => '{table.schema}',
+        table_name => '{table.table}',
+        partition_columns => ARRAY['{table.partition_column}'],
+        partition_values => ARRAY['{value}']{location_arg}
+    )
+    """)
+
+
+def register_partition(cur, table, value, location=None):
+    """Registers the partition at location (default table.location(value)) unless it is already known."""
+    if _partition_exists(cur, table, value):
+        return False
+    _partition_call(cur, table, "register_partition", value, location or table.location(value))
+    return True
+
+
+def relocate_partition(cur, table, value, location):
+    """Points a partition at another HDFS directory (unregister + register; the files are not touched)."""
+    if _partition_exists(cur, table, value):
+        _partition_call(cur, table, "unregister_partition", value)
+    _partition_call(cur, table, "register_partition", value, location)
+
+
+def overwrite_partition(cur, hdfs, table, run_date, select):
+    """
+    Replaces the run_date partition with the rows of select (columns named like the table's):
+    files of the partition deleted, partition registered once, then INSERT. Other dates untouched.
+    """
+    location = table.location(run_date)
+    print(f"Cleaning up partition {table.name} [{PARTITION_COLUMN}={run_date}] : {location}")
+    hdfs.delete(location, recursive=True)
+    hdfs.mkdirs(location)
+    register_partition(cur, table, run_date)
+    columns = ", ".join(c for c, _ in table.columns)
+    cur.execute(f"""
+    INSERT INTO {table.name}
+    SELECT {columns}, '{run_date}' FROM ({select})
+    """)
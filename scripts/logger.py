@@ -1,16 +1,101 @@
+import os
+import atexit
+import queue
+import threading
 import logging
+import logging.handlers
 
 # --------------------------------------------------
 # LOGGING CONFIGURATION
 # --------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    handlers=[
-        logging.FileHandler("data_quality.log"),
-        logging.StreamHandler()
-    ]
-)
+# Les appels logger.* ne font que poser le record dans une file (jamais bloquante) :
+# le formatage et l'écriture (data_quality.log + console) se font dans le thread du
+# QueueListener. Les warnings répétés d'une même règle (extra={"rule": ...}) sont limités
+# à LOG_RATE_LIMIT par fenêtre de LOG_RATE_WINDOW secondes ; le reste est compté et résumé
+# périodiquement par une ligne "N more <RULE> suppressed".
+LOG_FILE = os.getenv("LOG_FILE", "data_quality.log")
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))
+
+FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+
+class RuleRateLimit(logging.Filter):
+    """Lets LOG_RATE_LIMIT records per rule and window through, counts the others."""
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._windows = {}     # rule -> (window start, records let through)
+        self._suppressed = {}  # rule -> (count, logger name)
+
+    def filter(self, record):
+        rule = getattr(record, "rule", None)
+        if rule is None or self.limit <= 0:
+            return True
+        with self._lock:
+            start, seen = self._windows.get(rule, (record.created, 0))
+            if record.created - start >= self.window:
+                start, seen = record.created, 0
+            if seen < self.limit:
+                self._windows[rule] = (start, seen + 1)
+                return True
+            count, _ = self._suppressed.get(rule, (0, record.name))
+            self._suppressed[rule] = (count + 1, record.name)
+            return False
+
+    def flush(self):
+        """Logs one summary line per rule with suppressed records since the last flush."""
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+        for rule, (count, name) in sorted(suppressed.items()):
+            logging.getLogger(name).warning("%d more %s suppressed", count, rule)
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """Same-process queue: the record is enqueued as is, formatted by the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+def _summaries(stop):
+    while not stop.wait(LOG_RATE_WINDOW):
+        rate_limit.flush()
+
+
+_queue = queue.SimpleQueue()  # non bornée : put() ne bloque jamais
+rate_limit = RuleRateLimit()
+queue_handler = _LocalQueueHandler(_queue)
+queue_handler.addFilter(rate_limit)
+
+_formatter = logging.Formatter(FORMAT)
+_handlers = [logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+for _h in _handlers:
+    _h.setFormatter(_formatter)
+listener = logging.handlers.QueueListener(_queue, *_handlers, respect_handler_level=True)
+
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+listener.start()
+
+_stop_summaries = threading.Event()
+threading.Thread(target=_summaries, args=(_stop_summaries,), name="log-summaries", daemon=True).start()
+
+
+def flush():
+    """Emits the pending suppressed-summaries (end of a report / run)."""
+    rate_limit.flush()
+
+
+@atexit.register
+def shutdown():
+    """Last summaries, then drains the queue and stops the listener thread."""
+    _stop_summaries.set()
+    rate_limit.flush()
+    listener.stop()
+
 
 # def logger():
 #     logger = logging.getLogger("DataQualityGuard")
@@ -0,0 +1,120 @@
+import os
+import json
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pg_client import PG_EMBEDDED, pooled_connection, read_arrow
+from tracing import span
+
+# Local snapshot cache of the Postgres master data (products, market, suppliers).
+# Each table is kept as DATA_ROOT/cache/master_data/{table}.parquet next to the version
+# it was fetched at. A run only sends a cheap version probe per table (row count +
+# checksum computed by Postgres) and re-fetches the table when it changed. Inside a
+# process every stage and the guard share the same in-memory Arrow table.
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+MASTER_DATA_DIR = os.getenv("MASTER_DATA_DIR", os.path.join(DATA_ROOT, "cache/master_data"))
+# 0 = no disk snapshot (the tables are still read only once per run)
+MASTER_DATA_CACHE = os.getenv("MASTER_DATA_CACHE", "1") == "1"
+
+# table -> primary key (stable row order of the snapshots)
+TABLES = {
+    "products": "sku",
+    "market": "market_id",
+    "suppliers": "supplier_id",
+}
+
+_lock = threading.Lock()
+_tables = {}    # table -> pa.Table shared by the whole run
+_versions = {}  # table -> version probed during this run
+
+
+def probe_version(table: str, db_config=None) -> str:
+    """Cheap version of a master table: row count + checksum of its rows (only one row comes back)."""
+    with span("postgres.version_probe", kind="postgres", table=table), pooled_connection(db_config) as conn:
+        cur = conn.cursor()
+        try:
+            if PG_EMBEDDED:
+                # SQLite has no hashtext() : the file size + mtime change with every write
+                cur.execute(f"SELECT COUNT(*) FROM {table}")
+                st = os.stat(PG_EMBEDDED)
+                return f"{cur.fetchone()[0]}:{st.st_size}:{st.st_mtime_ns}"
+            # Somme des hashtext() des lignes : un seul parcours, ni tri ni chaîne géante comme
+            # md5(string_agg(... ORDER BY key)), et indépendante de l'ordre des lignes
+            cur.execute(f"SELECT COUNT(*), COALESCE(SUM(hashtext(t::text)::bigint), 0) FROM {table} t")
+            count, checksum = cur.fetchone()
+            return f"{count}:{checksum}"
+        finally:
+            cur.close()
+
+
+def _snapshot_paths(table):
+    return (os.path.join(MASTER_DATA_DIR, f"{table}.parquet"),
+            os.path.join(MASTER_DATA_DIR, f"{table}.version.json"))
+
+
+def _read_snapshot(table, version):
+    """The Parquet snapshot if it was taken at `version`, else None."""
+    data_path, version_path = _snapshot_paths(table)
+    try:
+        with open(version_path) as f:
+            if json.load(f).get("version") != version:
+                return None
+        return pq.read_table(data_path)
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return None
+
+
+def _write_snapshot(table, version, data):
+    data_path, version_path = _snapshot_paths(table)
+    os.makedirs(MASTER_DATA_DIR, exist_ok=True)
+    pq.write_table(data, data_path + ".tmp")
+    os.replace(data_path + ".tmp", data_path)
+    with open(version_path + ".tmp", "w") as f:
+        json.dump({"table": table, "version": version, "rows": data.num_rows}, f)
+    os.replace(version_path + ".tmp", version_path)
+
+
+def _fetch(table, db_config=None):
+    # Curseur côté serveur -> batches Arrow, sans passer par pandas
+    return read_arrow(f"SELECT * FROM {table} ORDER BY {TABLES[table]}", db_config=db_config)
+
+
+def table(name: str, db_config=None) -> pa.Table:
+    """Master table as Arrow: memory -> local snapshot (same version) -> Postgres."""
+    with _lock:
+        if name in _tables:
+            return _tables[name]
+        with span("master_data.load", kind="master_data", table=name) as s:
+            version = probe_version(name, db_config)
+            data = _read_snapshot(name, version) if MASTER_DATA_CACHE else None
+            s.set(source="snapshot" if data is not None else "postgres")
+            if data is None:
+                data = _fetch(name, db_config)
+                if MASTER_DATA_CACHE:
+                    _write_snapshot(name, version, data)
+            s.set(rows=data.num_rows)
+        _tables[name] = data
+        _versions[name] = version
+        return data
+
+
+def df(name: str, columns=None, db_config=None):
+    """pandas copy of a master table (callers may modify it)."""
+    data = table(name, db_config)
+    return (data.select(columns) if columns else data).to_pandas()
+
+
+def version(*names) -> str:
+    """Versions of the given tables (all by default) as one string, e.g. for the stage cache."""
+    for name in names or TABLES:
+        table(name)
+    return "|".join(f"{name}={_versions[name]}" for name in names or TABLES)
+
+
+def reset():
+    """Forgets the in-memory copies (next access probes the versions again, e.g. a new run)."""
+    with _lock:
+        _tables.clear()
+        _versions.clear()
@@ -1,93 +1,89 @@
 import os
-from datetime import date
-from trino.dbapi import connect
-from hdfs_client import WebHDFSClient 
-
-RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-
-TRINO_HOST = os.getenv("TRINO_HOST",'trino')
-TRINO_PORT = int(os.getenv("TRINO_PORT", 8080))
-TRINO_USER = os.getenv("TRINO_USER", "admin")
-TRINO_CATALOG = os.getenv("TRINO_CATALOG", "hive")
-TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
-
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
-
-def main(guard=None):
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
-    # 1. Connexion à Trino
-    conn = connect(
-        host=TRINO_HOST,
-        port=TRINO_PORT,
-        user=TRINO_USER,
-        catalog=TRINO_CATALOG,
-        schema=TRINO_SCHEMA
-    )    
-    cur = conn.cursor()
-
-    # --- 🛠️ FIX: CREATE SCHEMAS FIRST (Lignes de ton ami) ---
-    print("Checking schemas...")
-    cur.execute("CREATE SCHEMA IF NOT EXISTS hive.default")
-    cur.execute("CREATE SCHEMA IF NOT EXISTS hive.processed")
+from trino_utils import stage_session, iter_arrow_batches
+import arrow_engine
+from engines import resolve_engine
+from run_context import RunContext
+import hive_tables
 
-    # La suite de ton code reste la même...
-    hdfs_stock_path = f"/raw/stock/{RUN_DATE}/"
-    table_src_agg = f"hive.processed.aggregated_orders_{RUN_DATE.replace('-', '_')}"
-    hdfs_target_dir = f"/processed/net_demand/{RUN_DATE}"
-    table_dest = f"hive.processed.net_demand_{RUN_DATE.replace('-', '_')}"
-
-    # --- ÉTAPE A : Créer le pont vers le fichier STOCK Avro généré ---
-    cur.execute("DROP TABLE IF EXISTS hive.default.temp_raw_stock")
-    setup_stock_query = f"""
-    CREATE TABLE hive.default.temp_raw_stock (
-        run_date VARCHAR,
-        sku VARCHAR,
-        quantity_available BIGINT,
-        quantity_reserved BIGINT,
-        safety_quantity BIGINT,
-        location VARCHAR
-    )
-    WITH (
-        format = 'AVRO',
-        external_location = '{hdfs_stock_path}'
-    )
-    """
-    cur.execute(setup_stock_query)
-    print(f"Cleaning up target directory: {hdfs_target_dir}")
-    hdfs.delete(hdfs_target_dir, recursive=True)
-    
-    # --- ÉTAPE B : Calcul de la demande nette ---
-    cur.execute(f"DROP TABLE IF EXISTS {table_dest}")
-    
-    # On utilise 'temp_raw_stock' au lieu de 'hive.raw.stock'
-    query_net = f"""
-    CREATE TABLE {table_dest}
-    WITH (
-        format = 'PARQUET', 
-        external_location = '/processed/net_demand/{RUN_DATE}/'
-    )
-    AS 
+# Requête de l'étape 2 ; {aggregated} = partition (ou CTE) des ventes agrégées, {stock} = partition de stock du jour
+NET_DEMAND_SELECT = """
     SELECT 
-        '{RUN_DATE}' as run_date,
+        '{run_date}' as run_date,
         ao.sku,
         (ao.total_quantity + s.safety_quantity - (s.quantity_available - s.quantity_reserved)) as net_demand
-    FROM {table_src_agg} ao
-    JOIN hive.default.temp_raw_stock s ON ao.sku = s.sku
-    """
+    FROM {aggregated} ao
+    JOIN {stock} s ON ao.sku = s.sku
+"""
+
+
+def net_demand_select(ctx, aggregated) -> str:
+    return NET_DEMAND_SELECT.format(run_date=ctx.run_date, aggregated=aggregated,
+                                    stock=hive_tables.RAW_STOCK.partition(ctx.run_date))
+
+
+def register_stock(cur, ctx):
+    """Partition run_date de hive.raw_stock.stock sur le fichier STOCK Avro du jour."""
+    hive_tables.register_partition(cur, hive_tables.RAW_STOCK, ctx.run_date)
+
+
+def check_stock_anomalies(cur, guard, ctx):
+    """Reserved > Available, vérifié directement sur la partition de stock du jour."""
+    print("Vérification de la cohérence des stocks...")
+    query = (f"SELECT sku, quantity_available, quantity_reserved FROM {hive_tables.RAW_STOCK.name} "
+             f"WHERE run_date = '{ctx.run_date}' AND quantity_reserved > quantity_available")
+    for batch in iter_arrow_batches(cur, query):
+        guard.check_stock_logic_batch(batch["sku"], batch["quantity_available"], batch["quantity_reserved"])
+
+
+def main_arrow(ctx, hdfs, guard=None):
+    """Net demand computed in-process from the aggregated Parquet and the local stock Avro."""
+    local_stock_dir = os.path.join(ctx.data_root, "raw/stock", ctx.run_date)
+    hdfs_src_dir = hive_tables.AGGREGATED_ORDERS.location(ctx.run_date)
+    hdfs_target_dir = hive_tables.NET_DEMAND.location(ctx.run_date)
+
+    print(f"Étape 2 (arrow) : Calcul de la demande nette à partir du stock {local_stock_dir}")
+    aggregated = arrow_engine.read_output(ctx.data_root, hdfs_src_dir)
+    stock = arrow_engine.read_avro_dir(local_stock_dir, arrow_engine.STOCK_SCHEMA)
+    demand = arrow_engine.net_demand(aggregated, stock, ctx.run_date)
+    local_path = arrow_engine.write_output(demand, ctx.data_root, hdfs_target_dir, "net_demand.parquet", hdfs)
+    print(f"  {demand.num_rows} SKUs ({local_path})")
+
+    if guard:
+        print("Vérification de la cohérence des stocks...")
+        guard.check_stock_logic_batch(stock["sku"], stock["quantity_available"], stock["quantity_reserved"])
+    return demand
+
+
+def main_trino(ctx, trino, cur, hdfs, guard=None, prepared=False):
+    """Net demand as a Trino INSERT (aggregated_orders + RAW stock partitions -> net_demand partition)."""
+    # La suite de ton code reste la même...
+    hdfs_stock_path = hive_tables.RAW_STOCK.location(ctx.run_date)
+    src_agg = hive_tables.AGGREGATED_ORDERS.partition(ctx.run_date)
+
+    # --- ÉTAPE A : Enregistrer la partition du fichier STOCK Avro généré (sauf si le DAG l'a déjà fait) ---
+    if not prepared:
+        register_stock(cur, ctx)
+
+    # --- ÉTAPE B : Calcul de la demande nette (partition du jour réécrite) ---
     print(f"Étape 2 : Calcul de la demande nette à partir du stock {hdfs_stock_path}")
-    cur.execute(query_net)
+    hive_tables.overwrite_partition(cur, hdfs, hive_tables.NET_DEMAND, ctx.run_date,
+                                    net_demand_select(ctx, src_agg))
 
     # --- ÉTAPE C : VÉRIFICATION DATA QUALITY ---
     if guard:
-        print("Vérification de la cohérence des stocks...")
-        cur.execute("SELECT sku, quantity_available, quantity_reserved FROM hive.default.temp_raw_stock WHERE quantity_reserved > quantity_available")
-        anomalies = cur.fetchall()
-        for sku, avail, res in anomalies:
-            guard.check_stock_logic(sku=sku, available=avail, reserved=res)
+        check_stock_anomalies(cur, guard, ctx)
+
+
+def main(guard=None, engine=None, session=None, ctx=None, prepared=False):
+    ctx = ctx or RunContext.from_env()
+    hdfs = ctx.hdfs()
+    if resolve_engine(engine) == "arrow":
+        return main_arrow(ctx, hdfs, guard)
+
+    # Session Trino du run (ou privée si l'étape est lancée seule) : schémas créés une seule fois
+    with stage_session(session) as trino, trino.cursor("net_demand") as cur:
+        return main_trino(ctx, trino, cur, hdfs, guard, prepared)
 
-    cur.close()
-    conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,44 +1,193 @@
+import os
+import json
 import time
-import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import backfill
+import compaction
+from run_context import RunContext
 
 # --- CONFIGURATION ---
-# List of times to run the job (24-hour format)
-SCHEDULE_TIMES = ["00:00", "01:00"]
+# Créneaux au format cron (minute heure jour-du-mois mois jour-de-semaine), séparés par ';'
+# ex. "0 0,1 * * *" = tous les jours à 00:00 et 01:00 ; alias @hourly / @daily / @weekly / @monthly
+SCHEDULE_CRON = os.getenv("SCHEDULE_CRON", "0 0,1 * * *")
+# Rattrapage : les créneaux manqués (orchestrateur arrêté, run trop long) sont relancés,
+# au plus SCHEDULER_CATCHUP_DAYS jours en arrière
+SCHEDULER_CATCHUP_DAYS = int(os.getenv("SCHEDULER_CATCHUP_DAYS", "7"))
+# Dates lancées en même temps lors d'un rattrapage (les plafonds Trino / HDFS / Postgres de dag.py
+# restent communs à tous les runs du process)
+SCHEDULER_MAX_RUNS = int(os.getenv("SCHEDULER_MAX_RUNS", "2"))
+DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
+# 1 = après chaque lot, compaction des partitions historiques (dates antérieures au lot) dans un thread de fond
+COMPACTION_BACKGROUND = os.getenv("COMPACTION_BACKGROUND", "0") == "1"
+SCHEDULER_STATE = os.getenv("SCHEDULER_STATE", os.path.join(DATA_ROOT, "logs/scheduler_state.json"))
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+# (nom, min, max) des 5 champs ; jour de semaine 0-6 (0 = dimanche, 7 accepté)
+CRON_FIELDS = [("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7)]
+
+
+def _parse_field(text, name, lo, hi):
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = lo, hi
+        elif "-" in span:
+            start, end = (int(v) for v in span.split("-", 1))
+        else:
+            start = int(span)
+            end = hi if step > 1 else start  # "5/15" = de 5 jusqu'au max, tous les 15
+        if step < 1 or start < lo or end > hi or start > end:
+            raise ValueError(f"Invalid cron {name} field '{text}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Cron expression à 5 champs (heure locale, précision minute)."""
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        fields = CRON_ALIASES.get(self.expr, self.expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expr}' must have 5 fields")
+        minutes, hours, days, months, weekdays = (
+            _parse_field(text, name, lo, hi) for text, (name, lo, hi) in zip(fields, CRON_FIELDS))
+        self.minutes, self.hours, self.days, self.months = minutes, hours, days, months
+        self.weekdays = {d % 7 for d in weekdays}
+        # Règle cron : si jour-du-mois ET jour-de-semaine sont restreints, l'un OU l'autre suffit
+        self.days_any, self.weekdays_any = fields[2] == "*", fields[4] == "*"
+
+    def _day_matches(self, t):
+        in_days = t.day in self.days
+        in_weekdays = (t.weekday() + 1) % 7 in self.weekdays  # Python : lundi = 0 ; cron : dimanche = 0
+        if self.days_any or self.weekdays_any:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, dt):
+        """Premier créneau strictement après dt."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression '{self.expr}' never matches")
+
+
+def parse_schedules(text=SCHEDULE_CRON):
+    return [CronSchedule(expr) for expr in text.split(";") if expr.strip()]
+
+
+def due_slots(schedules, after, until):
+    """Créneaux de toutes les expressions dans ]after, until], triés, sans doublon."""
+    slots = set()
+    for schedule in schedules:
+        t = schedule.next_after(after)
+        while t <= until:
+            slots.add(t)
+            t = schedule.next_after(t)
+    return sorted(slots)
+
 
-def run_job(script_name):
-    print(f" [Job Trigger] Starting: {script_name}...")
+def next_slot(schedules, after):
+    return min(schedule.next_after(after) for schedule in schedules)
+
+
+# --- ÉTAT (dernier créneau traité, survit à un redémarrage) ---
+def load_state(path=SCHEDULER_STATE):
     try:
-        # Run python script as a subprocess
-        subprocess.run(["python", f"scripts/{script_name}"], check=True)
-        print(f" Job {script_name} Completed Successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f" Job {script_name} Failed: {e}")
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=SCHEDULER_STATE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def failed_dates(state, since):
+    """Dates dont le dernier run a échoué (depuis la date de since), relancées avec le lot suivant."""
+    first = since.date().isoformat()
+    return sorted(run_date for run_date, run in state.get("runs", {}).items()
+                  if not run["success"] and run_date >= first)
+
+
+def run_slots(slots, state, retry=()):
+    """
+    Un run par date des créneaux (deux créneaux du même jour = un run, le cache d'étapes fait le reste),
+    plus les dates en échec `retry` : last_slot avance, un échec est relancé au créneau suivant.
+    """
+    dates = list(dict.fromkeys([*retry, *(slot.date().isoformat() for slot in slots)]))
+    print(f"\n---  STARTING BATCH FOR {len(slots)} SLOT(S) ({slots[0]:%Y-%m-%d %H:%M} -> {slots[-1]:%Y-%m-%d %H:%M}) ---")
+    if retry:
+        print(f" Retrying {len(retry)} failed date(s): {', '.join(retry)}")
+    results = backfill.backfill(dates, workers=SCHEDULER_MAX_RUNS, metrics=len(dates) == 1)
+    for run_date, ok, seconds, error in results:
+        print(f" Run {run_date} {'Completed Successfully' if ok else 'Failed'} ({seconds:.1f}s){' ' + error if error else ''}")
+        state.setdefault("runs", {})[run_date] = {"success": ok, "finished_at": datetime.now().isoformat(timespec="seconds")}
+    state["last_slot"] = slots[-1].isoformat()
+    save_state(state)
+    print("--- BATCH COMPLETE ---\n")
+    return dates
+
+
+def start_compaction(dates, previous=None):
+    """Background compaction of the partitions before the batch (one at a time: skipped while the last one runs)."""
+    if previous is not None and previous.is_alive():
+        print(" Background compaction still running, not restarted")
+        return previous
+    return compaction.start_background(RunContext.from_env().hdfs, before=min(dates))
+
 
 def main():
-    print(f" Orchestrator started. Scheduled times: {', '.join(SCHEDULE_TIMES)}")
-    
+    schedules = parse_schedules()
+    state = load_state()
+    now = datetime.now().replace(second=0, microsecond=0)
+    # Premier démarrage : rien à rattraper ; sinon on repart du dernier créneau traité (borné)
+    last = datetime.fromisoformat(state["last_slot"]) if state.get("last_slot") else now
+    last = max(last, now - timedelta(days=SCHEDULER_CATCHUP_DAYS))
+    print(f" Orchestrator started. Schedule: {SCHEDULE_CRON} | next slot: {next_slot(schedules, last):%Y-%m-%d %H:%M}")
+
+    compactor = None
     while True:
-        # Get current time (HH:MM)
-        now = datetime.now().strftime("%H:%M")
-        
-        if now in SCHEDULE_TIMES:
-            print(f"\n---  STARTING BATCH AT {now} ---")
-            
-            # Step : Validate & Process (Trino Pipeline)
-            run_job("run_pipeline_hdfs.py") 
-            
-            print(f"--- BATCH COMPLETE FOR {now} ---\n")
-            
-            # Sleep for 61 seconds so we don't trigger it twice in the same minute
-            time.sleep(61)
-            
-        else:
-            # Sleep for 30 seconds before checking again
-            time.sleep(30)
+        slots = due_slots(schedules, last, datetime.now())
+        if slots:
+            if len(slots) > 1:
+                print(f" Catch-up: {len(slots)} missed slot(s) since {last:%Y-%m-%d %H:%M}")
+            retry = failed_dates(state, datetime.now() - timedelta(days=SCHEDULER_CATCHUP_DAYS))
+            dates = run_slots(slots, state, retry)
+            if COMPACTION_BACKGROUND:
+                compactor = start_compaction(dates, compactor)
+            last = slots[-1]
+            continue
+        # Attente jusqu'au prochain créneau (par tranches d'une minute : suit les changements d'heure système)
+        wait = (next_slot(schedules, last) - datetime.now()).total_seconds()
+        time.sleep(min(max(wait, 1), 60))
+
 
 if __name__ == "__main__":
     # Ensure print statements show up immediately in Docker logs
     import sys
     sys.stdout.reconfigure(line_buffering=True)
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,158 @@
 import os
+import atexit
+import itertools
+import sqlite3
+import threading
+from contextlib import contextmanager
 import pandas as pd
+import pyarrow as pa
 import psycopg2
+import psycopg2.pool
+from tracing import span
+from arrow_engine import rows_to_batch, concat_batches
 from dotenv import load_dotenv #  pip install dotenv
 
 load_dotenv()
 
-def pg_connect():
-    return psycopg2.connect(
-        host=os.environ["POSTGRES_HOST"],
-        port=int(os.environ["POSTGRES_PORT"]),
-        dbname=os.environ["POSTGRES_DB"],
-        user=os.environ["POSTGRES_USER"],
-        password=os.environ["POSTGRES_PASSWORD"],
-    )
+# Chemin d'un fichier SQLite utilisé à la place de Postgres (benchmarks / runs locaux sans Docker).
+# Mêmes tables (market, products, suppliers) : les requêtes du pipeline sont du SQL standard.
+PG_EMBEDDED = os.getenv("PG_EMBEDDED")
 
-def read_sql_df(query: str) -> pd.DataFrame:
-    conn = pg_connect()
+# Pool de connexions partagé par tout le run (et ses threads) : plus de connect() par requête
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "8"))
+# Lignes par batch Arrow lues via le curseur côté serveur
+PG_BATCH_SIZE = int(os.getenv("PG_BATCH_SIZE", "50000"))
+
+# OID Postgres -> type Arrow (les autres types sont inférés depuis les valeurs)
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+    700: pa.float64(), 701: pa.float64(),
+    18: pa.string(), 25: pa.string(), 1042: pa.string(), 1043: pa.string(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+}
+
+
+def _env_config():
+    return {
+        "host": os.environ["POSTGRES_HOST"],
+        "port": int(os.environ["POSTGRES_PORT"]),
+        "dbname": os.environ["POSTGRES_DB"],
+        "user": os.environ["POSTGRES_USER"],
+        "password": os.environ["POSTGRES_PASSWORD"],
+    }
+
+
+def pg_connect(db_config=None):
+    if PG_EMBEDDED:
+        return sqlite3.connect(PG_EMBEDDED)
+    return psycopg2.connect(**(db_config or _env_config()))
+
+
+# =========================================================
+# ========================= POOL ===========================
+# =========================================================
+_pools = {}
+_pools_lock = threading.Lock()
+_cursor_ids = itertools.count(1)
+
+
+def get_pool(db_config=None):
+    """ThreadedConnectionPool for db_config (or the POSTGRES_* env), created once per process."""
+    config = db_config or _env_config()
+    key = tuple(sorted((k, str(v)) for k, v in config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = psycopg2.pool.ThreadedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, **config)
+            _pools[key] = pool
+        return pool
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+@contextmanager
+def pooled_connection(db_config=None):
+    """
+    with pooled_connection() as conn: ...
+    Borrows a connection from the pool (SQLite file: a new connection, nothing to pool).
+    The transaction is rolled back on return, the connection is dropped if it broke.
+    """
+    if PG_EMBEDDED:
+        conn = sqlite3.connect(PG_EMBEDDED)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    pool = get_pool(db_config)
+    conn = pool.getconn()
+    broken = False
     try:
-        return pd.read_sql_query(query, conn)
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
     finally:
-        conn.close()
\ No newline at end of file
+        if not broken and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        pool.putconn(conn, close=broken or bool(conn.closed))
+
+
+# =========================================================
+# ====================== STREAMING =========================
+# =========================================================
+def iter_arrow_batches(query: str, params=None, batch_size: int = None, db_config=None):
+    """
+    Streams the result of query as Arrow RecordBatches of batch_size rows: named (server-side)
+    cursor on Postgres, so neither the server result nor the client holds more than one batch.
+    An empty result yields one empty batch (column names known).
+    """
+    batch_size = batch_size or PG_BATCH_SIZE
+    # Spans par execute / fetch (un span ouvert à travers les yield fuirait dans le contexte de l'appelant)
+    with pooled_connection(db_config) as conn:
+        if PG_EMBEDDED:
+            cur = conn.cursor()  # sqlite avance ligne par ligne au fetch
+        else:
+            cur = conn.cursor(name=f"arrow_stream_{next(_cursor_ids)}")
+            cur.itersize = batch_size
+        try:
+            with span("postgres.execute", kind="postgres", sql=" ".join(query.split())[:200]) as s:
+                cur.execute(query, params or ())
+                rows = cur.fetchmany(batch_size)  # named cursor : description connue après le 1er fetch
+                s.set(rows=len(rows))
+            names = [d[0] for d in cur.description]
+            types = [PG_ARROW_TYPES.get(d[1]) for d in cur.description]
+            yield rows_to_batch(names, types, rows)
+            while len(rows) == batch_size:
+                with span("postgres.fetch", kind="postgres") as s:
+                    rows = cur.fetchmany(batch_size)
+                    s.set(rows=len(rows))
+                if rows:
+                    yield rows_to_batch(names, types, rows)
+        finally:
+            cur.close()
+
+
+def read_arrow(query: str, params=None, batch_size: int = None, db_config=None) -> pa.Table:
+    """Whole result as one Arrow table (built batch by batch, no pandas objects)."""
+    return concat_batches(iter_arrow_batches(query, params, batch_size, db_config))
+
+
+def read_sql_df(query: str) -> pd.DataFrame:
+    with span("postgres.read_sql", kind="postgres", sql=" ".join(query.split())[:200]) as s:
+        df = read_arrow(query).to_pandas()
+        s.set(rows=len(df))
+        return df
@@ -0,0 +1,144 @@
+import os
+import uuid
+import hashlib
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import master_data
+import hive_tables
+from tracing import span
+
+# Dimension des règles d'achat : le master data produits compilé une seule fois par version
+# en colonnes typées (sku, supplier_id, moq, mxoq, pack_size numérique, leadtime).
+# Les requêtes Trino (supplier_orders, contrôle des SKU inconnus), le moteur arrow et le
+# DataQualityGuard lisent tous cette table : plus de LIKE '%Box of 6%' par ligne ni de
+# regex par produit, et une seule définition du colisage.
+#   HDFS  : /dimensions/procurement_rules/{version}/procurement_rules.parquet
+#   Trino : hive.default.procurement_rules, partition rules_version = {version}
+
+# Libellé de colisage -> taille de colis (premier motif contenu dans le libellé, sinon 1)
+PACKAGE_RULES = [
+    ("Box of 6", 6),
+    ("Box of 12", 12),
+    ("Box of 24", 24),
+    ("Pallet", 100),
+]
+
+RULES_SCHEMA = pa.schema([
+    ("sku", pa.string()),
+    ("supplier_id", pa.string()),
+    ("moq", pa.int64()),        # COALESCE(moq, 1)
+    ("mxoq", pa.int64()),       # NULL = pas de maximum connu
+    ("pack_size", pa.int64()),  # >= 1
+    ("leadtime", pa.int64()),
+])
+
+_lock = threading.Lock()
+_compiled = {}  # version -> pa.Table (dernière version compilée dans le process)
+# Publication : un seul run du process vérifie + écrit une version à la fois (backfill parallèle)
+_publish_lock = threading.Lock()
+
+
+def pack_sizes(package) -> np.ndarray:
+    """Package labels -> pack sizes (PACKAGE_RULES, NULL / unknown label -> 1)."""
+    conditions = [
+        pc.fill_null(pc.match_substring(package, pattern), False).to_numpy(zero_copy_only=False)
+        for pattern, _ in PACKAGE_RULES
+    ]
+    choices = [size for _, size in PACKAGE_RULES]
+    return np.select(conditions, choices, default=1).astype(np.int64)
+
+
+def _int_column(products, name):
+    if name not in products.column_names:
+        return pa.nulls(products.num_rows, pa.int64())
+    return products[name].cast(pa.int64())
+
+
+def compile_rules(products: pa.Table) -> pa.Table:
+    """Products (sku, supplier_id, moq, package[, mxoq, leadtime]) -> typed rules table, sorted by sku."""
+    rules = pa.table({
+        "sku": products["sku"].cast(pa.string()),
+        "supplier_id": products["supplier_id"].cast(pa.string()),
+        "moq": pc.fill_null(_int_column(products, "moq"), 1),
+        "mxoq": _int_column(products, "mxoq"),
+        "pack_size": pa.array(pack_sizes(products["package"].cast(pa.string())), pa.int64()),
+        "leadtime": _int_column(products, "leadtime"),
+    }, schema=RULES_SCHEMA)
+    return rules.sort_by("sku")
+
+
+def version(db_config=None) -> str:
+    """Version of the dimension: master data products version + compilation rules."""
+    master_data.table("products", db_config)  # probes the version once per run
+    source = master_data.version("products")
+    return hashlib.sha256(f"{source}|{PACKAGE_RULES}".encode()).hexdigest()[:16]
+
+
+def table(db_config=None) -> pa.Table:
+    """Compiled rules of the current master data version (compiled once per version in the process)."""
+    current = version(db_config)
+    with _lock:
+        rules = _compiled.get(current)
+        if rules is None:
+            with span("procurement_rules.compile", kind="master_data", version=current) as s:
+                rules = compile_rules(master_data.table("products", db_config))
+                s.set(rows=rules.num_rows)
+            _compiled.clear()
+            _compiled[current] = rules
+        return rules
+
+
+def partition() -> str:
+    """The current version of the dimension as a subquery, for the Trino stage queries."""
+    return hive_tables.PROCUREMENT_RULES.partition(version())
+
+
+def publish(hdfs, data_root, cur=None) -> str:
+    """
+    Writes the current version to HDFS (once: skipped when the partition already has its file)
+    and registers it in Trino when a cursor is given. Returns the version.
+    A published version is never deleted nor rewritten: Trino may be reading it for another run.
+    """
+    current = version()
+    location = hive_tables.PROCUREMENT_RULES.location(current)
+    filename = "procurement_rules.parquet"
+    with _publish_lock:
+        if any(st.name == filename for st in hdfs.list_status(location)):
+            print(f" Procurement rules {current} already in HDFS ({location})")
+        else:
+            rules = table()
+            print(f" Publishing procurement rules {current} ({rules.num_rows} products) to {location}")
+            _write_version(rules, data_root, location, filename, hdfs)
+    if cur is not None:
+        hive_tables.register_partition(cur, hive_tables.PROCUREMENT_RULES, current)
+    return current
+
+
+def _write_version(rules, data_root, location, filename, hdfs):
+    """
+    Local copy then HDFS, each written under a temporary hidden name (ignored by Trino) and
+    renamed into place: the file appears whole, and the partition folder is never deleted.
+    """
+    local_dir = os.path.join(data_root, location.strip("/"))
+    os.makedirs(local_dir, exist_ok=True)
+    tmp_name = f"_{filename}.{uuid.uuid4().hex}.tmp"
+    local_tmp = os.path.join(local_dir, tmp_name)
+    with span("arrow.write_parquet", kind="arrow", path=location, rows=rules.num_rows) as s:
+        pq.write_table(rules, local_tmp)
+        s.set(bytes=os.path.getsize(local_tmp))
+    try:
+        hdfs.mkdirs(location)
+        hdfs.put_file(local_tmp, f"{location}/{tmp_name}", overwrite=True)
+        if not hdfs.rename(f"{location}/{tmp_name}", f"{location}/{filename}"):
+            # Publiée entre-temps par un autre process : même version = même contenu, on garde la sienne
+            hdfs.delete(f"{location}/{tmp_name}")
+            print(f" Procurement rules already published by another run ({location})")
+        os.replace(local_tmp, os.path.join(local_dir, filename))
+    finally:
+        if os.path.exists(local_tmp):
+            os.remove(local_tmp)
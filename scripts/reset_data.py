@@ -1,15 +1,14 @@
 
 import os
 from datetime import date
-from hdfs_client import WebHDFSClient
+from run_context import RunContext
 
 RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
 
 print(f"---  CLEANING HDFS DATA FOR {RUN_DATE} ---")
 
 try:
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user="root")
+    hdfs = RunContext.from_env(RUN_DATE).hdfs()  # STORAGE_BACKEND / HDFS_BASE_URL
     
     paths_to_delete = [
         f"/raw/orders/{RUN_DATE}",
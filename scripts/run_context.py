@@ -0,0 +1,43 @@
+import os
+from collections import namedtuple
+from datetime import date, timedelta
+from hdfs_client import WebHDFSClient
+from storage import Storage, LocalStorage, resolve_backend
+
+# Everything that identifies one pipeline run. The stages receive it as `ctx` instead of
+# reading module-level RUN_DATE / DATA_ROOT globals, so several dates can run in the
+# same process (backfill.py) without sharing state. In Trino each run only registers /
+# rewrites its own run_date partitions (hive_tables.py). ctx.hdfs() opens the storage backend
+# of the run (STORAGE_BACKEND, storage.py): WebHDFS, or the same paths under STORAGE_ROOT.
+
+
+class RunContext(namedtuple("RunContext", ["run_date", "data_root", "hdfs_base_url", "hdfs_user",
+                                           "storage", "storage_root"], defaults=("webhdfs", None))):
+    __slots__ = ()
+
+    @classmethod
+    def from_env(cls, run_date=None):
+        """Context of a run: RUN_DATE / DATA_ROOT / HDFS_* / STORAGE_* from the environment, run_date overrides RUN_DATE."""
+        data_root = os.getenv("DATA_ROOT", "/app/data")
+        return cls(
+            run_date=run_date or os.getenv("RUN_DATE") or date.today().isoformat(),
+            data_root=data_root,
+            hdfs_base_url=os.getenv("HDFS_BASE_URL", "http://namenode:9870"),
+            hdfs_user=os.getenv("HDFS_USER", "root"),
+            storage=resolve_backend(),
+            storage_root=os.getenv("STORAGE_ROOT") or os.path.join(data_root, "hdfs"),
+        )
+
+    def hdfs(self) -> Storage:
+        """Storage backend of the run (WebHDFSClient or LocalStorage, same methods)."""
+        if self.storage == "local":
+            return LocalStorage(self.storage_root or os.path.join(self.data_root, "hdfs"))
+        return WebHDFSClient(self.hdfs_base_url, user=self.hdfs_user)
+
+
+def date_range(start: str, end: str) -> list:
+    """ISO dates from start to end included."""
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    if last < first:
+        raise ValueError(f"End date {end} is before start date {start}")
+    return [(first + timedelta(days=n)).isoformat() for n in range((last - first).days + 1)]
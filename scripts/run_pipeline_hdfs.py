@@ -1,31 +1,43 @@
 import os
+import argparse
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime
 import fastavro
-from trino.dbapi import connect 
-from hdfs_client import WebHDFSClient
+import tracing
+from tracing import span
+from trino_utils import TrinoSession
 import requests
-from pg_client import read_sql_df
+import master_data
 # --- IMPORT DES ÉTAPES ---
 import generate_daily_files
 import aggregate_orders
 import net_demand
 import supplier_orders
+import fused_pipeline
+import arrow_engine
+from stage_cache import StageCache, local_files, hdfs_files, code_version, master_data_version
 from data_quality import DataQualityGuard  # Import de votre garde-fou
+from dag import Task, run_dag
+from engines import resolve_engine
+from run_context import RunContext
+import hive_tables
+import procurement_rules
+import compaction
 # from trino_utils import ensure_schema
 
 # --- 1. CONFIGURATION ---
-RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
-
+# RUN_DATE / DATA_ROOT / HDFS_* : voir RunContext.from_env (un contexte par run, cf. backfill.py)
 TRINO_HOST = os.getenv("TRINO_HOST",'trino')
 TRINO_PORT = int(os.getenv("TRINO_PORT", 8080))
 TRINO_USER = os.getenv("TRINO_USER", "admin")
 TRINO_CATALOG = os.getenv("TRINO_CATALOG", "hive")
 TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
 
+# Moteur d'exécution des étapes 1-3 : "trino" (INSERT dans les partitions) ou "arrow" (in-process)
+PIPELINE_ENGINE = resolve_engine(os.getenv("PIPELINE_ENGINE"))
+# "staged" (3 tables Parquet) ou "fused" (une seule requête, voir fused_pipeline.py)
+PIPELINE_MODE = fused_pipeline.resolve_mode()
+
 
 # Configuration pour la connexion Postgres (utilisée par DataQualityGuard)
 DB_CONFIG = {
@@ -37,49 +49,74 @@ DB_CONFIG = {
 }
 
 
-def setup_hdfs_structure(hdfs):
+def setup_hdfs_structure(hdfs, ctx):
     """Crée l'arborescence complète demandée dans HDFS."""
     folders = [
-        f"/raw/orders/{RUN_DATE}",
-        f"/raw/stock/{RUN_DATE}",
-        f"/processed/aggregated_orders/{RUN_DATE}",
-        f"/processed/net_demand/{RUN_DATE}",
-        f"/output/supplier_orders/{RUN_DATE}",
-        f"/logs/exceptions/date={RUN_DATE}"
+        f"/raw/orders/{ctx.run_date}",
+        f"/raw/stock/{ctx.run_date}",
+        f"/processed/aggregated_orders/{ctx.run_date}",
+        f"/processed/net_demand/{ctx.run_date}",
+        f"/output/supplier_orders/{ctx.run_date}",
+        f"/logs/exceptions/date={ctx.run_date}"
     ]
     for folder in folders:
         print(f" Configuration HDFS : {folder}")
         hdfs.mkdirs(folder)
 
 
-def check_files_existence():
-    """A simple check to ensure the files were generated locally."""
-    local_dir = os.path.join(DATA_ROOT, "raw/orders", RUN_DATE)
-    if not os.path.exists(local_dir):
-        print(f" Warning: Local directory not found: {local_dir}")
+def received_order_files(hdfs, ctx):
+    """Fichiers marchés du jour dans HDFS (noms d'origine si la partition est déjà compactée)."""
+    return [f for f in compaction.source_names(hdfs, compaction.RAW_ORDERS, ctx.run_date) if f.endswith('.avro')]
+
+
+def check_files_existence(ctx, hdfs):
+    """A simple check to ensure the files were uploaded to HDFS."""
+    files = received_order_files(hdfs, ctx)
+    if not files:
+        print(f" Warning: no Avro file found in HDFS: /raw/orders/{ctx.run_date}")
         return
-    
-    files = [f for f in os.listdir(local_dir) if f.endswith('.avro')]
     print(f"  Found {len(files)} Avro files ready for processing.")
 
-def check_missing_markets(guard):
+# --- FINGERPRINTS DU CACHE D'ÉTAPES (voir stage_cache.py) ---
+def raw_files(ctx, hdfs, kind):
+    """Fichiers RAW lus par les étapes 1-3 : copie locale (arrow) ou HDFS (trino)."""
+    if PIPELINE_ENGINE == "arrow":
+        return local_files(os.path.join(ctx.data_root, "raw", kind, ctx.run_date))
+    return hdfs_files(hdfs, f"/raw/{kind}/{ctx.run_date}")
+
+
+def stage_output(ctx, hdfs, hdfs_dir):
+    """Fichiers produits par une étape (HDFS + miroir local lu par l'étape suivante en arrow)."""
+    files = {"hdfs": hdfs_files(hdfs, hdfs_dir)}
+    if PIPELINE_ENGINE == "arrow":
+        files["local"] = local_files(os.path.join(ctx.data_root, hdfs_dir.strip("/")))
+    return files
+
+
+def engine_version(*selects):
+    """Ce qui définit le calcul : texte SQL (trino) ou code du moteur in-process (arrow)."""
+    if PIPELINE_ENGINE == "arrow":
+        return code_version(arrow_engine)
+    return "".join(selects)
+
+
+def output_exists(ctx, hdfs, hdfs_dir):
+    return all(stage_output(ctx, hdfs, hdfs_dir).values())
+
+
+def check_missing_markets(guard, ctx, hdfs):
     """
     Vérifie quels marchés n'ont PAS envoyé de fichier aujourd'hui.
     """
     print(" Checking for missing market files...")
     
     # 1. Obtenir la liste théorique des marchés depuis Postgres
-    df_markets = read_sql_df("SELECT market_id FROM market")
+    df_markets = master_data.df("market", ["market_id"])
     expected_markets = set(df_markets["market_id"].tolist())
     
-    # 2. Obtenir la liste des fichiers reçus localement
-    local_dir = os.path.join(DATA_ROOT, "raw/orders", RUN_DATE)
-    if not os.path.exists(local_dir):
-        print("   No orders directory found!")
-        return
-
+    # 2. Obtenir la liste des fichiers reçus dans HDFS (la copie locale est optionnelle)
     # On extrait l'ID du marché du nom de fichier (ex: 'orders_MKT-001.avro' -> 'MKT-001')
-    received_files = [f for f in os.listdir(local_dir) if f.endswith('.avro')]
+    received_files = received_order_files(hdfs, ctx)
     received_markets = set()
     for f in received_files:
         # On suppose le format "orders_{MARKET_ID}.avro"
@@ -96,26 +133,23 @@ def check_missing_markets(guard):
             guard.log_issue(
                 rule_name="MISSING_FILE",
                 entity_id=mkt,
-                details=f"Market {mkt} did not send data for {RUN_DATE}",
+                details=f"Market {mkt} did not send data for {ctx.run_date}",
                 severity="MEDIUM" # Ce n'est pas critique, le pipeline peut continuer
             )
     else:
         print("  All markets sent their files.")
 
-def check_ghost_skus(cur, guard):
+def check_ghost_skus(cur, guard, ctx):
     """Demande à Trino de trouver les produits vendus qui n'existent pas dans la base."""
     print(" Checking for Ghost SKUs (Unknown Products)...")
     
-    # On suppose que tu as une table 'hive.processed.aggregated_orders_{DATE}'
-    table_agg = f"hive.processed.aggregated_orders_{RUN_DATE.replace('-', '_')}"
-    
-    # On vérifie si la table existe d'abord
+    # Partition du jour des commandes RAW (market_id) et dimension des règles d'achat
     try:
         query = f"""
-            SELECT agg.sku, agg.market_id 
-            FROM {table_agg} agg
-            LEFT JOIN hive.default.temp_products_today p ON agg.sku = p.sku
-            WHERE p.sku IS NULL
+            SELECT DISTINCT o.sku, o.market_id 
+            FROM {hive_tables.RAW_ORDERS.partition(ctx.run_date)} o
+            LEFT JOIN {procurement_rules.partition()} r ON o.sku = r.sku
+            WHERE r.sku IS NULL
         """
         cur.execute(query)
         ghosts = cur.fetchall()
@@ -133,85 +167,272 @@ def check_ghost_skus(cur, guard):
             print("   All SKUs are valid.")
             
     except Exception as e:
-        print(f"   Could not check ghost SKUs (Table might not exist yet): {e}")
+        print(f"   Could not check ghost SKUs (partition might not be registered yet): {e}")
 
-def main():
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
-    
-    # ensure_schema("processed")
 
-    # 1. Initialisation du Garde (Charge les MxOQ depuis Postgres)
-    guard = DataQualityGuard(RUN_DATE, DB_CONFIG)
-    
-    try:
-        print(f"\n --- DÉMARRAGE DU PIPELINE GLOBAL ({RUN_DATE}) ---")
-        
-        # 1. Connect to Trino (Service Name: trino)
-        
-        conn = connect(
-            host=TRINO_HOST,
-            port=TRINO_PORT,
-            user=TRINO_USER,
-            catalog=TRINO_CATALOG,
-            schema=TRINO_SCHEMA
-        )    
-        cur = conn.cursor()
-
-
-        # --- 🛠️ FIX: CREATE SCHEMAS FIRST ---
-        # We must ensure the 'folders' exist in the database before creating tables in them.
-        print("Checking schemas...")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS default")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS processed")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS hive.output")
-        
-        # --- ÉTAPE 0 : PRÉPARATION, GÉNÉRATION ET VALIDATION ---
+def publish_exceptions(hdfs, guard, ctx, cur=None):
+    """Parquet parts of the guard -> partition run_date of hive.default.exceptions (registered if cur)."""
+    location = hive_tables.EXCEPTIONS.location(ctx.run_date)
+    hdfs.delete(location, recursive=True)
+    hdfs.mkdirs(location)
+    guard.sink.flush()
+    for path in guard.sink.part_files():
+        hdfs.put_file(path, f"{location}/{os.path.basename(path)}", overwrite=True)
+    if cur is not None:
+        hive_tables.register_partition(cur, hive_tables.EXCEPTIONS, ctx.run_date)
+
+
+def build_tasks(ctx, hdfs, trino, guard, cache, master_version):
+    """
+    Le run sous forme de graphe (dag.py) : chaque tâche déclare ses dépendances et les
+    ressources qu'elle occupe. La dimension des règles d'achat, la partition de stock et le
+    contrôle des marchés manquants tournent en parallèle de l'agrégation.
+    """
+    engine = PIPELINE_ENGINE
+    prepared = trino is not None  # partition de stock / règles d'achat enregistrées par leurs propres tâches
+
+    # --- ÉTAPE 0 : PRÉPARATION, GÉNÉRATION ET VALIDATION ---
+    def hdfs_setup():
         print("\n[Étape 0] Préparation HDFS et Simulation Chaos...")
-        setup_hdfs_structure(hdfs)
-        
-        # Génération des fichiers (avec erreurs simulées)
-        generate_daily_files.main()
-        
-        check_files_existence()
+        with span("stage.hdfs_setup", kind="stage"):
+            setup_hdfs_structure(hdfs, ctx)
 
-        # VÉRIFICATION DES FICHIERS MANQUANTS
-        check_missing_markets(guard)
-        
-        # --- ÉTAPE 1 : AGGRÉGATION (Trino) ---
+    # Génération des fichiers (avec erreurs simulées)
+    def generated():
+        raw = [hdfs_files(hdfs, f"/raw/{kind}/{ctx.run_date}") for kind in ("orders", "stock")]
+        if generate_daily_files.WRITE_LOCAL_COPY:
+            raw += [local_files(os.path.join(ctx.data_root, "raw", kind, ctx.run_date)) for kind in ("orders", "stock")]
+        return all(raw)
+
+    def generation():
+        with span("stage.generation", kind="stage"):
+            cache.run("generation",
+                      inputs=lambda: {
+                          "master_data": master_version,
+                          "params": [generate_daily_files.MAX_SKUS_PER_MARKET, generate_daily_files.LOCATIONS,
+                                     generate_daily_files.PROB_MISSING_FILE, generate_daily_files.PROB_GHOST_SKU],
+                          "code": code_version(generate_daily_files),
+                      },
+                      outputs=generated,
+                      fn=lambda: generate_daily_files.main(trino, ctx=ctx))
+        check_files_existence(ctx, hdfs)
+
+    # VÉRIFICATION DES FICHIERS MANQUANTS
+    def missing_markets():
+        with span("stage.missing_markets", kind="stage"):
+            check_missing_markets(guard, ctx, hdfs)
+
+    # Règles d'achat compilées (une fois par version du master data) : HDFS + partition Trino
+    def rules_dimension():
+        with span("stage.procurement_rules", kind="stage"):
+            if trino is None:
+                procurement_rules.publish(hdfs, ctx.data_root)
+                return
+            with trino.cursor("supplier_orders") as cur:
+                procurement_rules.publish(hdfs, ctx.data_root, cur)
+
+    # Partition Trino du jour indépendante de l'agrégation
+
+    def stock_partition():
+        with span("stage.stock_partition", kind="stage"), trino.cursor("net_demand") as cur:
+            net_demand.register_stock(cur, ctx)
+
+    # --- ÉTAPES 1-3 EN UNE SEULE REQUÊTE (pas de tables intermédiaires sauf audit) ---
+    def fused():
+        print("\n[Étapes 1-3] Agrégation + demande nette + ordres d'achat (fused)...")
+        with span("stage.fused", kind="stage"):
+            cache.run("fused",
+                      inputs=lambda: {
+                          "orders": raw_files(ctx, hdfs, "orders"),
+                          "stock": raw_files(ctx, hdfs, "stock"),
+                          "master_data": master_version,
+                          "rules": procurement_rules.version(),  # dimension compilée (PACKAGE_RULES inclus)
+                          "engine": [engine, fused_pipeline.MATERIALIZE_INTERMEDIATE,
+                                     engine_version(fused_pipeline.fused_select(ctx))],
+                      },
+                      outputs=lambda: output_exists(ctx, hdfs, f"/output/supplier_orders/{ctx.run_date}"),
+                      fn=lambda: fused_pipeline.main(guard, engine=engine, session=trino, ctx=ctx, prepared=prepared))
+
+    # --- ÉTAPE 1 : AGGRÉGATION (Trino ou arrow) ---
+    def aggregation():
         print("\n[Étape 1] Lancement de l'agrégation des ventes...")
         # On passe le guard pour vérifier la Magnitude (MxOQ)
-        aggregate_orders.main(guard)
-        
-        # VÉRIFICATION DES PRODUITS INCONNUS
-        check_ghost_skus(cur, guard)
+        with span("stage.aggregation", kind="stage"):
+            cache.run("aggregation",
+                      inputs=lambda: {
+                          "orders": raw_files(ctx, hdfs, "orders"),
+                          "master_data": master_version,
+                          "rules": procurement_rules.version(),
+                          "engine": [engine, engine_version(aggregate_orders.AGG_SELECT)],
+                      },
+                      outputs=lambda: output_exists(ctx, hdfs, f"/processed/aggregated_orders/{ctx.run_date}"),
+                      fn=lambda: aggregate_orders.main(guard, engine=engine, session=trino, ctx=ctx, prepared=prepared))
+
+    # VÉRIFICATION DES PRODUITS INCONNUS (tables Trino)
+    def ghost_skus():
+        with span("stage.ghost_skus", kind="stage"), trino.cursor("ghost_skus") as cur:
+            check_ghost_skus(cur, guard, ctx)
 
-        # --- ÉTAPE 2 : DEMANDE NETTE (Trino) ---
+    # --- ÉTAPE 2 : DEMANDE NETTE ---
+    def net_demand_stage():
         print("\n[Étape 2] Lancement du calcul de la demande nette...")
         # On passe le guard pour vérifier la Logique de Stock (Reserved > Available)
-        net_demand.main(guard)
+        with span("stage.net_demand", kind="stage"):
+            cache.run("net_demand",
+                      inputs=lambda: {
+                          "aggregated": stage_output(ctx, hdfs, f"/processed/aggregated_orders/{ctx.run_date}"),
+                          "stock": raw_files(ctx, hdfs, "stock"),
+                          "master_data": master_version,
+                          "engine": [engine, engine_version(net_demand.NET_DEMAND_SELECT)],
+                      },
+                      outputs=lambda: output_exists(ctx, hdfs, f"/processed/net_demand/{ctx.run_date}"),
+                      fn=lambda: net_demand.main(guard, engine=engine, session=trino, ctx=ctx, prepared=prepared))
 
-        # --- ÉTAPE 3 : COMMANDES FOURNISSEURS (Trino) ---
+    # --- ÉTAPE 3 : COMMANDES FOURNISSEURS ---
+    def supplier_orders_stage():
         print("\n[Étape 3] Génération des ordres d'achat...")
-        supplier_orders.main(guard)
+        with span("stage.supplier_orders", kind="stage"):
+            cache.run("supplier_orders",
+                      inputs=lambda: {
+                          "net_demand": stage_output(ctx, hdfs, f"/processed/net_demand/{ctx.run_date}"),
+                          "master_data": master_version,
+                          "rules": procurement_rules.version(),
+                          "engine": [engine, engine_version(supplier_orders.SUPPLIER_ORDERS_SELECT)],
+                      },
+                      outputs=lambda: output_exists(ctx, hdfs, f"/output/supplier_orders/{ctx.run_date}"),
+                      fn=lambda: supplier_orders.main(guard, engine=engine, session=trino, ctx=ctx, prepared=prepared))
 
-        # --- ÉTAPE FINALE : SAUVEGARDE ET EXPORT DU RAPPORT ---
+    # --- COMPACTION DES PETITS FICHIERS (PIPELINE_COMPACTION=1, voir compaction.py) ---
+    # Après les étapes qui lisent la partition RAW : un échec n'invalide pas les ordres du jour
+    def compaction_stage():
+        print("\n[Compaction] Fusion des petits fichiers du jour...")
+        with span("stage.compaction", kind="stage"):
+            try:
+                compaction.compact_run(hdfs, ctx.run_date, session=trino)
+            except Exception as e:
+                print(f" Warning: compaction failed ({e}), small files kept")
+
+    # --- ÉTAPE FINALE : SAUVEGARDE ET EXPORT DU RAPPORT ---
+    def report_save():
         print("\n[Étape 4] Sauvegarde du rapport d'exceptions...")
-        log_dir_local = os.path.join(DATA_ROOT, "logs/exceptions")
-        
-        # Sauvegarde le CSV localement (gère la création du dossier date=...)
-        guard.save_report(log_dir_local)
+        with span("stage.report_save", kind="stage", rows=len(guard.sink)):
+            log_dir_local = os.path.join(ctx.data_root, "logs/exceptions")
+
+            # Export CSV local (gère la création du dossier date=...) : les parts Parquet sont déjà écrites
+            local_report_file = guard.save_report(log_dir_local)
+
+            # Copie du rapport vers HDFS pour archivage centralisé + partition de hive.default.exceptions
+            if local_report_file:
+                hdfs.put_file(local_report_file, f"/logs/exceptions/date={ctx.run_date}/exceptions.csv", overwrite=True)
+            if trino is None:
+                publish_exceptions(hdfs, guard, ctx)
+                return
+            with trino.cursor("report_save") as cur:
+                publish_exceptions(hdfs, guard, ctx, cur)
+
+    # Ressources : le moteur arrow calcule en local, seules ses écritures passent par HDFS
+    compute = ["trino", "hdfs"] if trino is not None else ["hdfs"]
+    tasks = [
+        Task("hdfs_setup", hdfs_setup, resources=["hdfs"]),
+        Task("generation", generation, deps=["hdfs_setup"], resources=["hdfs", "postgres"]),
+        Task("missing_markets", missing_markets, deps=["generation"], resources=["postgres"]),
+        Task("procurement_rules", rules_dimension, deps=["hdfs_setup"],
+             resources=["hdfs", "postgres"] + (["trino"] if trino is not None else [])),
+    ]
+    if trino is not None:
+        tasks.append(Task("stock_partition", stock_partition, deps=["hdfs_setup"], resources=["trino"]))
+    rules = ["procurement_rules"]
+    stock = ["stock_partition"] if trino is not None else []
+
+    if PIPELINE_MODE == "fused":
+        tasks.append(Task("fused", fused, deps=["generation"] + rules + stock, resources=compute))
+    else:
+        tasks.append(Task("aggregation", aggregation, deps=["generation"] + (rules if trino is not None else []),
+                          resources=compute))
+        if trino is not None:
+            tasks.append(Task("ghost_skus", ghost_skus, deps=["aggregation", "procurement_rules"], resources=["trino"]))
+        tasks += [
+            Task("net_demand", net_demand_stage, deps=["aggregation"] + stock, resources=compute),
+            Task("supplier_orders", supplier_orders_stage, deps=["net_demand"] + rules, resources=compute),
+        ]
+    if compaction.PIPELINE_COMPACTION:
+        tasks.append(Task("compaction", compaction_stage, deps=[t.name for t in tasks], resources=["hdfs"]))
+    tasks.append(Task("report_save", report_save, deps=[t.name for t in tasks], resources=["hdfs"]))
+    return tasks
+
+
+def run(ctx, cache_mode=None, metrics=True):
+    """
+    Un run complet du pipeline pour ctx.run_date ; retourne True en cas de succès.
+    Plusieurs dates peuvent tourner en même temps dans le process (voir backfill.py) :
+    tout l'état du run est dans ctx / ce cadre, chaque date n'écrit que ses partitions run_date.
+    """
+    if PIPELINE_ENGINE == "trino" and ctx.storage == "local":
+        raise ValueError("STORAGE_BACKEND=local needs PIPELINE_ENGINE=arrow (Trino reads its tables from HDFS)")
+    if PIPELINE_ENGINE == "arrow" and not generate_daily_files.WRITE_LOCAL_COPY:
+        raise ValueError("PIPELINE_ENGINE=arrow reads the local RAW copy: it needs WRITE_LOCAL_COPY=1")
+    hdfs = ctx.hdfs()
+    success = False
+    trino = TrinoSession(TRINO_HOST, TRINO_PORT, TRINO_USER, TRINO_CATALOG, TRINO_SCHEMA) \
+        if PIPELINE_ENGINE == "trino" else None
+    
+    # ensure_schema("processed")
+
+    # Span racine du run : la trace ne contient que les spans de cette date
+    with span("pipeline.run", kind="run", run_date=ctx.run_date) as root:
+        # 1. Initialisation du Garde (Charge les MxOQ depuis Postgres)
+        with span("stage.guard_init", kind="stage"):
+            guard = DataQualityGuard(ctx.run_date, DB_CONFIG,
+                                     exceptions_dir=os.path.join(ctx.data_root, "logs/exceptions"))
+
+        # Cache d'étapes : une étape dont les entrées n'ont pas changé depuis son dernier succès est sautée
+        cache = StageCache(ctx.run_date, ctx.data_root, cache_mode, guard=guard)
+        master_version = master_data_version() if cache.mode != "off" else None
+    
+        try:
+            print(f"\n --- DÉMARRAGE DU PIPELINE GLOBAL ({ctx.run_date}, engine={PIPELINE_ENGINE}, mode={PIPELINE_MODE}, "
+                  f"cache={cache.mode}) ---")
         
-        # Copie du rapport vers HDFS pour archivage centralisé
-        local_report_file = os.path.join(log_dir_local, f"date={RUN_DATE}/exceptions.csv")
-        if os.path.exists(local_report_file):
-            hdfs.put_file(local_report_file, f"/logs/exceptions/date={RUN_DATE}/exceptions.csv", overwrite=True)
+            # 1. Session Trino unique pour tout le run (pool HTTP, schémas / tables partitionnées créés une seule fois) - inutile avec arrow
+            if trino is not None:
+                print("Checking schemas...")
+                trino.bootstrap()
 
-        print(f"\n --- PIPELINE TERMINÉ AVEC SUCCÈS POUR LE {RUN_DATE} ---")
+            # 2. Étapes du run : graphe de dépendances, tâches indépendantes en parallèle
+            tasks = build_tasks(ctx, hdfs, trino, guard, cache, master_version)
+            cache.set_dag(tasks)  # resume : une étape n'est relancée que si l'une de ses dépendances l'a été
+            run_dag(tasks, name=f"run-{ctx.run_date}")
 
-    except Exception as e:
-        print(f"\n ERREUR CRITIQUE DANS LE PIPELINE : {e}")
-        guard.log_issue("PIPELINE_CRASH", "SYSTEM", str(e))
-        guard.save_report(os.path.join(DATA_ROOT, "logs/exceptions"))
+            success = True
+            print(f"\n --- PIPELINE TERMINÉ AVEC SUCCÈS POUR LE {ctx.run_date} ---")
+
+        except Exception as e:
+            print(f"\n ERREUR CRITIQUE DANS LE PIPELINE : {e}")
+            guard.log_issue("PIPELINE_CRASH", "SYSTEM", str(e))
+            guard.save_report(os.path.join(ctx.data_root, "logs/exceptions"))
+
+        finally:
+            if trino is not None:
+                trino.close()
+
+    # Trace JSON + métriques Prometheus (textfile) sous DATA_ROOT/logs
+    trace_path, metrics_path = tracing.write_run_files(
+        ctx.data_root, ctx.run_date, success=success, root=root, metrics=metrics,
+        extra={"engine": PIPELINE_ENGINE, "mode": PIPELINE_MODE, "cache": cache.mode})
+    print(f" Trace : {trace_path} | Metrics : {metrics_path}")
+    return success
+
+
+def main(cache_mode=None):
+    tracing.reset()
+    master_data.reset()  # nouvelle sonde de version par run (process long du scheduler)
+    return run(RunContext.from_env(), cache_mode)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline quotidien (génération -> ordres fournisseurs)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", dest="cache_mode", action="store_const", const="resume",
+                       help="reprend après un crash : saute les étapes réussies, relance tout à partir de la première à refaire")
+    group.add_argument("--no-cache", dest="cache_mode", action="store_const", const="off",
+                       help="relance toutes les étapes (ignore les manifests)")
+    main(parser.parse_args().cache_mode)
\ No newline at end of file
@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+import inspect
+from contextlib import nullcontext
+from datetime import datetime
+
+from tracing import span
+
+# Input-fingerprinted stage cache. Each stage of run_pipeline_hdfs writes a manifest
+# DATA_ROOT/logs/manifests/{run_date}/{stage}.json with the fingerprint of its inputs
+# (files: size + mtime or checksum, master data version, SQL text / engine code) and
+# its status. On the next run of the same date:
+#   cache  : a stage whose inputs are unchanged and whose outputs exist is skipped
+#   resume : same, but a stage also runs when one of its DAG upstreams ran in this run
+#            (failed / invalidated), independent branches keep their cache
+#   off    : every stage runs (previous behaviour)
+CACHE_MODES = ("cache", "resume", "off")
+PIPELINE_CACHE = os.getenv("PIPELINE_CACHE", "cache")
+# 1 = sha256 of the local input files instead of size + mtime (slower, survives a copy/touch)
+STAGE_CACHE_CHECKSUM = os.getenv("STAGE_CACHE_CHECKSUM", "0") == "1"
+
+
+def resolve_cache_mode(mode=None) -> str:
+    name = (mode or PIPELINE_CACHE).strip().lower()
+    if name not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{name}' (expected one of {CACHE_MODES})")
+    return name
+
+
+# =========================================================
+# ==================== FINGERPRINTS ========================
+# =========================================================
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def local_files(path: str, checksum: bool = STAGE_CACHE_CHECKSUM) -> dict:
+    """{relative file: [size, mtime_ns] or sha256} of a local file or directory tree ({} if missing)."""
+    if os.path.isfile(path):
+        entries = [(os.path.basename(path), path)]
+    else:
+        entries = []
+        for dirpath, _, files in os.walk(path):
+            entries += [(os.path.relpath(os.path.join(dirpath, f), path), os.path.join(dirpath, f)) for f in files]
+    result = {}
+    for name, full in sorted(entries):
+        if checksum:
+            result[name] = _sha256_file(full)
+        else:
+            st = os.stat(full)
+            result[name] = [st.st_size, st.st_mtime_ns]
+    return result
+
+
+def hdfs_files(hdfs, hdfs_dir: str) -> dict:
+    """{file: [length, modificationTime]} of an HDFS directory (LISTSTATUS, {} if missing)."""
+    return {st.name: [st.length, st.modification_time] for st in hdfs.list_status(hdfs_dir) if st.is_file}
+
+
+def code_version(*objects) -> str:
+    """Fingerprint of the source code of modules / functions (engine code instead of SQL text)."""
+    return sha256_text("".join(inspect.getsource(o) for o in objects))
+
+
+def master_data_version() -> str:
+    """Fingerprint of the master data the stages depend on (version probes of master_data.py)."""
+    import master_data
+
+    return sha256_text(master_data.version())
+
+
+def digest(value) -> str:
+    return sha256_text(json.dumps(value, sort_keys=True, default=str))
+
+
+# =========================================================
+# ====================== CACHE =============================
+# =========================================================
+class StageCache:
+    """
+    Usage:
+        cache = StageCache(ctx.run_date, ctx.data_root, guard=guard)
+        cache.run("aggregation", inputs=lambda: {...}, outputs=lambda: True/False, fn=lambda: ...)
+    """
+
+    def __init__(self, run_date: str, data_root: str, mode: str = None, guard=None):
+        self.run_date = run_date
+        self.mode = resolve_cache_mode(mode)
+        self.guard = guard
+        self.manifest_dir = os.path.join(data_root, "logs/manifests", run_date)
+        self.upstreams = {}  # resume: stage -> DAG tasks it depends on, directly or not (set_dag)
+        self.reran = set()   # resume: stages that ran in this run
+
+    def set_dag(self, tasks):
+        """Upstream tasks of every stage, from the dag.Task list (transitive closure of deps)."""
+        deps = {t.name: set(t.deps) for t in tasks}
+        for name in deps:
+            seen, todo = set(), list(deps[name])
+            while todo:
+                dep = todo.pop()
+                if dep not in seen:
+                    seen.add(dep)
+                    todo += deps.get(dep, ())
+            self.upstreams[name] = seen
+
+    def _rerun_upstreams(self, stage: str) -> set:
+        # Sans DAG connu : toute étape déjà relancée compte (reprise séquentielle)
+        upstreams = self.upstreams.get(stage)
+        return set(self.reran) if upstreams is None else upstreams & self.reran
+
+    def manifest_path(self, stage: str) -> str:
+        return os.path.join(self.manifest_dir, f"{stage}.json")
+
+    def load(self, stage: str):
+        try:
+            with open(self.manifest_path(stage)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, stage: str, manifest: dict):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = self.manifest_path(stage)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.replace(path + ".tmp", path)
+
+    def is_fresh(self, stage: str, part_digests: dict, outputs) -> tuple:
+        """(fresh?, reason) for the stage against its last manifest."""
+        manifest = self.load(stage)
+        if manifest is None:
+            return False, "no manifest"
+        if manifest.get("status") != "success":
+            return False, f"last run {manifest.get('status')}"
+        if manifest.get("issues_truncated"):
+            # Trop d'anomalies pour le manifest : l'étape est relancée pour les retrouver dans le rapport
+            return False, "issues not replayable"
+        previous = manifest.get("input_digests", {})
+        changed = sorted(k for k in set(previous) | set(part_digests) if previous.get(k) != part_digests.get(k))
+        if changed:
+            return False, f"inputs changed: {', '.join(changed)}"
+        if not outputs():
+            return False, "output missing"
+        return True, "inputs unchanged"
+
+    def run(self, stage: str, inputs, outputs, fn):
+        """Runs fn unless the stage is fresh; returns fn's result (None when skipped)."""
+        if self.mode == "off":
+            return fn()
+
+        with span(f"cache.{stage}", kind="cache") as s:
+            fingerprint = inputs()
+            part_digests = {k: digest(v) for k, v in fingerprint.items()}
+            rerun = self._rerun_upstreams(stage) if self.mode == "resume" else set()
+            if rerun:
+                fresh, reason = False, f"resumed after {', '.join(sorted(rerun))}"
+            else:
+                fresh, reason = self.is_fresh(stage, part_digests, outputs)
+            s.set(fresh=fresh, reason=reason)
+
+        if fresh:
+            print(f" ⏭  Stage '{stage}' skipped ({reason})")
+            if self.guard is not None:
+                # Les anomalies détectées par l'étape lors de son dernier run sont reprises dans le rapport
+                self.guard.replay(self.load(stage).get("issues", []))
+            return None
+
+        print(f" ▶  Stage '{stage}' runs ({reason})")
+        if self.mode == "resume":
+            self.reran.add(stage)
+        manifest = {
+            "stage": stage,
+            "run_date": self.run_date,
+            "status": "running",
+            "started_at": datetime.now().isoformat(),
+            "digest": digest(fingerprint),
+            "input_digests": part_digests,
+            "inputs": fingerprint,
+        }
+        self._save(stage, manifest)
+        try:
+            # Only the issues of this stage (other DAG tasks log into the same guard meanwhile)
+            with self.guard.capture() if self.guard is not None else nullcontext([]) as issues:
+                result = fn()
+        except BaseException as e:
+            manifest.update(status="failed", finished_at=datetime.now().isoformat(), error=f"{type(e).__name__}: {e}")
+            self._save(stage, manifest)
+            raise
+        manifest.update(status="success", finished_at=datetime.now().isoformat(), issues=list(issues),
+                        issues_truncated=getattr(issues, "truncated", False))
+        self._save(stage, manifest)
+        return result
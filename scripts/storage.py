@@ -0,0 +1,336 @@
+import os
+import shutil
+import hashlib
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span, propagate
+
+# Stockage des fichiers du pipeline derrière une seule interface (chemins absolus façon HDFS,
+# "/raw/orders/2026-01-14/orders_MKT-001.avro") :
+#   webhdfs : WebHDFSClient (hdfs_client.py), namenode + datanodes en HTTP
+#   local   : LocalStorage, les mêmes chemins sous STORAGE_ROOT (un seul nœud, CI : aucun appel HTTP)
+# Choisi par STORAGE_BACKEND (RunContext.hdfs()). Le backend local ne sert qu'au moteur arrow :
+# Trino lit ses tables dans HDFS.
+STORAGE_BACKENDS = ("webhdfs", "local")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "webhdfs")
+# Transfers run at the same time by put_many / get_many / mirror (both backends)
+HDFS_MAX_WORKERS = int(os.getenv("HDFS_MAX_WORKERS", "8"))
+
+
+def resolve_backend(name=None) -> str:
+    backend = (name or STORAGE_BACKEND).strip().lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (expected one of {STORAGE_BACKENDS})")
+    return backend
+
+
+# Result of one transfer in put_many / get_many : status = uploaded | downloaded | skipped | failed
+class TransferResult(namedtuple("TransferResult", ["local_path", "hdfs_path", "status", "error"])):
+    __slots__ = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "failed"
+
+
+# One entry of a listing (path = full storage path), LISTSTATUS / LISTSTATUS_BATCH / GETFILESTATUS in WebHDFS
+class FileStatus(namedtuple("FileStatus", ["path", "name", "type", "length", "modification_time",
+                                           "block_size", "replication", "permission", "owner", "group"])):
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, parent: str, st: dict) -> "FileStatus":
+        suffix = st.get("pathSuffix", "")  # "" for GETFILESTATUS / LISTSTATUS of a file
+        path = f"{parent.rstrip('/')}/{suffix}" if suffix else parent
+        return cls(path, suffix or path.rstrip("/").rsplit("/", 1)[-1], st["type"], st.get("length", 0), st.get("modificationTime", 0),
+                   st.get("blockSize", 0), st.get("replication", 0), st.get("permission"),
+                   st.get("owner"), st.get("group"))
+
+    @property
+    def is_file(self) -> bool:
+        return self.type == "FILE"
+
+    @property
+    def is_dir(self) -> bool:
+        return self.type == "DIRECTORY"
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hashing(chunks, h):
+    """The chunks passed through unchanged, each one added to the hashlib object h on the way."""
+    for chunk in chunks:
+        h.update(chunk)
+        yield chunk
+
+
+def sha256_stream(chunks) -> str:
+    """sha256 of a re-playable stream (put_stream's chunks); uses chunks.sha256() when it has one."""
+    if hasattr(chunks, "sha256"):
+        return chunks.sha256()
+    h = hashlib.sha256()
+    for chunk in chunks():
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def raise_for_failures(results, action="transfer"):
+    """Raises if any TransferResult of put_many / get_many failed (lists the failed files)."""
+    failed = [r for r in results if not r.ok]
+    if failed:
+        details = "; ".join(f"{r.hdfs_path}: {r.error}" for r in failed[:10])
+        raise RuntimeError(f"{len(failed)}/{len(results)} HDFS {action}(s) failed: {details}")
+
+
+class Storage:
+    """
+    Interface of a backend: mkdirs, exists, status, list_status, put_file, put_stream, get_file,
+    read_bytes, rename, delete, digest, content_summary. Bulk transfers, walk_files
+    and mirror are built on them here. kind = span kind / name prefix in the traces.
+    """
+    kind = "storage"
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #hdfs dfs -ls -R : every file under a folder (FileStatus, path relative to hdfs_dir = path[len(hdfs_dir):])
+    def walk_files(self, hdfs_dir: str):
+        pending = [hdfs_dir.rstrip("/") or "/"]
+        while pending:
+            for st in self.list_status(pending.pop()):
+                if st.is_dir:
+                    pending.append(st.path)
+                elif st.is_file:
+                    yield st
+
+    #Bulk transfers on a bounded thread pool : one TransferResult per file, errors do not stop the batch
+    def put_many(self, transfers, overwrite: bool = False, skip_existing: bool = False,
+                 skip_identical: bool = False, max_workers: int = HDFS_MAX_WORKERS) -> list:
+        """
+        transfers = iterable of (local_path, hdfs_path). Results keep the input order.
+        skip_existing: any existing file is skipped; skip_identical: only a file with the same sha256.
+        """
+        def _one(pair):
+            local_path, hdfs_path = pair
+            try:
+                if skip_existing and self.exists(hdfs_path):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                if not self.put_file(local_path, hdfs_path, overwrite=overwrite, skip_identical=skip_identical):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                return TransferResult(local_path, hdfs_path, "uploaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e))
+
+        transfers = list(transfers)
+        with span(f"{self.kind}.put_many", kind=self.kind, files=len(transfers)), \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(propagate(_one), transfers))
+
+    def put_stream_many(self, streams, overwrite: bool = False, skip_existing: bool = False,
+                        skip_identical: bool = False, max_workers: int = HDFS_MAX_WORKERS) -> list:
+        """streams = iterable of (chunks, hdfs_path), chunks as in put_stream. Results keep the input order."""
+        def _one(pair):
+            chunks, hdfs_path = pair
+            local_path = getattr(chunks, "local_path", None)
+            try:
+                if skip_existing and self.exists(hdfs_path):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                if not self.put_stream(chunks, hdfs_path, overwrite=overwrite, skip_identical=skip_identical):
+                    return TransferResult(local_path, hdfs_path, "skipped", None)
+                return TransferResult(local_path, hdfs_path, "uploaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e))
+
+        # pool.map soumet chaque flux dès que l'itérable le produit : un générateur (fichiers
+        # générés au fil de l'eau) est envoyé pendant que la suite est produite
+        with span(f"{self.kind}.put_stream_many", kind=self.kind) as s, \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(propagate(_one), streams))
+            s.set(files=len(results))
+            return results
+
+    def get_many(self, transfers, max_workers: int = HDFS_MAX_WORKERS) -> list:
+        """transfers = iterable of (hdfs_path, local_path[, length]). Results keep the input order."""
+        def _one(transfer):
+            hdfs_path, local_path = transfer[:2]
+            try:
+                self.get_file(hdfs_path, local_path, *transfer[2:])
+                return TransferResult(local_path, hdfs_path, "downloaded", None)
+            except Exception as e:
+                return TransferResult(local_path, hdfs_path, "failed", str(e))
+
+        transfers = list(transfers)
+        with span(f"{self.kind}.get_many", kind=self.kind, files=len(transfers)), \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(propagate(_one), transfers))
+
+    #hdfs dfs -get -R : one listing per folder, then every file on the worker pool (sizes from the listing)
+    def mirror(self, hdfs_dir: str, local_dir: str, max_workers: int = HDFS_MAX_WORKERS) -> list:
+        """Copies the tree under hdfs_dir into local_dir; one TransferResult per file."""
+        root = hdfs_dir.rstrip("/")
+        with span(f"{self.kind}.mirror", kind=self.kind, path=hdfs_dir):
+            transfers = [(st.path, os.path.join(local_dir, *st.path[len(root):].strip("/").split("/")), st.length)
+                         for st in self.walk_files(hdfs_dir)]
+            return self.get_many(transfers, max_workers=max_workers)
+
+
+class LocalStorage(Storage):
+    """
+    The storage paths under a local root (/raw/orders/... -> {root}/raw/orders/...).
+    Files are written to a hidden temporary file then renamed: a reader sees the old or the new content.
+    """
+    kind = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _local(self, path: str) -> str:
+        return os.path.join(self.root, path.strip("/"))
+
+    def _status(self, path: str, local: str) -> FileStatus:
+        st = os.stat(local)
+        is_dir = os.path.isdir(local)
+        return FileStatus(path, os.path.basename(path.rstrip("/")), "DIRECTORY" if is_dir else "FILE",
+                          0 if is_dir else st.st_size, int(st.st_mtime * 1000), 0, 1,
+                          oct(st.st_mode & 0o777)[2:], None, None)
+
+    def mkdirs(self, hdfs_dir: str) -> None:
+        os.makedirs(self._local(hdfs_dir), exist_ok=True)
+
+    def exists(self, hdfs_path: str) -> bool:
+        return os.path.exists(self._local(hdfs_path))
+
+    def status(self, hdfs_path: str):
+        local = self._local(hdfs_path)
+        return self._status(hdfs_path, local) if os.path.exists(local) else None
+
+    def list_status(self, hdfs_dir: str, batch: bool = False) -> list:
+        """[FileStatus] by name ([] if missing, the file itself for a file), like LISTSTATUS."""
+        local = self._local(hdfs_dir)
+        if os.path.isfile(local):
+            return [self._status(hdfs_dir, local)]
+        if not os.path.isdir(local):
+            return []
+        parent = hdfs_dir.rstrip("/")
+        return [self._status(f"{parent}/{name}", os.path.join(local, name)) for name in sorted(os.listdir(local))]
+
+    def iter_status(self, hdfs_dir: str):
+        yield from self.list_status(hdfs_dir)
+
+    def _write(self, hdfs_path: str, overwrite: bool, write):
+        target = self._local(hdfs_path)
+        if not overwrite and os.path.exists(target):
+            raise FileExistsError(hdfs_path)
+        folder, name = os.path.split(target)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                keep = write(f)
+            if keep is False:  # write() decided the file must not be replaced
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return True
+
+    def put_file(self, local_path: str, hdfs_path: str, overwrite: bool = False,
+                 skip_identical: bool = False) -> bool:
+        """Copy of local_path; skip_identical compares the sha256 of both files. Returns False when skipped."""
+        target = self._local(hdfs_path)
+        if os.path.exists(target) and os.path.samefile(local_path, target):
+            return False
+        if skip_identical and os.path.isfile(target) and sha256_file(target) == sha256_file(local_path):
+            return False
+        with span("local.put_file", kind="local", path=hdfs_path, bytes=os.path.getsize(local_path)), \
+                open(local_path, "rb") as src:
+            self._write(hdfs_path, overwrite, lambda f: shutil.copyfileobj(src, f, 1024 * 1024))
+        return True
+
+    def put_stream(self, chunks, hdfs_path: str, overwrite: bool = False, skip_identical: bool = False) -> bool:
+        """
+        skip_identical: the stream is hashed while it is written to the temporary file, which is
+        dropped when it matches the existing file (encoded once). Returns False when skipped.
+        """
+        existing = skip_identical and os.path.isfile(self._local(hdfs_path))
+        with span("local.put_stream", kind="local", path=hdfs_path) as s:
+            written = hashlib.sha256()
+
+            def _body(f):
+                for chunk in hashing(chunks(), written):
+                    f.write(chunk)
+                    s.add(bytes=len(chunk))
+                if existing:
+                    if written.hexdigest() == self.digest(hdfs_path):
+                        return False
+                    if not overwrite:
+                        raise FileExistsError(hdfs_path)
+            return self._write(hdfs_path, overwrite or existing, _body)
+
+    def get_file(self, hdfs_path: str, local_path: str, length: int = None) -> None:
+        source = self._local(hdfs_path)
+        if not os.path.isfile(source):
+            raise FileNotFoundError(hdfs_path)
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        if os.path.exists(local_path) and os.path.samefile(source, local_path):
+            return
+        with span("local.get_file", kind="local", path=hdfs_path, bytes=os.path.getsize(source)):
+            shutil.copyfile(source, local_path + ".part")
+            os.replace(local_path + ".part", local_path)
+
+    def read_bytes(self, hdfs_path: str):
+        local = self._local(hdfs_path)
+        if not os.path.isfile(local):
+            return None
+        with open(local, "rb") as f:
+            return f.read()
+
+    def rename(self, hdfs_src: str, hdfs_dst: str) -> bool:
+        source, target = self._local(hdfs_src), self._local(hdfs_dst)
+        if not os.path.exists(source) or os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(source, target)
+        return True
+
+    def delete(self, path, recursive=False):
+        local = self._local(path)
+        try:
+            if os.path.isdir(local):
+                shutil.rmtree(local) if recursive else os.rmdir(local)
+            else:
+                os.remove(local)
+        except OSError:
+            return False
+        return True
+
+    def digest(self, hdfs_path: str):
+        """sha256 of the file (None if missing): computed on the spot, no attribute to keep in sync."""
+        local = self._local(hdfs_path)
+        return sha256_file(local) if os.path.isfile(local) else None
+
+    def content_summary(self, hdfs_path: str) -> dict:
+        summary = {"length": 0, "fileCount": 0, "directoryCount": 0}
+        local = self._local(hdfs_path)
+        if os.path.isfile(local):
+            return {"length": os.path.getsize(local), "fileCount": 1, "directoryCount": 0}
+        for dirpath, dirs, files in os.walk(local):
+            summary["directoryCount"] += 1
+            summary["fileCount"] += len(files)
+            summary["length"] += sum(os.path.getsize(os.path.join(dirpath, f)) for f in files)
+        return summary
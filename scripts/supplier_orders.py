@@ -1,205 +1,221 @@
 import os
+import asyncio
 import pandas as pd
-import pandavro as pdx
-from datetime import date
-from trino.dbapi import connect
-from hdfs_client import WebHDFSClient
-from pg_client import read_sql_df 
-from collections import defaultdict
+import pyarrow as pa
+import pyarrow.compute as pc
+from trino_utils import stage_session
+from storage import raise_for_failures
+from async_hdfs_client import AsyncWebHDFSClient, HDFS_ASYNC
+import procurement_rules
+from itertools import groupby
 import json
+import arrow_engine
+from engines import resolve_engine
+from run_context import RunContext
+import hive_tables
+import compaction
+
+# Requête de l'étape 3 ; {net_demand} = partition (ou CTE) de demande nette,
+# {rules} = dimension des règles d'achat compilées (moq et pack_size numériques, voir procurement_rules.py)
+SUPPLIER_ORDERS_SELECT = """
+    SELECT 
+        nd.run_date,
+        r.supplier_id,
+        nd.sku,
+        CAST(
+            CEILING(CAST(GREATEST(nd.net_demand, r.moq) AS DOUBLE) / r.pack_size) * r.pack_size
+        AS INTEGER) as quantity
+    FROM {net_demand} nd
+    JOIN {rules} r ON nd.sku = r.sku
+    WHERE nd.net_demand > 0
+"""
 
-RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
 
-TRINO_HOST = os.getenv("TRINO_HOST",'trino')
-TRINO_PORT = int(os.getenv("TRINO_PORT", 8080))
-TRINO_USER = os.getenv("TRINO_USER", "admin")
-TRINO_CATALOG = os.getenv("TRINO_CATALOG", "hive")
-TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
+def supplier_orders_select(ctx, net_demand) -> str:
+    return SUPPLIER_ORDERS_SELECT.format(net_demand=net_demand, rules=procurement_rules.partition())
 
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
 
-def main(guard=None):
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
+# Colonnes des lignes de commande (export JSON)
+ORDER_COLUMNS = ["run_date", "supplier_id", "sku", "quantity"]
 
-    conn = connect(
-        host=TRINO_HOST,
-        port=TRINO_PORT,
-        user=TRINO_USER,
-        catalog=TRINO_CATALOG,
-        schema=TRINO_SCHEMA
-    )    
-    cur = conn.cursor()
 
-    print("Checking schemas...")
-    cur.execute("CREATE SCHEMA IF NOT EXISTS hive.default")
-    
-    print(" Fetching Products from Postgres (Bypassing Trino Catalog)...")
-    
-    df_products = read_sql_df("SELECT sku, supplier_id, moq, package FROM products")
-    
-    df_products['moq'] = df_products['moq'].fillna(1).astype(int)
-    df_products['package'] = df_products['package'].fillna("Single Unit").astype(str)
-    
-    local_prod_path = os.path.join(DATA_ROOT, "temp_products.avro")
-    pdx.to_avro(local_prod_path, df_products)
-    
-    hdfs_prod_dir = f"/raw/products/{RUN_DATE}"
-    hdfs_prod_path = f"{hdfs_prod_dir}/products.avro"
-    
-    hdfs.mkdirs(hdfs_prod_dir)
-    hdfs.put_file(local_prod_path, hdfs_prod_path, overwrite=True)
-    print(" Products uploaded to HDFS.")
+def write_supplier_json_files(ctx, rows_table):
+    """
+    One JSON per supplier from (run_date, supplier_id, sku, qty) rows ORDERED BY supplier_id:
+    each file is written as soon as its supplier is complete, so only one supplier is held in
+    memory. Returns ({supplier_id: number of items}, uploads).
+    """
+    OUTPUT_LOCAL_DIR = f"{ctx.data_root}/output/supplier_orders/{ctx.run_date}"  # Local copy
+    OUTPUT_HDFS_DIR = f"/output/supplier_orders/{ctx.run_date}"       # HDFS copy
 
-    #  Creating a Temporary Products Table
+    os.makedirs(OUTPUT_LOCAL_DIR, exist_ok=True)
 
-    cur.execute("DROP TABLE IF EXISTS hive.default.temp_products_today")
-    
-    cur.execute(f"""
-        CREATE TABLE hive.default.temp_products_today (
-            sku VARCHAR,
-            supplier_id VARCHAR,
-            moq BIGINT,
-            package VARCHAR
-        ) WITH (
-            format = 'AVRO',
-            external_location = 'hdfs://namenode:9000/raw/products/{RUN_DATE}'
-        )
-    """)
-    
-    table_src_net = f"hive.processed.net_demand_{RUN_DATE.replace('-', '_')}"
-    hdfs_target_dir = f"/output/supplier_orders/{RUN_DATE}"
-    
-    table_dest = f"hive.default.supplier_orders_{RUN_DATE.replace('-', '_')}"
-    # ------------------------------------------------------------
+    # Write each supplier file locally; the upload to HDFS is done by the caller
+    supplier_orders, uploads = {}, []
+    for supplier_id, rows in groupby(rows_table, key=lambda row: row[1]):
+        if supplier_id in supplier_orders:
+            raise ValueError(f"Order lines are not ordered by supplier_id ({supplier_id} seen twice)")
+        order = {
+            "supplier_id": supplier_id,
+            "run_date": ctx.run_date,
+            "items": [{"sku": sku, "quantity": int(qty)} for _, _, sku, qty in rows]
+        }
+        supplier_orders[supplier_id] = len(order["items"])
 
-    print(f"Cleaning up target directory: {hdfs_target_dir}")
-    hdfs.delete(hdfs_target_dir, recursive=True)
+        # Local file
+        local_file_path = f"{OUTPUT_LOCAL_DIR}/{supplier_id}.json"
+        with open(local_file_path, "w") as f:
+            json.dump(order, f, indent=2)
 
-    print(f"Generating Supplier Orders into {table_dest}...")
-    cur.execute(f"DROP TABLE IF EXISTS {table_dest}")
+        # HDFS file
+        uploads.append((local_file_path, f"{OUTPUT_HDFS_DIR}/{supplier_id}.json"))
+    return supplier_orders, uploads
 
-    query_final = f"""
-    CREATE TABLE {table_dest}
-    WITH (
-        format = 'PARQUET', 
-        external_location = '{hdfs_target_dir}'
-    )
-    AS 
-    SELECT 
-        nd.run_date,
-        p.supplier_id,
-        nd.sku,
-        CAST(
-            CEILING(
-                CAST(GREATEST(nd.net_demand, COALESCE(p.moq, 1)) AS DOUBLE) / 
-                (CASE 
-                    WHEN p.package LIKE '%Box of 6%' THEN 6 
-                    WHEN p.package LIKE '%Box of 12%' THEN 12 
-                    WHEN p.package LIKE '%Box of 24%' THEN 24 
-                    WHEN p.package LIKE '%Pallet%' THEN 100 
-                    ELSE 1 
-                END)
-            ) 
-            * (CASE 
-                WHEN p.package LIKE '%Box of 6%' THEN 6 
-                WHEN p.package LIKE '%Box of 12%' THEN 12 
-                WHEN p.package LIKE '%Box of 24%' THEN 24 
-                WHEN p.package LIKE '%Pallet%' THEN 100 
-                ELSE 1 
-            END) 
-        AS INTEGER) as quantity
-    FROM {table_src_net} nd
-    JOIN hive.default.temp_products_today p ON nd.sku = p.sku
-    WHERE nd.net_demand > 0
+
+def stale_json(statuses, uploads):
+    """JSON files of the HDFS folder that this run did not write (supplier without orders today)."""
+    written = {os.path.basename(hdfs_path) for _, hdfs_path in uploads}
+    return [st.path for st in statuses
+            if st.is_file and compaction.SUPPLIER_JSON.is_source(st.name) and st.name not in written]
+
+
+def export_supplier_json(ctx, hdfs, rows_table):
+    """
+    Writes one JSON per supplier locally AND to HDFS (parallel upload). A JSON identical to the
+    one already in HDFS (same sha256) is not sent again; JSON of a previous run not rewritten are removed.
+    """
+    if HDFS_ASYNC and ctx.storage == "webhdfs":
+        return asyncio.run(export_supplier_json_async(ctx, rows_table))
+
+    supplier_orders, uploads = write_supplier_json_files(ctx, rows_table)
+    hdfs_dir = f"/output/supplier_orders/{ctx.run_date}"
+    compaction.invalidate(hdfs, compaction.SUPPLIER_JSON, ctx.run_date)  # JSON compactés d'un run précédent
+    hdfs.mkdirs(hdfs_dir)  # Make sure the HDFS folder exists
+    results = hdfs.put_many(uploads, overwrite=True, skip_identical=True)
+    raise_for_failures(results, "upload")
+    for path in stale_json(hdfs.list_status(hdfs_dir), uploads):
+        hdfs.delete(path)
+    print(f"  {sum(r.status == 'skipped' for r in results)}/{len(results)} supplier JSON unchanged in HDFS")
+    return supplier_orders
+
+
+async def export_supplier_json_async(ctx, rows_table):
+    """Async entry point of the JSON export (AsyncWebHDFSClient, all suppliers in flight)."""
+    supplier_orders, uploads = write_supplier_json_files(ctx, rows_table)
+    hdfs_dir = f"/output/supplier_orders/{ctx.run_date}"
+    with ctx.hdfs() as sync_hdfs:
+        compaction.invalidate(sync_hdfs, compaction.SUPPLIER_JSON, ctx.run_date)
+    async with AsyncWebHDFSClient(ctx.hdfs_base_url, user=ctx.hdfs_user) as hdfs:
+        await hdfs.mkdirs(hdfs_dir)
+        results = await hdfs.put_many(uploads, overwrite=True, skip_identical=True)
+        raise_for_failures(results, "upload")
+        await asyncio.gather(*(hdfs.delete(path) for path in stale_json(await hdfs.list_status(hdfs_dir), uploads)))
+    print(f"  {sum(r.status == 'skipped' for r in results)}/{len(results)} supplier JSON unchanged in HDFS")
+    return supplier_orders
+
+
+def check_package_compliance(guard, run_date, supplier_ids, skus, quantities):
+    """Runs the guard on the supplier_id / sku / quantity columns (one batch call)."""
+    print("🔍 Verifying Package Size Compliance...")
+    if len(skus) == 0:
+        print("  No orders generated (Result is empty).")
+        return
+    _check_package_batch(guard, run_date, supplier_ids, skus, quantities)
+
+
+def _check_package_batch(guard, run_date, supplier_ids, skus, quantities):
+    if not isinstance(supplier_ids, (pa.Array, pa.ChunkedArray)):
+        supplier_ids = pa.array(supplier_ids, pa.string())
+    order_refs = pc.binary_join_element_wise("PO-", supplier_ids, f"-{run_date}", "")
+    guard.check_package_compliance_batch(order_refs, skus, quantities)
+
+
+def main_arrow(ctx, hdfs, guard=None):
+    """Supplier orders computed in-process from the net demand Parquet and the compiled procurement rules."""
+    hdfs_src_dir = hive_tables.NET_DEMAND.location(ctx.run_date)
+    hdfs_target_dir = f"/output/supplier_orders/{ctx.run_date}"
+
+    print(" Loading compiled procurement rules...")
+    rules = procurement_rules.table()
+    demand = arrow_engine.read_output(ctx.data_root, hdfs_src_dir)
+
+    print(f"Generating Supplier Orders (arrow) into {hdfs_target_dir}...")
+    orders = arrow_engine.supplier_orders(demand, rules, ctx.run_date)
+    # write_output remplace la partition parquet/ ; les JSON du dossier daté sont synchronisés par export_supplier_json
+    arrow_engine.write_output(orders, ctx.data_root, hive_tables.SUPPLIER_ORDERS.location(ctx.run_date),
+                              "supplier_orders.parquet", hdfs)
+
+    export_supplier_json(ctx, hdfs, arrow_engine.iter_rows(orders, ORDER_COLUMNS))
+    print(f" Success! {orders.num_rows} order lines generated in HDFS: {hdfs_target_dir}")
+
+    if guard:
+        check_package_compliance(guard, ctx.run_date, orders["supplier_id"], orders["sku"], orders["quantity"])
+    return orders
+
+
+def export_trino_orders(ctx, trino, hdfs, stage, guard=None) -> int:
+    """
+    Order lines of the run_date partition streamed by batch, ordered by supplier: each batch
+    goes to the package check and to the JSON export (one supplier at a time), so client
+    memory does not grow with the output. Returns the number of order lines.
     """
+    query = (f"SELECT run_date, supplier_id, sku, quantity FROM {hive_tables.SUPPLIER_ORDERS.name} "
+             f"WHERE run_date = '{ctx.run_date}' ORDER BY supplier_id, sku")
+    lines = 0
+
+    def rows():
+        nonlocal lines
+        for batch in trino.iter_batches(query, stage=stage):
+            lines += batch.num_rows
+            if guard and batch.num_rows:
+                _check_package_batch(guard, ctx.run_date, batch["supplier_id"], batch["sku"], batch["quantity"])
+            yield from arrow_engine.iter_rows(batch, ORDER_COLUMNS)
+
+    if guard:
+        print("🔍 Verifying Package Size Compliance...")
+    export_supplier_json(ctx, hdfs, rows())
+    if guard and not lines:
+        print("  No orders generated (Result is empty).")
+    return lines
+
+
+def main_trino(ctx, trino, cur, hdfs, guard=None, prepared=False):
+    """Supplier orders as a Trino INSERT (net_demand partition + procurement rules -> supplier_orders partition + JSON)."""
+    
+    # prepared : dimension des règles déjà publiée / enregistrée par le DAG de l'orchestrateur
+    if not prepared:
+        procurement_rules.publish(hdfs, ctx.data_root, cur)
+    
+    src_net = hive_tables.NET_DEMAND.partition(ctx.run_date)
+    hdfs_target_dir = f"/output/supplier_orders/{ctx.run_date}"
+    table_dest = hive_tables.SUPPLIER_ORDERS
+    # ------------------------------------------------------------
+
+    # Parquet (partition, remplacée par overwrite_partition) + JSON du jour (synchronisés par export_supplier_json)
+    print(f"Generating Supplier Orders into {table_dest.name}...")
+    trino.invalidate(table_dest.name)
     
     try:
-        cur.execute(query_final)
-
-        # Added
-
-        OUTPUT_LOCAL_DIR = f"{DATA_ROOT}/output/supplier_orders/{RUN_DATE}"  # Local copy
-        OUTPUT_HDFS_DIR = f"/output/supplier_orders/{RUN_DATE}"       # HDFS copy
-
-        os.makedirs(OUTPUT_LOCAL_DIR, exist_ok=True)
-        hdfs.mkdirs(OUTPUT_HDFS_DIR)  # Make sure the HDFS folder exists
-        cur.execute(f"""
-        SELECT run_date, supplier_id, sku, quantity
-        FROM {table_dest}
-        """)
-
-        supplier_orders = defaultdict(list)
-        rows_table = cur.fetchall()  # After running your final query
-
-        for run_date, supplier_id, sku, qty in rows_table:
-            supplier_orders[supplier_id].append({
-                "sku": sku,
-                "quantity": int(qty)
-            })
-
-        # Write each supplier file locally AND to HDFS
-        for supplier_id, items in supplier_orders.items():
-            order = {
-                "supplier_id": supplier_id,
-                "run_date": RUN_DATE,
-                "items": items
-            }
-
-            # Local file
-            local_file_path = f"{OUTPUT_LOCAL_DIR}/{supplier_id}.json"
-            with open(local_file_path, "w") as f:
-                json.dump(order, f, indent=2)
-
-            # HDFS file
-            hdfs_file_path = f"{OUTPUT_HDFS_DIR}/{supplier_id}.json"
-            hdfs.put_file(local_file_path, hdfs_file_path, overwrite=True)
-##########
-        
-        print(rows_table)
-        # for run_date, supplier_id, sku, qty in rows_table:
-        #     supplier_orders[supplier_id].append({
-        #         "sku": sku,
-        #         "quantity": int(qty)
-        #     })
-        print(supplier_orders)
-        # OUTPUT_DIR = f"/tmp/supplier_orders/{RUN_DATE}"
-        # os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-        # for supplier_id, items in supplier_orders.items():
-        #     order = {
-        #         "supplier_id": supplier_id,
-        #         "run_date": RUN_DATE,
-        #         "items": items
-        #     }
-
-        #     file_path = f"{OUTPUT_DIR}/{supplier_id}.json"
-        #     with open(file_path, "w") as f:
-        #         json.dump(order, f, indent=2)
-
-        #     print(f"✅ File created: {file_path}")
-        # ###
-        print(f" Success! Orders generated in HDFS: {hdfs_target_dir}")
+        hive_tables.overwrite_partition(cur, hdfs, table_dest, ctx.run_date, supplier_orders_select(ctx, src_net))
+
+        # Une seule lecture (Arrow, par batches) partagée par l'export JSON et le contrôle des colis
+        lines = export_trino_orders(ctx, trino, hdfs, "supplier_orders", guard)
+        print(f" Success! {lines} order lines generated in HDFS: {hdfs_target_dir}")
     except Exception as e:
         print(f" Error in Supplier Orders generation: {e}")
         raise e
 
-    # --- CHECK PACKAGE COMPLIANCE ---
-    if guard:
-        print("🔍 Verifying Package Size Compliance...")
-        cur.execute(f"SELECT supplier_id, sku, quantity FROM {table_dest}")
-        rows = cur.fetchall()
-        
-        if not rows:
-            print("  No orders generated (Result is empty).")
-        
-        for supplier_id, sku, qty in rows:
-            order_ref = f"PO-{supplier_id}-{RUN_DATE}"
-            guard.check_package_compliance(order_id=order_ref, sku=sku, quantity=qty)
-
-    cur.close()
-    conn.close()
+
+def main(guard=None, engine=None, session=None, ctx=None, prepared=False):
+    ctx = ctx or RunContext.from_env()
+    hdfs = ctx.hdfs()
+    if resolve_engine(engine) == "arrow":
+        return main_arrow(ctx, hdfs, guard)
+
+    # Session Trino du run (ou privée si l'étape est lancée seule) : schémas créés une seule fois
+    with stage_session(session) as trino, trino.cursor("supplier_orders") as cur:
+        return main_trino(ctx, trino, cur, hdfs, guard, prepared)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,7 +2,8 @@
 
 import os
 from datetime import date
-from hdfs_client import WebHDFSClient
+from storage import Storage
+from run_context import RunContext
 
 # --- IMPORT DES ÉTAPES ---
 import generate_daily_files
@@ -10,13 +11,12 @@ import aggregate_orders
 import net_demand
 import supplier_orders
 from data_quality import DataQualityGuard
+from trino_utils import TrinoSession
 
 # --- 1. CONFIGURATION ---
 RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
 DATA_ROOT = os.getenv("DATA_ROOT", "/app/data")
 
-HDFS_BASE_URL = os.getenv("HDFS_BASE_URL", "http://namenode:9870")
-HDFS_USER = os.getenv("HDFS_USER", "root")
 
 # IMPORTANT (Docker) : utiliser les noms de services
 TRINO_HOST = os.getenv("TRINO_HOST", "trino")
@@ -59,10 +59,10 @@ def validate_files_and_log_errors(guard: DataQualityGuard):
 # -----------------------------
 # Helpers: HDFS structure
 # -----------------------------
-def setup_hdfs_structure(hdfs: WebHDFSClient):
+def setup_hdfs_structure(hdfs: Storage):
     """
     Crée seulement les dossiers "parents" pour éviter le blocage Trino (HIVE_PATH_ALREADY_EXISTS).
-    Les dossiers datés /processed/.../{RUN_DATE} seront créés par Trino au moment du CREATE TABLE.
+    Les dossiers datés /processed/.../{RUN_DATE} sont (re)créés par chaque étape avec sa partition run_date.
     """
     folders = [
         f"/raw/orders/{RUN_DATE}",
@@ -90,7 +90,7 @@ def setup_local_structure():
         os.makedirs(f, exist_ok=True)
 
 
-def cleanup_hdfs_date_dirs(hdfs: WebHDFSClient):
+def cleanup_hdfs_date_dirs(hdfs: Storage):
     """
     Nettoyage des répertoires datés avant de relancer le pipeline.
     Utile si tu relances RUN_DATE et que Trino se plaint que le dossier existe déjà.
@@ -109,7 +109,7 @@ def cleanup_hdfs_date_dirs(hdfs: WebHDFSClient):
 # -----------------------------
 # Helpers: HDFS listing/copy
 # -----------------------------
-# def _list_files_in_hdfs_dir(hdfs: WebHDFSClient, hdfs_dir: str):
+# def _list_files_in_hdfs_dir(hdfs: Storage, hdfs_dir: str):
 #     """
 #     Retourne la liste des noms de fichiers dans un dossier HDFS (pas les sous-dossiers).
 #     Compatible avec WebHDFS style responses.
@@ -125,93 +125,39 @@ def cleanup_hdfs_date_dirs(hdfs: WebHDFSClient):
 #         if it.get("type") == "FILE" and it.get("pathSuffix"):
 #             files.append(it["pathSuffix"])
 #     return files
-def _list_files_in_hdfs_dir(hdfs, hdfs_dir: str):
+def mirror_hdfs_dir_to_local(hdfs: Storage, hdfs_dir: str, local_dir: str):
     """
-    Returns the list of file names in an HDFS directory (no sub-directories).
-    Compatible with common WebHDFS Python clients.
-    """
-    try:
-        if not hdfs.exists(hdfs_dir):
-            return []
-
-        items = hdfs.list(hdfs_dir)   # ✅ correct method
-
-        files = []
-        for name in items:
-            full_path = f"{hdfs_dir}/{name}"
-            status = hdfs.status(full_path)
-
-            if status.get("type") == "FILE":
-                files.append(name)
-
-        return files
-
-    except Exception as e:
-        print(f"❌ Error listing HDFS directory {hdfs_dir}: {e}")
-        return []
-
-
-def mirror_hdfs_dir_to_local(hdfs: WebHDFSClient, hdfs_dir: str, local_dir: str):
-    """
-    Copie tous les fichiers d’un dossier HDFS vers un dossier local.
+    Copie tous les fichiers d’un dossier HDFS vers un dossier local (pool de workers,
+    gros fichiers téléchargés par plages en parallèle).
     IMPORTANT: on ne copie QUE si le dossier existe ET contient au moins 1 fichier.
     """
-    files = _list_files_in_hdfs_dir(hdfs, hdfs_dir)
-
     if not hdfs.exists(hdfs_dir):
         print(f"❌ HDFS: dossier inexistant (Trino n'a rien créé): {hdfs_dir}")
         return
 
-    if len(files) == 0:
-        print(f"⚠️ HDFS: dossier موجود لكن فارغ (0 fichier): {hdfs_dir}")
+    results = hdfs.mirror(hdfs_dir, local_dir)
+    if len(results) == 0:
+        print(f"⚠️ HDFS: dossier existant mais vide (0 fichier): {hdfs_dir}")
         print("   ➜ Ça veut dire que Trino n'a pas écrit de sortie (erreur ou résultat vide).")
         return
 
-    os.makedirs(local_dir, exist_ok=True)
+    for r in results:
+        if r.ok:
+            print(f"✅ Mirror: {r.hdfs_path} -> {r.local_path}")
+        else:
+            print(f"❌ Mirror: {r.hdfs_path}: {r.error}")
 
-    nb = 0
-    for name in files:
-        hdfs_file = f"{hdfs_dir.rstrip('/')}/{name}"
-        local_file = os.path.join(local_dir, name)
-
-        # IMPORTANT: pas de overwrite=True (selon ton client)
-        hdfs.get_file(hdfs_file, local_file)
-        nb += 1
-        print(f"✅ Mirror: {hdfs_file} -> {local_file}")
-
-    print(f"📦 {nb} fichier(s) copiés depuis {hdfs_dir} vers {local_dir}")
-
-
-# -----------------------------
-# Patch Trino connect (Docker)
-# -----------------------------
-def patch_trino_connect_in_modules():
-    """
-    Sans modifier aggregate_orders.py / net_demand.py :
-    on remplace la fonction `connect` importée chez eux, pour pointer vers le service Docker 'trino'
-    au lieu de 127.0.0.1.
-    """
-    import trino.dbapi
-
-    def _connect(*args, **kwargs):
-        kwargs.pop("host", None)
-        kwargs.pop("port", None)
-        return trino.dbapi.connect(host=TRINO_HOST, port=TRINO_PORT, *args, **kwargs)
-
-    # ils font: from trino.dbapi import connect
-    # donc chez eux `connect` est une variable => on l'écrase.
-    aggregate_orders.connect = _connect
-    net_demand.connect = _connect
+    print(f"📦 {sum(r.ok for r in results)} fichier(s) copiés depuis {hdfs_dir} vers {local_dir}")
 
 
 # -----------------------------
 # Main pipeline
 # -----------------------------
 def main():
-    hdfs = WebHDFSClient(HDFS_BASE_URL, user=HDFS_USER)
+    hdfs = RunContext.from_env(RUN_DATE).hdfs()
 
-    # Patch Trino (Docker)
-    patch_trino_connect_in_modules()
+    # Session Trino (Docker) passée aux étapes : plus besoin de patcher leur `connect`
+    trino = TrinoSession(host=TRINO_HOST, port=TRINO_PORT)
 
     # Initialisation du Guard (Postgres via service Docker)
     guard = DataQualityGuard(RUN_DATE, DB_CONFIG)
@@ -225,13 +171,13 @@ def main():
         cleanup_hdfs_date_dirs(hdfs)
 
         print("\n[Étape 0b] Génération des fichiers RAW...")
-        generate_daily_files.main()
+        generate_daily_files.main(trino)
 
         print("\n[Étape 0c] Validation formats...")
         validate_files_and_log_errors(guard)
 
         print("\n[Étape 1] Agrégation des ventes (Trino)...")
-        aggregate_orders.main(guard)
+        aggregate_orders.main(guard, session=trino)
         mirror_hdfs_dir_to_local(
             hdfs,
             f"/processed/aggregated_orders/{RUN_DATE}",
@@ -239,7 +185,7 @@ def main():
         )
 
         print("\n[Étape 2] Calcul Net Demand (Trino)...")
-        net_demand.main(guard)
+        net_demand.main(guard, session=trino)
         mirror_hdfs_dir_to_local(
             hdfs,
             f"/processed/net_demand/{RUN_DATE}",
@@ -247,7 +193,7 @@ def main():
         )
 
         print("\n[Étape 3] Supplier Orders (Trino)...")
-        supplier_orders.main()
+        supplier_orders.main(session=trino)
         mirror_hdfs_dir_to_local(
             hdfs,
             f"/output/supplier_orders/{RUN_DATE}",
@@ -273,6 +219,9 @@ def main():
         guard.log_issue("PIPELINE_CRASH", "SYSTEM", str(e))
         guard.save_report(os.path.join(DATA_ROOT, "logs", "exceptions"))
 
+    finally:
+        trino.close()
+
 
 if __name__ == "__main__":
     main()
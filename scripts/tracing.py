@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# Lightweight tracing for pipeline runs: every stage and every external call (Trino,
+# WebHDFS, Postgres) is a timed span with its row / byte counts. At the end of a run
+# write_run_files() dumps the spans as a JSON trace and a Prometheus textfile
+# (node_exporter textfile collector) under DATA_ROOT/logs.
+TRACING = os.getenv("TRACING", "1") == "1"
+
+_current = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_spans = []
+_run_start = time.time()
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "kind", "start", "duration", "attrs", "error")
+
+    def __init__(self, name, kind, parent, attrs):
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration = None
+        self.attrs = dict(attrs)
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counters):
+        """Increments counters such as rows / bytes (safe to call many times)."""
+        for key, value in counters.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self, origin=None):
+        return {
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start - (_run_start if origin is None else origin), 6),
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NoSpan:
+    def set(self, **attrs):
+        pass
+
+    def add(self, **counters):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def span(name, kind="internal", **attrs):
+    """with span("hdfs.put_file", kind="hdfs", path=...) as s: ...; s.add(bytes=n)"""
+    if not TRACING:
+        yield NO_SPAN
+        return
+    s = Span(name, kind, _current.get(), attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.duration = time.time() - s.start
+        _current.reset(token)
+        with _lock:
+            _spans.append(s)
+
+
+def current():
+    """Span open in this context (NO_SPAN outside of any span)."""
+    return _current.get() or NO_SPAN
+
+
+def traced(name, kind="internal"):
+    """Decorator version of span()."""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+
+def propagate(fn):
+    """Wraps fn so that spans opened in a worker thread are children of the caller's span."""
+    parent = _current.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+def counted(chunks, s):
+    """Iterates over byte chunks while adding their size to span s."""
+    for chunk in chunks:
+        s.add(bytes=len(chunk))
+        yield chunk
+
+
+class TracedCursor:
+    """DB-API cursor proxy (Trino): execute / fetch* become 'trino.*' spans with row counts."""
+
+    def __init__(self, cursor, kind="trino"):
+        self._cursor = cursor
+        self._kind = kind
+
+    def execute(self, operation, *args, **kwargs):
+        with span(f"{self._kind}.execute", kind=self._kind, sql=" ".join(operation.split())[:200]):
+            return self._cursor.execute(operation, *args, **kwargs)
+
+    def fetchall(self):
+        with span(f"{self._kind}.fetch", kind=self._kind) as s:
+            rows = self._cursor.fetchall()
+            s.set(rows=len(rows))
+            return rows
+
+    def fetchone(self):
+        with span(f"{self._kind}.fetch", kind=self._kind) as s:
+            row = self._cursor.fetchone()
+            s.set(rows=0 if row is None else 1)
+            return row
+
+    def fetchmany(self, size=None):
+        with span(f"{self._kind}.fetch", kind=self._kind) as s:
+            rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+            s.set(rows=len(rows))
+            return rows
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def traced_cursor(cursor, kind="trino"):
+    return TracedCursor(cursor, kind) if TRACING else cursor
+
+
+# =========================================================
+# ======================= EXPORT ===========================
+# =========================================================
+def reset():
+    """Forgets the spans recorded so far (start of a new run in the same process)."""
+    global _run_start
+    with _lock:
+        _spans.clear()
+    _run_start = time.time()
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def spans_under(root):
+    """root and the spans opened below it (one run among several running in the same process)."""
+    recorded = spans()
+    parents = {s.id: s.parent for s in recorded}
+    below = set()
+    for s in recorded:
+        chain, node = [], s.id
+        while node is not None and node not in below and node != root.id:
+            chain.append(node)
+            node = parents.get(node)
+        if node is not None:
+            below.update(chain)
+    below.add(root.id)
+    return [s for s in recorded if s.id in below]
+
+
+def forget(recorded):
+    """Drops spans already written out (long-running process with many runs)."""
+    ids = {s.id for s in recorded}
+    with _lock:
+        _spans[:] = [s for s in _spans if s.id not in ids]
+
+
+def summary(recorded=None):
+    """Aggregates the spans by name: count, total / max seconds, rows, bytes, errors."""
+    by_name = {}
+    for s in recorded if recorded is not None else spans():
+        entry = by_name.setdefault(s.name, {"kind": s.kind, "count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                            "rows": 0, "bytes": 0, "errors": 0})
+        entry["count"] += 1
+        entry["seconds"] += s.duration or 0.0
+        entry["max_seconds"] = max(entry["max_seconds"], s.duration or 0.0)
+        entry["rows"] += int(s.attrs.get("rows", 0) or 0)
+        entry["bytes"] += int(s.attrs.get("bytes", 0) or 0)
+        entry["errors"] += 1 if s.error else 0
+    return by_name
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text(by_name, run_date, run_seconds, success):
+    """Prometheus text exposition format (one gauge family per metric, labels name/kind/run_date)."""
+    lines = []
+    families = [
+        ("pipeline_span_seconds_total", "Total time spent in the span (seconds)", "seconds"),
+        ("pipeline_span_seconds_max", "Longest single occurrence of the span (seconds)", "max_seconds"),
+        ("pipeline_span_count", "Number of occurrences of the span", "count"),
+        ("pipeline_span_rows_total", "Rows read or written by the span", "rows"),
+        ("pipeline_span_bytes_total", "Bytes read or written by the span", "bytes"),
+        ("pipeline_span_errors_total", "Occurrences of the span that raised", "errors"),
+    ]
+    for metric, help_text, key in families:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for name, entry in sorted(by_name.items()):
+            labels = f'name="{_label(name)}",kind="{_label(entry["kind"])}",run_date="{_label(run_date)}"'
+            value = round(entry[key], 6) if isinstance(entry[key], float) else entry[key]
+            lines.append(f"{metric}{{{labels}}} {value}")
+    run_labels = f'run_date="{_label(run_date)}"'
+    lines += [
+        "# HELP pipeline_run_seconds Wall time of the last pipeline run",
+        "# TYPE pipeline_run_seconds gauge",
+        f"pipeline_run_seconds{{{run_labels}}} {round(run_seconds, 6)}",
+        "# HELP pipeline_run_success 1 if the last pipeline run finished without error",
+        "# TYPE pipeline_run_success gauge",
+        f"pipeline_run_success{{{run_labels}}} {1 if success else 0}",
+        "# HELP pipeline_run_timestamp_seconds End of the last pipeline run (unix time)",
+        "# TYPE pipeline_run_timestamp_seconds gauge",
+        f"pipeline_run_timestamp_seconds{{{run_labels}}} {int(time.time())}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)  # the textfile collector never sees a half-written file
+
+
+def write_run_files(data_root, run_date, success=True, extra=None, root=None, metrics=True):
+    """
+    Writes DATA_ROOT/logs/traces/run_{date}_{time}.json (one per run, kept for history) and
+    DATA_ROOT/logs/metrics/pipeline.prom (overwritten, scraped by the textfile collector).
+    root: the run's top span when several runs share the process (only its spans are written,
+    then forgotten). metrics=False skips the .prom file. Returns (trace_path, metrics_path).
+    """
+    if isinstance(root, Span):  # NO_SPAN when TRACING=0
+        recorded = spans_under(root)
+        forget(recorded)
+        started = root.start
+    else:
+        recorded = spans()
+        started = _run_start
+    run_seconds = time.time() - started
+    by_name = summary(recorded)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+
+    trace_path = os.path.join(data_root, "logs/traces", f"run_{run_date}_{stamp}.json")
+    trace = {
+        "run_date": run_date,
+        "started_at": datetime.fromtimestamp(started).isoformat(),
+        "seconds": round(run_seconds, 6),
+        "success": success,
+        "summary": by_name,
+        "spans": [s.to_dict(started) for s in sorted(recorded, key=lambda s: s.start)],
+    }
+    if extra:
+        trace.update(extra)
+    _atomic_write(trace_path, json.dumps(trace, indent=2))
+
+    if not metrics:
+        return trace_path, None
+    metrics_path = os.path.join(data_root, "logs/metrics", "pipeline.prom")
+    _atomic_write(metrics_path, prometheus_text(by_name, run_date, run_seconds, success))
+    return trace_path, metrics_path
@@ -1,20 +1,197 @@
 import os
+import json
+import threading
+from contextlib import contextmanager
+import requests
 from trino.dbapi import connect
+from tracing import traced_cursor, span
+from arrow_engine import rows_to_batch, concat_batches
+import pyarrow as pa
+import hive_tables
 
 TRINO_HOST = os.getenv("TRINO_HOST", "trino")
 TRINO_PORT = int(os.getenv("TRINO_PORT", 8080))
-TRINO_USER = os.getenv("TRINO_USER", "procurement")
+TRINO_USER = os.getenv("TRINO_USER", "admin")
 TRINO_CATALOG = os.getenv("TRINO_CATALOG", "hive")
+TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
+
+# Connexions HTTP keep-alive gardées vers le coordinator (partagées par toutes les étapes)
+TRINO_POOL_SIZE = int(os.getenv("TRINO_POOL_SIZE", "8"))
+# Schémas créés une seule fois par run (bootstrap)
+BOOTSTRAP_SCHEMAS = ("default", "processed", "output", "raw_orders", "raw_stock")
+# Propriétés de session par étape, ex. '{"aggregation": {"query_max_memory": "4GB"}}'
+STAGE_SESSION_PROPERTIES = json.loads(os.getenv("TRINO_SESSION_PROPERTIES", "{}"))
+# Lignes par batch Arrow lues depuis Trino (mémoire client bornée à un batch en streaming)
+TRINO_FETCH_SIZE = int(os.getenv("TRINO_FETCH_SIZE", "10000"))
+# Au-delà de cette taille un résultat n'est pas gardé dans le cache du run
+TRINO_RESULT_CACHE_MB = float(os.getenv("TRINO_RESULT_CACHE_MB", "256"))
+
+# Type Trino (sans paramètres) -> type Arrow ; decimal & co sont inférés depuis les valeurs
+TRINO_ARROW_TYPES = {
+    "boolean": pa.bool_(),
+    "tinyint": pa.int64(), "smallint": pa.int64(), "integer": pa.int64(), "bigint": pa.int64(),
+    "real": pa.float64(), "double": pa.float64(),
+    "varchar": pa.string(), "char": pa.string(),
+    "date": pa.date32(),
+}
+
+
+def iter_arrow_batches(cur, query: str, batch_size: int = None):
+    """Runs query on cur and yields its result as Arrow RecordBatches of batch_size rows."""
+    batch_size = batch_size or TRINO_FETCH_SIZE
+    cur.execute(query)
+    rows = cur.fetchmany(batch_size)
+    names = [d[0] for d in cur.description]
+    types = [TRINO_ARROW_TYPES.get(str(d[1]).split("(")[0]) for d in cur.description]
+    yield rows_to_batch(names, types, rows)
+    while len(rows) == batch_size:
+        rows = cur.fetchmany(batch_size)
+        if rows:
+            yield rows_to_batch(names, types, rows)
+
+
+def _normalize(query):
+    return " ".join(query.split())
+
+
+class TrinoSession:
+    """
+    One Trino session manager per run, passed to the stages:
+
+        session = TrinoSession()
+        session.bootstrap()
+        with session.cursor("aggregation") as cur:
+            cur.execute(...)
+
+    Every connection shares one HTTP session (keep-alive pool of TRINO_POOL_SIZE) and
+    connections are reused per set of session properties.
+    """
+
+    def __init__(self, host=None, port=None, user=None, catalog=None, schema=None,
+                 pool_size=None, stage_properties=None):
+        self.host = host or TRINO_HOST
+        self.port = port or TRINO_PORT
+        self.user = user or TRINO_USER
+        self.catalog = catalog or TRINO_CATALOG
+        self.schema = schema or TRINO_SCHEMA
+        self.stage_properties = stage_properties if stage_properties is not None else STAGE_SESSION_PROPERTIES
+        self._http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or TRINO_POOL_SIZE)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        self._connections = {}
+        self._results = {}  # requête normalisée -> pa.Table (cache du run)
+        self._lock = threading.Lock()
+        self._schemas_ready = False
+
+    def properties(self, stage=None) -> dict:
+        return dict(self.stage_properties.get(stage, {})) if stage else {}
+
+    def connection(self, stage=None):
+        """Connection for the stage's session properties (created once, then reused)."""
+        props = self.properties(stage)
+        key = tuple(sorted(props.items()))
+        with self._lock:
+            conn = self._connections.get(key)
+            if conn is None:
+                conn = connect(
+                    host=self.host,
+                    port=self.port,
+                    user=self.user,
+                    catalog=self.catalog,
+                    schema=self.schema,
+                    session_properties=props or None,
+                    http_session=self._http,
+                )
+                self._connections[key] = conn
+            return conn
+
+    @contextmanager
+    def cursor(self, stage=None):
+        """Traced cursor with the stage's session properties."""
+        cur = traced_cursor(self.connection(stage).cursor())
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def iter_batches(self, query, stage=None, batch_size=None):
+        """Streams a result as Arrow batches (one batch in client memory at a time)."""
+        with self.cursor(stage) as cur:
+            yield from iter_arrow_batches(cur, query, batch_size)
+
+    def fetch_table(self, query, stage=None):
+        """
+        Whole result as an Arrow table, fetched once per run: several consumers of the same
+        small, bounded result share one fetch. Results above TRINO_RESULT_CACHE_MB are
+        returned but not kept. Outputs that grow with the data (supplier_orders) are streamed
+        with iter_batches instead.
+        """
+        key = _normalize(query)
+        with self._lock:
+            cached = self._results.get(key)
+        if cached is not None:
+            return cached
+        with span("trino.fetch_table", kind="trino", sql=key[:200]) as s:
+            table = concat_batches(self.iter_batches(query, stage))
+            s.set(rows=table.num_rows, bytes=table.nbytes)
+        if table.nbytes <= TRINO_RESULT_CACHE_MB * 1e6:
+            with self._lock:
+                self._results[key] = table
+        return table
+
+    def invalidate(self, table_name):
+        """Forgets the cached results that read table_name (call before it is dropped / rebuilt)."""
+        with self._lock:
+            for key in [k for k in self._results if table_name in k]:
+                del self._results[key]
+
+    def bootstrap(self, schemas=BOOTSTRAP_SCHEMAS, tables=hive_tables.TABLES):
+        """
+        CREATE SCHEMA for the missing schemas (one SHOW SCHEMAS when all exist), then the
+        run_date-partitioned tables of hive_tables.py (IF NOT EXISTS), once per session.
+        """
+        with self._lock:
+            if self._schemas_ready:
+                return
+        with span("trino.bootstrap", kind="trino"), self.cursor() as cur:
+            cur.execute(f"SHOW SCHEMAS FROM {self.catalog}")
+            existing = {row[0] for row in cur.fetchall()}
+            for schema_name in schemas:
+                if schema_name not in existing:
+                    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {self.catalog}.{schema_name}")
+                    print(f"[INFO] Schema '{schema_name}' ensured in Trino/Hive.")
+            hive_tables.ensure_tables(cur, tables)
+        with self._lock:
+            self._schemas_ready = True
+
+    def close(self):
+        self._connections.clear()
+        self._results.clear()
+        self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def stage_session(session=None):
+    """The run's session when given, else a private one closed at the end (stage run on its own)."""
+    if session is not None:
+        session.bootstrap()  # no-op once done for the run
+        yield session
+        return
+    with TrinoSession() as own:
+        own.bootstrap()
+        yield own
+
 
 def ensure_schema(schema_name: str):
     """Create schema in Trino/Hive if it does not exist."""
-    conn = connect(
-        host=TRINO_HOST,
-        port=TRINO_PORT,
-        user=TRINO_USER,
-        catalog=TRINO_CATALOG,
-    )
-    cur = conn.cursor()
-    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
-    conn.close()
+    with TrinoSession() as session:
+        with session.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
     print(f"[INFO] Schema '{schema_name}' ensured in Trino/Hive.")
@@ -12,9 +12,9 @@ TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "default")
 
 
 RUN_DATE = os.getenv("RUN_DATE") or date.today().isoformat()
-TABLE_NAME = f"hive.processed.aggregated_orders_{RUN_DATE.replace('-', '_')}"
+TABLE_NAME = "hive.output.supplier_orders"  # partitionnée par run_date (voir hive_tables.py)
 
-print(f"---  INSPECTING FINAL RESULTS: {TABLE_NAME} ---")
+print(f"---  INSPECTING FINAL RESULTS: {TABLE_NAME} [run_date={RUN_DATE}] ---")
 
 try:
     conn = connect(
@@ -27,7 +27,7 @@ try:
     cur = conn.cursor()
     
     print(" Querying data...")
-    cur.execute(f"SELECT * FROM {TABLE_NAME}  ")
+    cur.execute(f"SELECT run_date, supplier_id, sku, quantity FROM {TABLE_NAME} WHERE run_date = '{RUN_DATE}' LIMIT 20")
     rows = cur.fetchall()
     
     if rows:
@@ -47,7 +47,7 @@ try:
             print(f"{r_date:<12} | {r_supp:<15} | {r_sku:<15} | {r_qty:<10}")
         print("=" * 70)
     else:
-        print(" The table exists but contains NO DATA.")
+        print(" The partition exists but contains NO DATA.")
         print("   This might mean Net Demand was 0 for all products.")
 
 except Exception as e:
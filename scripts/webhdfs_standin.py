@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+# Filesystem-backed stand-in for the WebHDFS REST API (benchmarks / local runs).
+# Files live under ROOT; CREATE answers 307 to a "datanode" URL on the same server,
+# like the real namenode. LATENCY (seconds) is added to every request to emulate RTT.
+#
+#   python scripts/webhdfs_standin.py /tmp/hdfs_root 9870 [latency]
+
+
+def _status(local_path, name=""):
+    st = os.stat(local_path)
+    is_dir = os.path.isdir(local_path)
+    return {
+        "pathSuffix": name,
+        "type": "DIRECTORY" if is_dir else "FILE",
+        "length": 0 if is_dir else st.st_size,
+        "modificationTime": int(st.st_mtime * 1000),
+        "accessTime": int(st.st_atime * 1000),
+        "blockSize": 134217728,
+        "replication": 0 if is_dir else 1,
+        "permission": "755",
+        "owner": "root",
+        "group": "supergroup",
+    }
+
+
+class WebHDFSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    root = "."
+    latency = 0.0
+    list_limit = 1000  # dfs.ls.limit : entries per LISTSTATUS_BATCH page
+    xattrs = {}        # hdfs path -> {name: value} (per server, see start_standin)
+
+    def log_message(self, *args):
+        pass
+
+    # --- helpers ---
+    def _parse(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        hdfs_path = unquote(url.path[len("/webhdfs/v1"):]) or "/"
+        return hdfs_path, query, os.path.join(self.root, hdfs_path.strip("/"))
+
+    def _send(self, code, body=b"", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, hdfs_path):
+        self._send(404, {"RemoteException": {"exception": "FileNotFoundException",
+                                             "message": f"File does not exist: {hdfs_path}"}})
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            return b"".join(self._iter_chunked())
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _iter_chunked(self):
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            yield self.rfile.read(size)
+            self.rfile.readline()
+
+    def _dispatch(self, method):
+        if self.latency:
+            time.sleep(self.latency)
+        hdfs_path, query, local = self._parse()
+        op = query.get("op", "").upper()
+        handler = getattr(self, f"op_{method}_{op}", None)
+        if handler is None:
+            self._read_body()
+            return self._send(400, {"RemoteException": {"exception": "IllegalArgumentException",
+                                                        "message": f"Unsupported {method} op={op}"}})
+        handler(hdfs_path, query, local)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # --- operations ---
+    def op_PUT_MKDIRS(self, hdfs_path, query, local):
+        os.makedirs(local, exist_ok=True)
+        self._send(200, {"boolean": True})
+
+    def op_PUT_CREATE(self, hdfs_path, query, local):
+        if query.get("datanode") != "true":
+            self._read_body()
+            if os.path.exists(local) and query.get("overwrite", "false") != "true":
+                return self._send(403, {"RemoteException": {"exception": "FileAlreadyExistsException",
+                                                            "message": f"{hdfs_path} already exists"}})
+            host, port = self.server.server_address[:2]
+            return self._send(307, headers={"Location": f"http://{host}:{port}{self.path}&datanode=true"})
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        self.xattrs.pop(hdfs_path, None)  # new file, new inode
+        with open(local, "wb") as f:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                for chunk in self._iter_chunked():
+                    f.write(chunk)
+            else:
+                f.write(self._read_body())
+        self._send(201)
+
+    def op_POST_APPEND(self, hdfs_path, query, local):
+        if not os.path.isfile(local):
+            self._read_body()
+            return self._not_found(hdfs_path)
+        if query.get("datanode") != "true":
+            self._read_body()
+            host, port = self.server.server_address[:2]
+            return self._send(307, headers={"Location": f"http://{host}:{port}{self.path}&datanode=true"})
+        with open(local, "ab") as f:
+            f.write(self._read_body())
+        self._send(200)
+
+    def op_GET_GETXATTRS(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        attrs = self.xattrs.get(hdfs_path, {})
+        self._send(200, {"XAttrs": [{"name": k, "value": v} for k, v in sorted(attrs.items())]})
+
+    def op_PUT_SETXATTR(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        self.xattrs.setdefault(hdfs_path, {})[query["xattr.name"]] = query.get("xattr.value", "")
+        self._send(200)
+
+    def op_PUT_REMOVEXATTR(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        self.xattrs.get(hdfs_path, {}).pop(query["xattr.name"], None)
+        self._send(200)
+
+    def op_PUT_RENAME(self, hdfs_path, query, local):
+        target = query.get("destination", "")
+        local_target = os.path.join(self.root, target.strip("/"))
+        if not os.path.exists(local) or os.path.exists(local_target):
+            return self._send(200, {"boolean": False})
+        os.makedirs(os.path.dirname(local_target), exist_ok=True)
+        os.rename(local, local_target)
+        prefix = hdfs_path.rstrip("/") + "/"
+        for path in [p for p in self.xattrs if p == hdfs_path or p.startswith(prefix)]:
+            self.xattrs[target.rstrip("/") + path[len(hdfs_path.rstrip("/")):]] = self.xattrs.pop(path)
+        self._send(200, {"boolean": True})
+
+    def op_GET_GETFILESTATUS(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        self._send(200, {"FileStatus": _status(local)})
+
+    def op_GET_LISTSTATUS(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        if os.path.isfile(local):
+            statuses = [_status(local)]
+        else:
+            statuses = [_status(os.path.join(local, n), n) for n in sorted(os.listdir(local))]
+        self._send(200, {"FileStatuses": {"FileStatus": statuses}})
+
+    def op_GET_LISTSTATUS_BATCH(self, hdfs_path, query, local):
+        if not os.path.isdir(local):
+            return self._not_found(hdfs_path)
+        names = sorted(os.listdir(local))
+        start_after = query.get("startAfter")
+        if start_after:
+            names = [n for n in names if n > start_after]
+        page, rest = names[:self.list_limit], names[self.list_limit:]
+        statuses = [_status(os.path.join(local, n), n) for n in page]
+        self._send(200, {"DirectoryListing": {"partialListing": {"FileStatuses": {"FileStatus": statuses}},
+                                              "remainingEntries": len(rest)}})
+
+    def op_GET_GETCONTENTSUMMARY(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._not_found(hdfs_path)
+        length, files, dirs = 0, 0, 1
+        for dirpath, dirnames, filenames in os.walk(local):
+            dirs += len(dirnames)
+            files += len(filenames)
+            length += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+        self._send(200, {"ContentSummary": {"length": length, "fileCount": files, "directoryCount": dirs}})
+
+    def op_GET_OPEN(self, hdfs_path, query, local):
+        if not os.path.isfile(local):
+            return self._not_found(hdfs_path)
+        offset = int(query.get("offset", 0))
+        with open(local, "rb") as f:
+            f.seek(offset)
+            length = query.get("length")
+            data = f.read(int(length)) if length is not None else f.read()
+        self._send(200, data, {"Content-Type": "application/octet-stream"})
+
+    def op_DELETE_DELETE(self, hdfs_path, query, local):
+        if not os.path.exists(local):
+            return self._send(200, {"boolean": False})
+        if os.path.isdir(local):
+            if os.listdir(local) and query.get("recursive", "false") != "true":
+                return self._send(403, {"RemoteException": {"exception": "PathIsNotEmptyDirectoryException",
+                                                            "message": f"{hdfs_path} is non empty"}})
+            shutil.rmtree(local)
+        else:
+            os.remove(local)
+        prefix = hdfs_path.rstrip("/") + "/"
+        for path in [p for p in self.xattrs if p == hdfs_path or p.startswith(prefix)]:
+            del self.xattrs[path]
+        self._send(200, {"boolean": True})
+
+
+def start_standin(root: str, port: int = 0, latency: float = 0.0):
+    """Starts the stand-in in a daemon thread; returns (server, base_url). Stop with server.shutdown()."""
+    os.makedirs(root, exist_ok=True)
+    handler = type("StandinHandler", (WebHDFSHandler,), {"root": os.path.abspath(root), "latency": latency,
+                                                         "xattrs": {}})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, bound_port = server.server_address[:2]
+    return server, f"http://{host}:{bound_port}"
+
+
+if __name__ == "__main__":
+    root_dir = sys.argv[1] if len(sys.argv) > 1 else "hdfs_standin"
+    listen_port = int(sys.argv[2]) if len(sys.argv) > 2 else 9870
+    rtt = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    srv, url = start_standin(root_dir, listen_port, rtt)
+    print(f"WebHDFS stand-in on {url} (root={os.path.abspath(root_dir)}, latency={rtt}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,65 @@
+import sys
+
+import pytest
+
+import arrow_engine
+import engine_parity
+import procurement_rules
+
+RUN_DATE = "2026-01-14"
+
+
+@pytest.fixture
+def fixtures():
+    return engine_parity.fixture_tables(RUN_DATE)
+
+
+@pytest.fixture
+def engines(fixtures):
+    orders, stock, products = fixtures
+    agg = arrow_engine.aggregate_orders(orders)
+    nd = arrow_engine.net_demand(agg, stock, RUN_DATE)
+    so = arrow_engine.supplier_orders(nd, procurement_rules.compile_rules(products), RUN_DATE)
+    ref_agg = engine_parity.sql_aggregate(orders.to_pylist())
+    ref_nd = engine_parity.sql_net_demand(ref_agg, stock.to_pylist(), RUN_DATE)
+    ref_so = engine_parity.sql_supplier_orders(ref_nd, products.to_pylist(), RUN_DATE)
+    return {"aggregated_orders": (ref_agg, agg), "net_demand": (ref_nd, nd), "supplier_orders": (ref_so, so)}
+
+
+# --- python -m engine_parity --fixtures-only ---
+def test_fixtures_only_cli_passes(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["engine_parity.py", "--fixtures-only", "--run-date", RUN_DATE])
+    assert engine_parity.main() == 0
+    out = capsys.readouterr().out
+    assert "[DIFF]" not in out
+    for table in ("aggregated_orders", "net_demand", "supplier_orders"):
+        assert f"[OK]   {table}" in out
+
+
+@pytest.mark.parametrize("table, keys", [
+    ("aggregated_orders", ["sku", "total_quantity"]),
+    ("net_demand", ["run_date", "sku", "net_demand"]),
+    ("supplier_orders", ["run_date", "supplier_id", "sku", "quantity"]),
+])
+def test_arrow_matches_sql_reference(engines, table, keys):
+    expected, actual = engines[table]
+    assert engine_parity.compare(table, expected, actual, keys)
+
+
+def test_supplier_orders_pack_size_rounding(engines):
+    _, so = engines["supplier_orders"]
+    quantities = {row["sku"]: (row["supplier_id"], row["quantity"]) for row in so.to_pylist()}
+    assert quantities == {
+        "SKU-A": ("SUP-1", 12),   # 9 -> MOQ 10 -> Box of 6
+        "SKU-B": ("SUP-1", 48),   # 43 -> Box of 12
+        "SKU-D": ("SUP-2", 300),  # 250 -> Pallet
+        "SKU-E": ("SUP-3", 24),   # MOQ NULL -> Box of 24
+        "SKU-F": ("SUP-3", 13),   # NULL package -> unit
+    }
+
+
+def test_compare_reports_differences(engines, capsys):
+    expected, actual = engines["supplier_orders"]
+    tampered = [dict(row, quantity=row["quantity"] + 1) if row["sku"] == "SKU-A" else row for row in expected]
+    assert not engine_parity.compare("supplier_orders", tampered, actual, ["run_date", "supplier_id", "sku", "quantity"])
+    assert "[DIFF] supplier_orders" in capsys.readouterr().out
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+import orchestrator_scheduler as sched
+from orchestrator_scheduler import CronSchedule, _parse_field
+
+
+# --- _parse_field ---
+def test_parse_field_star_covers_range():
+    assert _parse_field("*", "hour", 0, 23) == set(range(24))
+
+
+def test_parse_field_list_and_range():
+    assert _parse_field("1,5-7", "minute", 0, 59) == {1, 5, 6, 7}
+
+
+def test_parse_field_steps():
+    assert _parse_field("*/15", "minute", 0, 59) == {0, 15, 30, 45}
+    assert _parse_field("10-20/5", "minute", 0, 59) == {10, 15, 20}
+    assert _parse_field("5/20", "minute", 0, 59) == {5, 25, 45}
+
+
+@pytest.mark.parametrize("text", ["60", "0-60", "10-5", "*/0", "x"])
+def test_parse_field_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        _parse_field(text, "minute", 0, 59)
+
+
+# --- _day_matches ---
+def test_day_matches_weekday_sunday_is_zero_or_seven():
+    sunday, monday = datetime(2026, 1, 4), datetime(2026, 1, 5)
+    for expr in ("0 0 * * 0", "0 0 * * 7"):
+        schedule = CronSchedule(expr)
+        assert schedule._day_matches(sunday)
+        assert not schedule._day_matches(monday)
+
+
+def test_day_matches_day_and_weekday_restricted_is_or():
+    # le 1er du mois OU un lundi
+    schedule = CronSchedule("0 0 1 * 1")
+    assert schedule._day_matches(datetime(2026, 1, 1))   # jeudi 1er
+    assert schedule._day_matches(datetime(2026, 1, 5))   # lundi
+    assert not schedule._day_matches(datetime(2026, 1, 6))
+
+
+def test_day_matches_only_day_restricted_is_and():
+    schedule = CronSchedule("0 0 15 * *")
+    assert schedule._day_matches(datetime(2026, 1, 15))
+    assert not schedule._day_matches(datetime(2026, 1, 16))
+
+
+# --- next_after ---
+def test_next_after_is_strictly_after():
+    schedule = CronSchedule("0 0,1 * * *")
+    assert schedule.next_after(datetime(2026, 1, 14, 0, 0)) == datetime(2026, 1, 14, 1, 0)
+    assert schedule.next_after(datetime(2026, 1, 14, 0, 0, 30)) == datetime(2026, 1, 14, 1, 0)
+    assert schedule.next_after(datetime(2026, 1, 14, 1, 0)) == datetime(2026, 1, 15, 0, 0)
+
+
+def test_next_after_aliases():
+    after = datetime(2026, 1, 14, 10, 30)
+    assert CronSchedule("@hourly").next_after(after) == datetime(2026, 1, 14, 11, 0)
+    assert CronSchedule("@daily").next_after(after) == datetime(2026, 1, 15, 0, 0)
+    assert CronSchedule("@weekly").next_after(after) == datetime(2026, 1, 18, 0, 0)
+    assert CronSchedule("@monthly").next_after(after) == datetime(2026, 2, 1, 0, 0)
+
+
+def test_next_after_crosses_month_and_year():
+    assert CronSchedule("30 6 31 * *").next_after(datetime(2026, 1, 31, 7, 0)) == datetime(2026, 3, 31, 6, 30)
+    assert CronSchedule("0 0 1 1 *").next_after(datetime(2026, 1, 1, 0, 0)) == datetime(2027, 1, 1, 0, 0)
+
+
+def test_next_after_leap_day():
+    assert CronSchedule("0 12 29 2 *").next_after(datetime(2026, 3, 1)) == datetime(2028, 2, 29, 12, 0)
+
+
+def test_next_after_never_matches():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(datetime(2026, 1, 1))
+
+
+def test_invalid_expression():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 * *")
+
+
+def test_due_slots_merges_schedules():
+    schedules = sched.parse_schedules("0 0 * * *;0 0,12 * * *")
+    slots = sched.due_slots(schedules, datetime(2026, 1, 14, 6, 0), datetime(2026, 1, 15, 0, 0))
+    assert slots == [datetime(2026, 1, 14, 12, 0), datetime(2026, 1, 15, 0, 0)]
+
+
+# --- reprise des dates en échec ---
+def test_failed_dates_are_retried_with_next_batch(monkeypatch):
+    runs = []
+    monkeypatch.setattr(sched, "save_state", lambda state: None)
+    monkeypatch.setattr(sched.backfill, "backfill", lambda dates, **kw: runs.append(dates) or [
+        (d, d != "2026-01-14", 0.0, None if d != "2026-01-14" else "boom") for d in dates])
+
+    state = {}
+    sched.run_slots([datetime(2026, 1, 14, 0, 0)], state)
+    assert state["last_slot"] == "2026-01-14T00:00:00"
+    retry = sched.failed_dates(state, datetime(2026, 1, 10))
+    assert retry == ["2026-01-14"]
+    assert sched.failed_dates(state, datetime(2026, 1, 15)) == []
+
+    sched.run_slots([datetime(2026, 1, 15, 0, 0)], state, retry)
+    assert runs[-1] == ["2026-01-14", "2026-01-15"]
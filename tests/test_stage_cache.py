@@ -0,0 +1,63 @@
+import json
+
+from dag import Task
+from stage_cache import StageCache
+
+# generation -> aggregation -> net_demand -> supplier_orders, procurement_rules à part
+TASKS = [
+    Task("generation", None),
+    Task("aggregation", None, deps=["generation"]),
+    Task("procurement_rules", None),
+    Task("net_demand", None, deps=["aggregation"]),
+    Task("rules_report", None, deps=["procurement_rules"]),
+    Task("supplier_orders", None, deps=["net_demand", "procurement_rules"]),
+]
+ORDER = ["generation", "aggregation", "rules_report", "net_demand", "supplier_orders"]
+
+
+def run_all(cache, order=ORDER):
+    ran = []
+    for stage in order:
+        cache.run(stage, inputs=lambda: {"x": 1}, outputs=lambda: True, fn=lambda stage=stage: ran.append(stage))
+    return ran
+
+
+def fail_manifest(tmp_path, stage):
+    path = tmp_path / "logs/manifests/2026-01-14" / f"{stage}.json"
+    manifest = json.loads(path.read_text())
+    manifest["status"] = "failed"
+    path.write_text(json.dumps(manifest))
+
+
+def test_resume_reruns_only_downstream_stages(tmp_path):
+    assert run_all(StageCache("2026-01-14", str(tmp_path), "cache")) == ORDER
+    fail_manifest(tmp_path, "aggregation")
+
+    cache = StageCache("2026-01-14", str(tmp_path), "resume")
+    cache.set_dag(TASKS)
+    assert run_all(cache) == ["aggregation", "net_demand", "supplier_orders"]
+
+
+def test_resume_independent_branch_keeps_cache(tmp_path):
+    run_all(StageCache("2026-01-14", str(tmp_path), "cache"))
+    fail_manifest(tmp_path, "rules_report")
+
+    cache = StageCache("2026-01-14", str(tmp_path), "resume")
+    cache.set_dag(TASKS)
+    assert run_all(cache) == ["rules_report"]
+
+
+def test_resume_without_dag_reruns_every_later_stage(tmp_path):
+    run_all(StageCache("2026-01-14", str(tmp_path), "cache"))
+    fail_manifest(tmp_path, "rules_report")
+
+    assert run_all(StageCache("2026-01-14", str(tmp_path), "resume")) == ORDER[2:]
+
+
+def test_cache_mode_ignores_upstream_reruns(tmp_path):
+    run_all(StageCache("2026-01-14", str(tmp_path), "cache"))
+    fail_manifest(tmp_path, "generation")
+
+    cache = StageCache("2026-01-14", str(tmp_path), "cache")
+    cache.set_dag(TASKS)
+    assert run_all(cache) == ["generation"]
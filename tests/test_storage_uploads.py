@@ -0,0 +1,101 @@
+import hashlib
+
+import pytest
+import requests
+
+from hdfs_client import WebHDFSClient
+from storage import LocalStorage
+from webhdfs_standin import start_standin
+
+
+@pytest.fixture
+def standin(tmp_path):
+    server, base_url = start_standin(str(tmp_path / "hdfs"))
+    yield base_url
+    server.shutdown()
+
+
+@pytest.fixture(params=["webhdfs", "local"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        yield LocalStorage(str(tmp_path / "local"))
+        return
+    server, base_url = start_standin(str(tmp_path / "hdfs"))
+    client = WebHDFSClient(base_url, retries=2, backoff=0.01)
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def counting_stream(data, calls):
+    def chunks():
+        calls.append(1)
+        return iter([data[:4], data[4:]])
+    return chunks
+
+
+# --- put_stream(skip_identical=True) : le flux n'est encodé qu'une fois par upload ---
+def test_put_stream_new_file_is_hashed_while_sent(storage):
+    calls = []
+    assert storage.put_stream(counting_stream(b"hello world", calls), "/a/x.bin", overwrite=True, skip_identical=True)
+    assert len(calls) == 1
+    assert storage.digest("/a/x.bin") == hashlib.sha256(b"hello world").hexdigest()
+
+
+def test_put_stream_identical_is_skipped(storage):
+    storage.put_stream(counting_stream(b"hello world", []), "/a/x.bin", overwrite=True, skip_identical=True)
+    calls = []
+    assert not storage.put_stream(counting_stream(b"hello world", calls), "/a/x.bin", overwrite=True,
+                                  skip_identical=True)
+    assert len(calls) == 1
+    assert storage.put_stream(counting_stream(b"hello there", []), "/a/x.bin", overwrite=True, skip_identical=True)
+    assert storage.read_bytes("/a/x.bin") == b"hello there"
+
+
+def test_put_stream_changed_without_overwrite_fails(storage):
+    storage.put_stream(counting_stream(b"hello world", []), "/a/x.bin", overwrite=True, skip_identical=True)
+    with pytest.raises(FileExistsError):
+        storage.put_stream(counting_stream(b"other", []), "/a/x.bin", overwrite=False, skip_identical=True)
+    assert storage.read_bytes("/a/x.bin") == b"hello world"
+
+
+# --- CREATE overwrite=false relancé après un échec ---
+def failing_first(client, fail):
+    request = client._request
+    state = {"failed": False}
+
+    def _request(method, url, **kwargs):
+        if not state["failed"] and fail(method, url, kwargs):
+            state["failed"] = True
+            if kwargs.get("data") is not None:
+                request(method, url, **kwargs)  # le corps arrive, la réponse est perdue
+            raise requests.ConnectionError("connection reset")
+        return request(method, url, **kwargs)
+    client._request = _request
+    return state
+
+
+def test_create_retry_accepts_its_own_file(standin, tmp_path):
+    client = WebHDFSClient(standin, retries=2, backoff=0.01)
+    local = tmp_path / "l.txt"
+    local.write_bytes(b"payload")
+    state = failing_first(client, lambda method, url, kw: method == "PUT" and kw.get("data") is not None)
+    client.put_file(str(local), "/b/l.txt", overwrite=False)
+    assert state["failed"]
+    assert client.read_bytes("/b/l.txt") == b"payload"
+
+
+def test_create_retry_rejects_another_file(standin):
+    client = WebHDFSClient(standin, retries=2, backoff=0.01)
+    client.put_stream(lambda: iter([b"someone else"]), "/b/m.txt", overwrite=True)
+    failing_first(client, lambda method, url, kw: method == "PUT" and "op=CREATE" in url)
+    with pytest.raises(FileExistsError):
+        client.put_stream(lambda: iter([b"mine"]), "/b/m.txt", overwrite=False)
+    assert client.read_bytes("/b/m.txt") == b"someone else"
+
+
+def test_create_existing_file_fails_first_time(standin):
+    client = WebHDFSClient(standin, retries=2, backoff=0.01)
+    client.put_stream(lambda: iter([b"data"]), "/b/n.txt", overwrite=True)
+    with pytest.raises(FileExistsError):
+        client.put_stream(lambda: iter([b"data"]), "/b/n.txt", overwrite=False)